@@ -0,0 +1,167 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Admission control of the requests to each model.
+
+At most `max_concurrency` requests per model are served at once; the next
+ones wait in a queue of at most `max_queue` requests, for at most
+`queue_timeout` seconds. Requests beyond are shed right away, so that
+callers get a fast error they can retry elsewhere rather than a slow one
+once the model server times out.
+
+Gates are kept for every model name they were acquired for, so requests to
+models which may not exist share the gate of `UNKNOWN_MODELS`.
+"""
+
+from collections import deque
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+import metrics
+
+
+QUEUE_FULL = 'queue_full'
+QUEUE_TIMEOUT = 'queue_timeout'
+CANCELLED = 'cancelled'
+
+# The gate shared by the requests to models not known to exist.
+UNKNOWN_MODELS = '(unknown)'
+
+
+class Overloaded(Exception):
+  """Raised when a request is shed, with the reason as its message."""
+
+
+def parse_limits(value):
+  """Parses per model limits written as `model:concurrency:queue,...`.
+
+  Returns:
+    A dict from model name to a (max concurrency, max queue) pair.
+
+  Raises:
+    ValueError: when a limit is not valid.
+  """
+  limits = {}
+  for limit in value.split(','):
+    if not limit.strip():
+      continue
+    try:
+      model, concurrency, queue = limit.strip().rsplit(':', 2)
+      limits[model] = (int(concurrency), int(queue))
+    except ValueError:
+      raise ValueError('Invalid admission limit %s, expected model:concurrency:queue.' % limit)
+  return limits
+
+
+class _Gate(object):
+
+  def __init__(self, max_concurrency, max_queue):
+    self.max_concurrency = max_concurrency
+    self.max_queue = max_queue
+    self.active = 0
+    self.waiters = deque()
+    self.shed = 0
+
+
+class AdmissionController(object):
+  """Limits the requests served at once to each model.
+
+  Args:
+    max_concurrency: Requests served at once per model, 0 for no limit.
+    max_queue: Requests waiting per model beyond which requests are shed.
+    queue_timeout: Seconds after which a waiting request is shed, 0 to wait
+                   until it is admitted.
+    limits: A dict from model name to a (max concurrency, max queue) pair
+            overriding the defaults.
+    ioloop: The IOLoop running the request handlers.
+
+    Usage::
+
+      admission = AdmissionController(max_concurrency=8, max_queue=16)
+
+      @coroutine
+      def my_fn(model_name):
+        yield admission.acquire(model_name)
+        try:
+          ...
+        finally:
+          admission.release(model_name)
+  """
+
+  def __init__(self, max_concurrency=0, max_queue=0, queue_timeout=0.0, limits=None,
+               ioloop=None):
+    self.max_concurrency = max_concurrency
+    self.max_queue = max_queue
+    self.queue_timeout = queue_timeout
+    self.limits = limits or {}
+    self.ioloop = ioloop
+    self._gates = {}
+
+  def stats(self):
+    return dict((model, dict(active=gate.active, queued=len(gate.waiters), shed=gate.shed))
+                for model, gate in self._gates.items())
+
+  def _gate(self, model_name):
+    gate = self._gates.get(model_name)
+    if gate is None:
+      max_concurrency, max_queue = self.limits.get(
+          model_name, (self.max_concurrency, self.max_queue))
+      gate = self._gates[model_name] = _Gate(max_concurrency, max_queue)
+    return gate
+
+  def acquire(self, model_name):
+    """Waits for a request to a model to be admitted.
+
+    Returns:
+      A future resolving once the request is admitted, which then has to be
+      released, or failing with Overloaded when the request is shed.
+    """
+    gate = self._gate(model_name)
+    future = gen.Future()
+    if not gate.max_concurrency or (gate.active < gate.max_concurrency and not gate.waiters):
+      gate.active += 1
+      future.set_result(None)
+    elif len(gate.waiters) >= gate.max_queue:
+      self._shed(model_name, gate, future, QUEUE_FULL)
+    else:
+      gate.waiters.append(future)
+      metrics.ADMISSION_QUEUED.labels(model_name).inc()
+      if self.queue_timeout > 0:
+        (self.ioloop or IOLoop.current()).call_later(
+            self.queue_timeout, self.cancel, model_name, future, QUEUE_TIMEOUT)
+    return future
+
+  def release(self, model_name):
+    """Ends an admitted request, admitting the next waiting one if any."""
+    gate = self._gates[model_name]
+    gate.active -= 1
+    if gate.waiters:
+      metrics.ADMISSION_QUEUED.labels(model_name).dec()
+      gate.active += 1
+      gate.waiters.popleft().set_result(None)
+
+  def cancel(self, model_name, future, reason=CANCELLED):
+    """Sheds a waiting request, e.g. once its client is gone."""
+    gate = self._gates[model_name]
+    if future.done():
+      return
+    gate.waiters.remove(future)
+    metrics.ADMISSION_QUEUED.labels(model_name).dec()
+    self._shed(model_name, gate, future, reason)
+
+  def _shed(self, model_name, gate, future, reason):
+    gate.shed += 1
+    metrics.ADMISSION_SHED.labels(model_name, reason).inc()
+    future.set_exception(Overloaded(reason))
@@ -0,0 +1,89 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from tornado import gen
+
+from admission import (AdmissionController, Overloaded, parse_limits, CANCELLED, QUEUE_FULL,
+                       QUEUE_TIMEOUT)
+
+
+def test_no_limit():
+    admission = AdmissionController()
+    futures = [admission.acquire('m') for _ in range(100)]
+    assert all(f.done() and f.exception() is None for f in futures)
+    assert admission.stats() == {'m': {'active': 100, 'queued': 0, 'shed': 0}}
+
+def test_waiting_requests_are_admitted_in_order():
+    admission = AdmissionController(max_concurrency=1, max_queue=2)
+    first, second, third = [admission.acquire('m') for _ in range(3)]
+    assert first.done() and not second.done() and not third.done()
+    admission.release('m')
+    assert second.done() and not third.done()
+    admission.release('m')
+    assert third.done()
+    assert admission.stats() == {'m': {'active': 1, 'queued': 0, 'shed': 0}}
+
+def test_queue_full():
+    admission = AdmissionController(max_concurrency=1, max_queue=1)
+    admission.acquire('m')
+    admission.acquire('m')
+    shed = admission.acquire('m')
+    with pytest.raises(Overloaded) as e:
+        shed.result()
+    assert str(e.value) == QUEUE_FULL
+    assert admission.stats() == {'m': {'active': 1, 'queued': 1, 'shed': 1}}
+
+def test_models_are_limited_separately():
+    admission = AdmissionController(max_concurrency=1, max_queue=0, limits={'b': (2, 0)})
+    assert admission.acquire('a').exception() is None
+    assert admission.acquire('b').exception() is None
+    assert admission.acquire('b').exception() is None
+    assert isinstance(admission.acquire('a').exception(), Overloaded)
+    assert isinstance(admission.acquire('b').exception(), Overloaded)
+
+@pytest.mark.gen_test
+def test_queue_timeout():
+    admission = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=0.01)
+    admission.acquire('m')
+    with pytest.raises(Overloaded) as e:
+        yield admission.acquire('m')
+    assert str(e.value) == QUEUE_TIMEOUT
+    admission.release('m')
+    assert admission.stats() == {'m': {'active': 0, 'queued': 0, 'shed': 1}}
+
+@pytest.mark.gen_test
+def test_admitted_before_timeout():
+    admission = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=0.01)
+    admission.acquire('m')
+    waiting = admission.acquire('m')
+    admission.release('m')
+    yield waiting
+    yield gen.sleep(0.02)
+    assert admission.stats() == {'m': {'active': 1, 'queued': 0, 'shed': 0}}
+
+def test_cancel():
+    admission = AdmissionController(max_concurrency=1, max_queue=1)
+    admission.acquire('m')
+    waiting = admission.acquire('m')
+    admission.cancel('m', waiting)
+    assert str(waiting.exception()) == CANCELLED
+    admission.release('m')
+    assert admission.stats() == {'m': {'active': 0, 'queued': 0, 'shed': 1}}
+
+def test_parse_limits():
+    assert parse_limits('') == {}
+    assert parse_limits('a:1:2, b:3:0') == {'a': (1, 2), 'b': (3, 0)}
+    with pytest.raises(ValueError):
+        parse_limits('a:1')
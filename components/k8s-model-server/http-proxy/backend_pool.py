@@ -0,0 +1,202 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pool of model server backends, each reached through several channels.
+
+Every call goes to the healthy backend with the fewest outstanding requests,
+and within it to the least loaded channel. Backends failing repeatedly with
+UNAVAILABLE are ejected from the pool for a while.
+
+The pool has the same interface as a PredictionService stub, so it can be
+used wherever a stub is expected::
+
+  pool = BackendPool(create_stub, ['tf-serving-0:9000', 'tf-serving-1:9000'])
+  result = yield fwrap(pool.Predict.future(request, timeout))
+"""
+
+import logging
+import random
+import socket
+import time
+
+import grpc
+from tornado import gen
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.netutil import ThreadedResolver
+
+from tornado_grpc import rpc_status_code
+
+
+# Status codes which mean that the backend itself is not reachable.
+UNHEALTHY_CODES = frozenset([grpc.StatusCode.UNAVAILABLE])
+
+
+def parse_address(address, default_port=9000):
+  """Splits a `host:port` address into its host and its port."""
+  host, _, port = address.strip().rpartition(':')
+  if not host:
+    return port, default_port
+  return host, int(port)
+
+
+class Backend(object):
+  """One model server, reached through several channels."""
+
+  def __init__(self, address, stubs):
+    self.address = address
+    self.stubs = stubs
+    self.outstanding = [0] * len(stubs)
+    self.failures = 0
+    self.ejected_until = 0
+
+  @property
+  def total_outstanding(self):
+    return sum(self.outstanding)
+
+  def pick_channel(self):
+    """Returns the index of the channel with the fewest outstanding calls."""
+    return min(range(len(self.stubs)), key=self.outstanding.__getitem__)
+
+
+class _PoolMethod(object):
+
+  def __init__(self, pool, name):
+    self._pool = pool
+    self._name = name
+
+  def future(self, request, timeout, *args, **kwargs):
+    return self._pool.call(self._name, request, timeout, *args, **kwargs)
+
+
+class BackendPool(object):
+  """Balances calls over model server backends by least outstanding requests.
+
+  Args:
+    stub_factory: Function creating a PredictionService stub from a host, a
+                  port and a channel index.
+    addresses: The `host:port` addresses of the backends.
+    channels_per_backend: Number of channels, and so of HTTP/2 connections,
+                          opened to each backend.
+    max_failures: Number of consecutive UNAVAILABLE errors after which a
+                  backend is ejected.
+    ejection_sec: Seconds for which an ejected backend is not used.
+    clock: Function returning the current time in seconds.
+  """
+
+  def __init__(self, stub_factory, addresses=(), channels_per_backend=2,
+               max_failures=3, ejection_sec=10.0, clock=time.time):
+    self.stub_factory = stub_factory
+    self.channels_per_backend = channels_per_backend
+    self.max_failures = max_failures
+    self.ejection_sec = ejection_sec
+    self._clock = clock
+    self.backends = []
+    self.set_backends(addresses)
+
+    self.Predict = _PoolMethod(self, 'Predict')
+    self.Classify = _PoolMethod(self, 'Classify')
+    self.GetModelMetadata = _PoolMethod(self, 'GetModelMetadata')
+
+  def set_backends(self, addresses):
+    """Sets the backends of the pool, keeping the channels of known ones."""
+    known = dict((b.address, b) for b in self.backends)
+    backends = []
+    for address in addresses:
+      backend = known.get(address)
+      if backend is None:
+        host, port = parse_address(address)
+        logging.info("Adding model server backend %s", address)
+        backend = Backend(address, [self.stub_factory(host, port, i)
+                                    for i in range(self.channels_per_backend)])
+      backends.append(backend)
+    for address in set(known) - set(b.address for b in backends):
+      logging.info("Removing model server backend %s", address)
+    self.backends = backends
+
+  def pick(self, exclude=()):
+    """Chooses the backend for the next call.
+
+    Args:
+      exclude: Backends which should not be chosen, if there is any other.
+
+    Returns:
+      The healthy backend with the fewest outstanding calls. When every
+      backend is ejected, the least loaded of all of them is returned.
+    """
+    now = self._clock()
+    candidates = [b for b in self.backends if b not in exclude] or self.backends
+    if not candidates:
+      raise RuntimeError("No model server backend configured.")
+    healthy = [b for b in candidates if b.ejected_until <= now] or candidates
+    least = min(b.total_outstanding for b in healthy)
+    return random.choice([b for b in healthy if b.total_outstanding == least])
+
+  def call(self, method, request, timeout, *args, **kwargs):
+    """Starts a call on the least loaded backend.
+
+    Args:
+      method: The name of the PredictionService method.
+      request: The request message.
+      timeout: Seconds for the call to time out.
+      backend: Optional keyword argument, the backend to use.
+
+    Returns:
+      The grpc future of the call.
+    """
+    backend = kwargs.pop('backend', None) or self.pick()
+    index = backend.pick_channel()
+    future = getattr(backend.stubs[index], method).future(request, timeout, *args, **kwargs)
+    backend.outstanding[index] += 1
+    ioloop = IOLoop.current()
+    future.add_done_callback(
+        lambda f: ioloop.add_callback(self._release, backend, index, f))
+    return future
+
+  def _release(self, backend, index, future):
+    backend.outstanding[index] -= 1
+    try:
+      error = future.exception()
+    except Exception as e:
+      error = e
+    if error is not None and rpc_status_code(error) in UNHEALTHY_CODES:
+      backend.failures += 1
+      if backend.failures >= self.max_failures:
+        logging.warn("Ejecting model server backend %s for %.1fs after %d failures",
+                     backend.address, self.ejection_sec, backend.failures)
+        backend.ejected_until = self._clock() + self.ejection_sec
+        backend.failures = 0
+    elif error is None:
+      backend.failures = 0
+
+  @gen.coroutine
+  def resolve(self, host, port, resolver=None):
+    """Sets the backends of the pool to every address `host` resolves to."""
+    resolver = resolver or ThreadedResolver()
+    try:
+      addrinfo = yield resolver.resolve(host, port, socket.AF_INET)
+    except Exception as e:
+      logging.warn("Could not resolve model servers at %s: %s", host, e)
+      return
+    addresses = sorted(set('%s:%d' % sockaddr[:2] for _, sockaddr in addrinfo))
+    if addresses:
+      self.set_backends(addresses)
+
+  def start_resolving(self, host, port, interval_sec):
+    """Periodically resolves `host` to discover the model servers behind it.
+
+    This is meant for a kubernetes headless service, which resolves to the
+    addresses of all of its pods.
+    """
+    self.resolve(host, port)
+    PeriodicCallback(lambda: self.resolve(host, port), interval_sec * 1000).start()
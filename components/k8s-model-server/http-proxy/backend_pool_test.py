@@ -0,0 +1,100 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import Future
+
+import grpc
+import pytest
+from tornado import gen
+
+from backend_pool import BackendPool, parse_address
+from tornado_grpc import fwrap
+
+
+class Unavailable(grpc.RpcError):
+
+    def code(self):
+        return grpc.StatusCode.UNAVAILABLE
+
+
+class PendingStub(object):
+    """Fake stub whose calls stay pending until completed by the test."""
+
+    def __init__(self, host, port, index):
+        self.address = '%s:%d' % (host, port)
+        self.calls = []
+        self.Predict = self
+
+    def future(self, request, timeout):
+        f = Future()
+        self.calls.append(f)
+        return f
+
+
+def backend_calls(pool):
+    return dict((b.address, sum(len(s.calls) for s in b.stubs)) for b in pool.backends)
+
+
+def test_parse_address():
+    assert parse_address('tf-serving:9001') == ('tf-serving', 9001)
+    assert parse_address('tf-serving') == ('tf-serving', 9000)
+
+
+def test_channels_per_backend():
+    pool = BackendPool(PendingStub, ['a:1', 'b:2'], channels_per_backend=3)
+    assert [len(b.stubs) for b in pool.backends] == [3, 3]
+
+
+@pytest.mark.gen_test
+def test_least_outstanding_backend_is_chosen():
+    pool = BackendPool(PendingStub, ['a:1', 'b:2'], channels_per_backend=2)
+    for _ in range(4):
+        pool.Predict.future(None, 1.0)
+    assert backend_calls(pool) == {'a:1': 2, 'b:2': 2}
+    assert [b.outstanding for b in pool.backends] == [[1, 1], [1, 1]]
+
+    # Completing the calls of one backend makes it the preferred one.
+    for stub in pool.backends[0].stubs:
+        for f in stub.calls:
+            f.set_result(None)
+    yield gen.moment
+    pool.Predict.future(None, 1.0)
+    pool.Predict.future(None, 1.0)
+    assert backend_calls(pool) == {'a:1': 4, 'b:2': 2}
+
+
+@pytest.mark.gen_test
+def test_failing_backend_is_ejected():
+    clock = [0]
+    pool = BackendPool(PendingStub, ['a:1', 'b:2'], channels_per_backend=1,
+                       max_failures=2, ejection_sec=10, clock=lambda: clock[0])
+    bad = pool.backends[0]
+    for _ in range(2):
+        future = pool.call('Predict', None, 1.0, backend=bad)
+        future.set_exception(Unavailable())
+        with pytest.raises(Unavailable):
+            yield fwrap(future)
+    yield gen.moment
+    assert bad.ejected_until == 10
+    assert all(pool.pick() is pool.backends[1] for _ in range(10))
+    clock[0] = 11
+    assert bad in set(pool.pick() for _ in range(50))
+
+
+def test_set_backends_keeps_known_backends():
+    pool = BackendPool(PendingStub, ['a:1', 'b:2'])
+    a = pool.backends[0]
+    pool.set_backends(['a:1', 'c:3'])
+    assert [b.address for b in pool.backends] == ['a:1', 'c:3']
+    assert pool.backends[0] is a
@@ -0,0 +1,241 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Server side micro-batching of Predict calls.
+
+Concurrent PredictRequests that target the same model, version and signature
+and whose inputs only differ in their outer (batch) dimension are merged into
+a single PredictRequest. The outputs of the merged call are split back by rows
+so that every caller gets the response it would have received on its own.
+"""
+
+import logging
+
+from tensorflow_serving.apis import predict_pb2
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tensorflow.core.framework import tensor_pb2
+import numpy as np
+
+import metrics
+from tensor_codec import ndarray_to_tensor_proto, tensor_proto_to_ndarray
+from tornado_grpc import fwrap
+
+
+def batch_size(request):
+  """Returns the number of rows of a PredictRequest, or None if not batchable.
+
+  A request is batchable when every input has a rank of at least one and all
+  inputs agree on the size of their first dimension.
+  """
+  sizes = set()
+  for tensor in request.inputs.values():
+    if not tensor.tensor_shape.dim:
+      return None
+    sizes.add(tensor.tensor_shape.dim[0].size)
+  if len(sizes) != 1:
+    return None
+  size = sizes.pop()
+  return size if size > 0 else None
+
+
+def batch_key(request):
+  """Returns the key under which requests can be merged together."""
+  inputs = tuple(sorted(
+      (name, tensor.dtype, tuple(d.size for d in tensor.tensor_shape.dim[1:]))
+      for name, tensor in request.inputs.items()))
+  return (request.model_spec.SerializeToString(), inputs,
+          tuple(request.output_filter))
+
+
+def concat_tensors(tensors):
+  """Concatenates TensorProtos along their first dimension."""
+  first = tensors[0]
+  if len(tensors) == 1:
+    return first
+  if all(t.tensor_content for t in tensors):
+    merged = tensor_pb2.TensorProto(dtype=first.dtype)
+    merged.tensor_shape.CopyFrom(first.tensor_shape)
+    merged.tensor_shape.dim[0].size = sum(t.tensor_shape.dim[0].size for t in tensors)
+    merged.tensor_content = b''.join(t.tensor_content for t in tensors)
+    return merged
+  return ndarray_to_tensor_proto(
+      np.concatenate([tensor_proto_to_ndarray(t) for t in tensors]), first.dtype)
+
+
+def split_tensor(tensor, sizes):
+  """Splits a TensorProto along its first dimension into chunks of `sizes` rows.
+
+  Tensors whose first dimension does not match the total number of rows (for
+  example scalars, or outputs that are not batched) are given as is to every
+  chunk.
+  """
+  total = sum(sizes)
+  dims = tensor.tensor_shape.dim
+  if not dims or dims[0].size != total:
+    return [tensor] * len(sizes)
+
+  if tensor.tensor_content:
+    row_bytes = len(tensor.tensor_content) // total
+    chunks = []
+    offset = 0
+    for size in sizes:
+      chunk = tensor_pb2.TensorProto(dtype=tensor.dtype)
+      chunk.tensor_shape.CopyFrom(tensor.tensor_shape)
+      chunk.tensor_shape.dim[0].size = size
+      chunk.tensor_content = tensor.tensor_content[offset * row_bytes:(offset + size) * row_bytes]
+      chunks.append(chunk)
+      offset += size
+    return chunks
+
+  array = tensor_proto_to_ndarray(tensor)
+  offsets = np.cumsum(sizes)[:-1]
+  return [ndarray_to_tensor_proto(part, tensor.dtype) for part in np.split(array, offsets)]
+
+
+def merge_requests(requests):
+  """Merges batchable PredictRequests sharing the same batch key into one."""
+  merged = predict_pb2.PredictRequest()
+  merged.model_spec.CopyFrom(requests[0].model_spec)
+  merged.output_filter.extend(requests[0].output_filter)
+  for name in requests[0].inputs:
+    merged.inputs[name].CopyFrom(concat_tensors([r.inputs[name] for r in requests]))
+  return merged
+
+
+def split_response(response, sizes):
+  """Splits a PredictResponse of a merged request back into one per caller."""
+  responses = [predict_pb2.PredictResponse() for _ in sizes]
+  for r in responses:
+    r.model_spec.CopyFrom(response.model_spec)
+  for name, tensor in response.outputs.items():
+    for r, chunk in zip(responses, split_tensor(tensor, sizes)):
+      r.outputs[name].CopyFrom(chunk)
+  return responses
+
+
+class _Batch(object):
+
+  def __init__(self, key):
+    self.key = key
+    self.requests = []
+    self.sizes = []
+    self.futures = []
+    self.timeout = None
+    # IOLoop time by which the earliest request of the batch has to be answered.
+    self.deadline = None
+
+  @property
+  def size(self):
+    return sum(self.sizes)
+
+
+class PredictBatcher(object):
+  """Coalesces concurrent Predict calls into batched calls to the model server.
+
+  A batch is sent as soon as it holds `max_batch_size` rows, or `max_wait_ms`
+  after its first request arrived, whichever comes first. Requests which are
+  not batchable, or which are already at least `max_batch_size` rows, are
+  forwarded immediately.
+
+    Usage::
+
+      batcher = PredictBatcher(stub, max_batch_size=64, max_wait_ms=2)
+
+      @coroutine
+      def my_fn(request):
+        response = yield batcher.predict(request)
+  """
+
+  def __init__(self, stub, max_batch_size=32, max_wait_ms=5.0, rpc_timeout=1.0,
+               ioloop=None):
+    self.stub = stub
+    self.max_batch_size = max_batch_size
+    self.max_wait_ms = max_wait_ms
+    self.rpc_timeout = rpc_timeout
+    self.ioloop = ioloop
+    self._pending = {}
+
+  def predict(self, request, timeout=None):
+    """Sends `request`, possibly as part of a larger batch.
+
+    Args:
+      request: The PredictRequest to send.
+      timeout: Seconds for the call to time out, defaults to rpc_timeout. A
+               batch is sent with the timeout of its earliest deadline.
+
+    Returns:
+      A future resolving to the PredictResponse for `request` alone.
+    """
+    ioloop = self.ioloop or IOLoop.current()
+    if timeout is None:
+      timeout = self.rpc_timeout
+    size = batch_size(request)
+    if size is None or size >= self.max_batch_size:
+      if size is not None:
+        metrics.BATCH_INSTANCES.labels(request.model_spec.name).observe(size)
+      return fwrap(self.stub.Predict.future(request, timeout), ioloop)
+
+    key = batch_key(request)
+    batch = self._pending.get(key)
+    if batch is not None and batch.size + size > self.max_batch_size:
+      self._flush(batch)
+      batch = None
+    if batch is None:
+      batch = self._pending[key] = _Batch(key)
+      batch.timeout = ioloop.call_later(self.max_wait_ms / 1000.0, self._flush, batch)
+
+    future = gen.Future()
+    deadline = ioloop.time() + timeout
+    if batch.deadline is None or deadline < batch.deadline:
+      batch.deadline = deadline
+    batch.requests.append(request)
+    batch.sizes.append(size)
+    batch.futures.append(future)
+    if batch.size >= self.max_batch_size:
+      self._flush(batch)
+    return future
+
+  def _flush(self, batch):
+    if self._pending.get(batch.key) is batch:
+      del self._pending[batch.key]
+    if batch.timeout is not None:
+      (self.ioloop or IOLoop.current()).remove_timeout(batch.timeout)
+      batch.timeout = None
+    self._send(batch)
+
+  @gen.coroutine
+  def _send(self, batch):
+    metrics.BATCH_INSTANCES.labels(batch.requests[0].model_spec.name).observe(batch.size)
+    try:
+      if len(batch.requests) == 1:
+        request = batch.requests[0]
+      else:
+        request = merge_requests(batch.requests)
+      timeout = batch.deadline - (self.ioloop or IOLoop.current()).time()
+      response = yield fwrap(self.stub.Predict.future(request, max(timeout, 0.0)),
+                             self.ioloop)
+      if len(batch.requests) == 1:
+        responses = [response]
+      else:
+        responses = split_response(response, batch.sizes)
+    except Exception as e:
+      if len(batch.requests) > 1:
+        logging.warn("Batched predict call of %d requests failed: %s",
+                     len(batch.requests), e)
+      for future in batch.futures:
+        future.set_exception(e)
+      return
+    for future, r in zip(batch.futures, responses):
+      future.set_result(r)
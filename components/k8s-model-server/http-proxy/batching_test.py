@@ -0,0 +1,113 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+import tensorflow as tf
+from tensorflow_serving.apis import predict_pb2
+
+from batching import PredictBatcher, batch_size, merge_requests, split_response
+
+
+class DoublingStub(object):
+    """Fake PredictionService stub answering y = 2 * x for every request."""
+
+    def __init__(self):
+        self.requests = []
+        self.timeouts = []
+        self.Predict = self
+
+    def future(self, request, timeout):
+        self.requests.append(request)
+        self.timeouts.append(timeout)
+        response = predict_pb2.PredictResponse()
+        x = tf.make_ndarray(request.inputs['x'])
+        response.outputs['y'].CopyFrom(tf.make_tensor_proto(x * 2))
+        f = Future()
+        f.set_result(response)
+        return f
+
+
+def make_request(rows, model='m'):
+    request = predict_pb2.PredictRequest()
+    request.model_spec.name = model
+    request.inputs['x'].CopyFrom(tf.make_tensor_proto(np.asarray(rows, dtype=np.float32)))
+    return request
+
+
+def test_batch_size():
+    assert batch_size(make_request([[1, 2], [3, 4]])) == 2
+    assert batch_size(make_request(1)) is None
+
+
+def test_merge_and_split_roundtrip():
+    requests = [make_request([[1, 2]]), make_request([[3, 4], [5, 6]])]
+    merged = merge_requests(requests)
+    np.testing.assert_array_equal(tf.make_ndarray(merged.inputs['x']),
+                                  [[1, 2], [3, 4], [5, 6]])
+
+    response = predict_pb2.PredictResponse()
+    response.outputs['y'].CopyFrom(merged.inputs['x'])
+    first, second = split_response(response, [1, 2])
+    np.testing.assert_array_equal(tf.make_ndarray(first.outputs['y']), [[1, 2]])
+    np.testing.assert_array_equal(tf.make_ndarray(second.outputs['y']), [[3, 4], [5, 6]])
+
+
+def test_split_string_tensor():
+    response = predict_pb2.PredictResponse()
+    response.outputs['label'].CopyFrom(tf.make_tensor_proto(['a', 'b', 'c']))
+    first, second = split_response(response, [2, 1])
+    assert list(tf.make_ndarray(first.outputs['label'])) == ['a', 'b']
+    assert list(tf.make_ndarray(second.outputs['label'])) == ['c']
+
+
+@pytest.mark.gen_test
+def test_concurrent_requests_share_one_rpc():
+    stub = DoublingStub()
+    batcher = PredictBatcher(stub, max_batch_size=8, max_wait_ms=1)
+    first, second = yield [batcher.predict(make_request([[1, 2]])),
+                           batcher.predict(make_request([[3, 4], [5, 6]]))]
+    assert len(stub.requests) == 1
+    np.testing.assert_array_equal(tf.make_ndarray(first.outputs['y']), [[2, 4]])
+    np.testing.assert_array_equal(tf.make_ndarray(second.outputs['y']), [[6, 8], [10, 12]])
+
+
+@pytest.mark.gen_test
+def test_full_batch_is_sent_without_waiting():
+    stub = DoublingStub()
+    batcher = PredictBatcher(stub, max_batch_size=2, max_wait_ms=60 * 1000)
+    yield [batcher.predict(make_request([[1, 2]])), batcher.predict(make_request([[3, 4]]))]
+    assert len(stub.requests) == 1
+
+
+@pytest.mark.gen_test
+def test_different_models_are_not_merged():
+    stub = DoublingStub()
+    batcher = PredictBatcher(stub, max_batch_size=8, max_wait_ms=1)
+    yield [batcher.predict(make_request([[1, 2]], model='a')),
+           batcher.predict(make_request([[3, 4]], model='b'))]
+    assert len(stub.requests) == 2
+
+
+@pytest.mark.gen_test
+def test_batch_is_sent_with_earliest_deadline():
+    stub = DoublingStub()
+    batcher = PredictBatcher(stub, max_batch_size=8, max_wait_ms=1, rpc_timeout=1.0)
+    yield [batcher.predict(make_request([[1, 2]]), timeout=5.0),
+           batcher.predict(make_request([[3, 4]]), timeout=0.5),
+           batcher.predict(make_request([[5, 6]]))]
+    assert len(stub.requests) == 1
+    assert 0.4 < stub.timeouts[0] <= 0.5
@@ -0,0 +1,171 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fake TF serving, answering over gRPC with a fixed latency.
+
+Serves a model of any name whose `serving_default` signature takes a float
+input `x` of shape [-1, input_dim] and returns a float output `y` of shape
+[-1] + output_shape. Responses are built once per batch size, from the
+shape of the request only, so that the fake spends as little CPU as possible
+and the benchmarks measure the proxy.
+
+Usage::
+
+  python benchmark/fake_model_server.py --port 9000 --latency_ms 5
+"""
+
+from __future__ import print_function
+
+import argparse
+from concurrent import futures
+import os
+import sys
+import time
+
+import grpc
+import numpy as np
+from tensorflow.core.framework import types_pb2
+from tensorflow_serving.apis import classification_pb2
+from tensorflow_serving.apis import get_model_metadata_pb2
+from tensorflow_serving.apis import predict_pb2
+from tensorflow_serving.apis import prediction_service_pb2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tensor_codec import ndarray_to_tensor_proto
+
+
+def signature_def_map(input_dim, output_shape):
+  """Returns the SignatureDefMap of the fake model."""
+  signature_map = get_model_metadata_pb2.SignatureDefMap()
+  signature = signature_map.signature_def['serving_default']
+  signature.method_name = 'tensorflow/serving/predict'
+  x = signature.inputs['x']
+  x.name = 'x:0'
+  x.dtype = types_pb2.DT_FLOAT
+  for size in (-1, input_dim):
+    x.tensor_shape.dim.add(size=size)
+  y = signature.outputs['y']
+  y.name = 'y:0'
+  y.dtype = types_pb2.DT_FLOAT
+  for size in [-1] + list(output_shape):
+    y.tensor_shape.dim.add(size=size)
+  return signature_map
+
+
+class FakePredictionService(prediction_service_pb2.PredictionServiceServicer):
+  """PredictionService answering every model after `latency` seconds.
+
+  Args:
+    latency: Seconds each call waits before answering.
+    input_dim: Size of the input of the signature.
+    output_shape: Shape of each row of the output.
+    num_classes: Number of classes of each classification.
+    version: The version of the model reported in responses.
+  """
+
+  def __init__(self, latency=0.0, input_dim=784, output_shape=(10,), num_classes=10, version=1):
+    self.latency = latency
+    self.input_dim = input_dim
+    self.output_shape = tuple(output_shape)
+    self.num_classes = num_classes
+    self.version = version
+    self.calls = 0
+    self._outputs = {}
+    self._classifications = {}
+
+  def _wait(self):
+    self.calls += 1
+    if self.latency > 0:
+      time.sleep(self.latency)
+
+  def _output(self, rows):
+    output = self._outputs.get(rows)
+    if output is None:
+      array = np.random.RandomState(rows).rand(rows, *self.output_shape).astype(np.float32)
+      output = self._outputs[rows] = ndarray_to_tensor_proto(array, types_pb2.DT_FLOAT)
+    return output
+
+  def Predict(self, request, context):
+    self._wait()
+    response = predict_pb2.PredictResponse()
+    response.model_spec.name = request.model_spec.name
+    response.model_spec.version.value = self.version
+    for tensor in request.inputs.values():
+      rows = tensor.tensor_shape.dim[0].size if tensor.tensor_shape.dim else 1
+      break
+    else:
+      rows = 1
+    response.outputs['y'].CopyFrom(self._output(rows))
+    return response
+
+  def Classify(self, request, context):
+    self._wait()
+    rows = len(request.input.example_list.examples)
+    result = self._classifications.get(rows)
+    if result is None:
+      result = classification_pb2.ClassificationResult()
+      scores = np.random.RandomState(rows).rand(rows, self.num_classes)
+      for row in scores:
+        classifications = result.classifications.add()
+        for label, score in enumerate(row):
+          classifications.classes.add(label=str(label), score=score)
+      self._classifications[rows] = result
+    response = classification_pb2.ClassificationResponse()
+    response.result.CopyFrom(result)
+    return response
+
+  def GetModelMetadata(self, request, context):
+    response = get_model_metadata_pb2.GetModelMetadataResponse()
+    response.model_spec.name = request.model_spec.name
+    response.model_spec.version.value = self.version
+    response.metadata['signature_def'].Pack(
+        signature_def_map(self.input_dim, self.output_shape))
+    return response
+
+
+def start_server(port, servicer, max_workers=64):
+  """Serves the servicer on localhost:port, 0 for any free port.
+
+  Returns:
+    The grpc server and its port.
+  """
+  server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers))
+  prediction_service_pb2.add_PredictionServiceServicer_to_server(servicer, server)
+  port = server.add_insecure_port('127.0.0.1:%d' % port)
+  server.start()
+  return server, port
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--port', type=int, default=9000)
+  parser.add_argument('--latency_ms', type=float, default=0.0, help='latency of every call')
+  parser.add_argument('--input_dim', type=int, default=784, help='size of the input of the model')
+  parser.add_argument('--output_shape', default='10', help='comma separated shape of each output row')
+  args = parser.parse_args()
+
+  servicer = FakePredictionService(args.latency_ms / 1000.0, args.input_dim,
+                                   [int(d) for d in args.output_shape.split(',') if d])
+  server, port = start_server(args.port, servicer)
+  print('Fake model server listening on port %d' % port)
+  try:
+    while True:
+      time.sleep(3600)
+  except KeyboardInterrupt:
+    server.stop(0)
+
+
+if __name__ == '__main__':
+  main()
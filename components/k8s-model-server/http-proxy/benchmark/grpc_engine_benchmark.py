@@ -0,0 +1,150 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per-call overhead of the grpc engines of the proxy.
+
+The fake model server runs in a child process and this process calls it the
+way the proxy does, through the stub of each engine and `fwrap`, keeping
+that many Predict calls in flight from the IOLoop. For every engine and
+concurrency level, it reports the calls per second, the p50 and p99
+latencies and the CPU time this process spent per call, which is the part
+of the CPU of the proxy that depends on the engine.
+
+Usage::
+
+  python benchmark/grpc_engine_benchmark.py --engines beta,ga --concurrency 1,32,128
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+from tensorflow.core.framework import types_pb2
+from tensorflow_serving.apis import predict_pb2
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from proxy_benchmark import free_port
+from server import create_stub
+from tensor_codec import ndarray_to_tensor_proto
+from tornado_grpc import fwrap
+
+
+FAKE_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_model_server.py')
+
+
+def start_fake_server(port, latency_ms, input_dim):
+  """Starts the fake model server in a child process and waits until it answers."""
+  server = subprocess.Popen([sys.executable, FAKE_SERVER, '--port', str(port),
+                            '--latency_ms', str(latency_ms), '--input_dim', str(input_dim)])
+  deadline = time.time() + 60
+  while time.time() < deadline:
+    if server.poll() is not None:
+      raise RuntimeError('The fake model server exited with status %d' % server.returncode)
+    try:
+      socket.create_connection(('127.0.0.1', port), timeout=1).close()
+      return server
+    except socket.error:
+      time.sleep(0.1)
+  server.kill()
+  raise RuntimeError('The fake model server did not start listening on port %d' % port)
+
+
+def predict_request(rows, input_dim):
+  request = predict_pb2.PredictRequest()
+  request.model_spec.name = 'fake'
+  request.inputs['x'].CopyFrom(ndarray_to_tensor_proto(
+      np.zeros((rows, input_dim), dtype=np.float32), types_pb2.DT_FLOAT))
+  return request
+
+
+@gen.coroutine
+def run_calls(stub, request, concurrency, calls):
+  """Makes `calls` Predict calls, `concurrency` of them in flight.
+
+  Returns:
+    A dict of the results.
+  """
+  latencies = []
+  errors = [0]
+  remaining = [calls]
+
+  @gen.coroutine
+  def worker():
+    while remaining[0] > 0:
+      remaining[0] -= 1
+      start = time.time()
+      try:
+        yield fwrap(stub.Predict.future(request, 60))
+      except Exception:
+        errors[0] += 1
+        continue
+      latencies.append(time.time() - start)
+
+  start, cpu_start = time.time(), os.times()
+  yield [worker() for _ in range(concurrency)]
+  elapsed, cpu_end = time.time() - start, os.times()
+  cpu = (cpu_end[0] - cpu_start[0]) + (cpu_end[1] - cpu_start[1])
+  result = dict(calls=len(latencies), errors=errors[0], cps=len(latencies) / elapsed)
+  if latencies:
+    result.update(p50_ms=float(np.percentile(latencies, 50)) * 1e3,
+                  p99_ms=float(np.percentile(latencies, 99)) * 1e3,
+                  cpu_us_per_call=cpu * 1e6 / calls)
+  raise gen.Return(result)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--engines', default='beta,ga', help='comma separated grpc engines')
+  parser.add_argument('--concurrency', default='1,32,128', help='comma separated calls in flight')
+  parser.add_argument('--calls', type=int, default=5000, help='calls measured per level')
+  parser.add_argument('--rows', type=int, default=1, help='instances per call')
+  parser.add_argument('--input_dim', type=int, default=64, help='size of each instance')
+  parser.add_argument('--latency_ms', type=float, default=0.0, help='latency of the fake model server')
+  args = parser.parse_args()
+
+  port = free_port()
+  server = start_fake_server(port, args.latency_ms, args.input_dim)
+  request = predict_request(args.rows, args.input_dim)
+  try:
+    print('%-6s %11s %10s %9s %9s %13s %7s' % (
+        'engine', 'concurrency', 'calls/s', 'p50 ms', 'p99 ms', 'cpu us/call', 'errors'))
+    for engine in args.engines.split(','):
+      stub = create_stub('127.0.0.1', port, engine=engine)
+      # Connects the channel before measuring.
+      IOLoop.current().run_sync(lambda: run_calls(stub, request, 1, 10))
+      for concurrency in [int(c) for c in args.concurrency.split(',')]:
+        result = IOLoop.current().run_sync(
+            lambda: run_calls(stub, request, concurrency, args.calls))
+        if result['calls']:
+          print('%-6s %11d %10.1f %9.2f %9.2f %13.1f %7d' % (
+              engine, concurrency, result['cps'], result['p50_ms'], result['p99_ms'],
+              result['cpu_us_per_call'], result['errors']))
+        else:
+          print('%-6s %11d %10s %9s %9s %13s %7d' % (
+              engine, concurrency, '-', '-', '-', '-', result['errors']))
+  finally:
+    # grpc servers do not always exit on SIGTERM.
+    server.kill()
+    server.wait()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,89 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Micro-benchmark of the json codecs of the proxy.
+
+Compares the installed codecs, and tornado's json_decode, on request bodies
+and predict responses shaped like the ones of common models.
+
+Usage::
+
+  python benchmark/json_codec_benchmark.py --repeat 5
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+import numpy as np
+import tornado.escape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json_codec
+from json_codec import get_codec
+from server import encode_predictions
+
+
+def payloads():
+  """Yields (name, request body, outputs of the predict call) triples."""
+  rng = np.random.RandomState(0)
+  mnist = rng.rand(64, 784).astype(np.float32)
+  yield ('mnist-64', json.dumps({'instances': [{'images': row} for row in mnist.tolist()]}),
+         [('probabilities', rng.rand(64, 10).astype(np.float32)),
+          ('classes', rng.randint(0, 10, 64))])
+  tabular = rng.rand(1000, 10)
+  yield ('tabular-1000', json.dumps({'instances': [dict(('f%d' % i, v) for i, v in enumerate(row))
+                                                   for row in tabular.tolist()]}),
+         [('scores', rng.rand(1000).astype(np.float32))])
+  image = rng.randint(0, 256, (8, 224, 224, 3))
+  yield ('image-8', json.dumps({'instances': [{'image': row} for row in image.tolist()]}),
+         [('probabilities', rng.rand(8, 1000).astype(np.float32)),
+          ('classes', rng.randint(0, 1000, (8, 5)))])
+
+
+def best_of(fn, repeat):
+  return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--repeat', type=int, default=5, help='runs of each measure, the best is kept')
+  args = parser.parse_args()
+
+  names = ['json'] + [n for n in ('simplejson', 'ujson') if getattr(json_codec, n) is not None]
+  codecs = [get_codec(name) for name in names]
+  print('%-14s %-12s %-16s %10s %10s' % ('payload', 'codec', 'operation', 'ms', 'MB/s'))
+  for name, body, outputs in payloads():
+    num_rows = outputs[0][1].shape[0]
+    mb = len(body) / float(1 << 20)
+    seconds = best_of(lambda: tornado.escape.json_decode(body), args.repeat)
+    print('%-14s %-12s %-16s %10.2f %10.1f' % (name, 'tornado', 'decode', seconds * 1e3, mb / seconds))
+    for codec in codecs:
+      seconds = best_of(lambda: codec.loads(body), args.repeat)
+      print('%-14s %-12s %-16s %10.2f %10.1f' % (name, codec.name, 'decode', seconds * 1e3, mb / seconds))
+      for output_format in ('rows', 'columns'):
+        encoded = encode_predictions(outputs, num_rows, output_format, codec)
+        seconds = best_of(lambda: encode_predictions(outputs, num_rows, output_format, codec),
+                          args.repeat)
+        print('%-14s %-12s %-16s %10.2f %10.1f' % (name, codec.name, 'encode ' + output_format,
+                                                  seconds * 1e3, len(encoded) / float(1 << 20) / seconds))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,224 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Load test of the proxy against a fake TF serving.
+
+The fake model server runs in this process and the proxy in a child process,
+started from server.py with any extra flags, so that its CPU time is
+measured on its own. For every payload size and concurrency level, a closed
+loop load generator keeps that many requests in flight for a while and
+reports the requests per second, the p50 and p99 latencies and the CPU time
+the proxy spent per request.
+
+Results can be saved as json and compared with a baseline, the command then
+fails when any of them is worse than the baseline by more than a tolerance,
+which lets CI catch performance regressions.
+
+Usage::
+
+  python benchmark/proxy_benchmark.py --rows 1,32,256 --concurrency 1,8,32 \\
+      --output results.json --baseline baseline.json --tolerance 0.25
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient, HTTPError
+from tornado.ioloop import IOLoop
+
+from fake_model_server import FakePredictionService, start_server
+
+
+SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server.py')
+MODEL = 'fake'
+
+
+def free_port():
+  sock = socket.socket()
+  sock.bind(('127.0.0.1', 0))
+  port = sock.getsockname()[1]
+  sock.close()
+  return port
+
+
+def cpu_seconds(pid):
+  """Returns the user and system CPU time of a process, from /proc on Linux."""
+  with open('/proc/%d/stat' % pid) as f:
+    # Fields after the command name, which may hold spaces.
+    fields = f.read().rsplit(')', 1)[1].split()
+  return (int(fields[11]) + int(fields[12])) / float(os.sysconf('SC_CLK_TCK'))
+
+
+def request_body(method, rows, input_dim):
+  values = np.random.RandomState(rows).rand(rows, input_dim).round(4)
+  if method == 'predict':
+    instances = [{'x': row} for row in values.tolist()]
+  else:
+    instances = [dict(('f%d' % i, v) for i, v in enumerate(row)) for row in values.tolist()]
+  return json.dumps({'instances': instances})
+
+
+def start_proxy(port, rpc_port, proxy_args):
+  """Starts the proxy in a child process and waits until it answers."""
+  command = [sys.executable, SERVER, '--port=%d' % port, '--rpc_address=127.0.0.1',
+             '--rpc_port=%d' % rpc_port, '--logging=warning'] + proxy_args
+  proxy = subprocess.Popen(command)
+  deadline = time.time() + 60
+  while time.time() < deadline:
+    if proxy.poll() is not None:
+      raise RuntimeError('The proxy exited with status %d' % proxy.returncode)
+    try:
+      socket.create_connection(('127.0.0.1', port), timeout=1).close()
+      return proxy
+    except socket.error:
+      time.sleep(0.1)
+  proxy.kill()
+  raise RuntimeError('The proxy did not start listening on port %d' % port)
+
+
+@gen.coroutine
+def run_load(url, body, concurrency, duration, warmup, pid):
+  """Keeps `concurrency` requests in flight for warmup + duration seconds.
+
+  Returns:
+    A dict of the results measured after the warmup.
+  """
+  client = AsyncHTTPClient(force_instance=True, max_clients=concurrency)
+  ioloop = IOLoop.current()
+  measure_start = ioloop.time() + warmup
+  end = measure_start + duration
+  latencies = []
+  errors = [0]
+  cpu = {}
+  ioloop.call_at(measure_start, lambda: cpu.setdefault('start', cpu_seconds(pid)))
+
+  @gen.coroutine
+  def worker():
+    while ioloop.time() < end:
+      start = ioloop.time()
+      try:
+        yield client.fetch(url, method='POST', body=body, request_timeout=60)
+      except HTTPError:
+        errors[0] += 1
+        continue
+      finished = ioloop.time()
+      if measure_start <= start and finished <= end:
+        latencies.append(finished - start)
+
+  yield [worker() for _ in range(concurrency)]
+  cpu['end'] = cpu_seconds(pid)
+  client.close()
+  requests = len(latencies)
+  result = dict(requests=requests, errors=errors[0], rps=requests / float(duration))
+  if requests:
+    result.update(p50_ms=float(np.percentile(latencies, 50)) * 1e3,
+                  p99_ms=float(np.percentile(latencies, 99)) * 1e3,
+                  cpu_ms_per_request=(cpu['end'] - cpu['start']) * 1e3 / requests)
+  raise gen.Return(result)
+
+
+def compare(results, baseline, tolerance):
+  """Returns the descriptions of the results worse than the baseline."""
+  def key(result):
+    return result['method'], result['rows'], result['concurrency']
+
+  baseline = dict((key(result), result) for result in baseline)
+  regressions = []
+  for result in results:
+    base = baseline.get(key(result))
+    if base is None or not result['requests'] or not base['requests']:
+      continue
+    checks = [('rps', result['rps'] < base['rps'] * (1 - tolerance))]
+    for name in ('p50_ms', 'p99_ms', 'cpu_ms_per_request'):
+      checks.append((name, result[name] > base[name] * (1 + tolerance)))
+    for name, worse in checks:
+      if worse:
+        regressions.append('%s rows=%d concurrency=%d: %s %.2f, baseline %.2f' % (
+            result['method'], result['rows'], result['concurrency'], name, result[name],
+            base[name]))
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--method', choices=['predict', 'classify'], default='predict')
+  parser.add_argument('--rows', default='1,32,256', help='comma separated instances per request')
+  parser.add_argument('--concurrency', default='1,8,32', help='comma separated requests in flight')
+  parser.add_argument('--duration', type=float, default=3.0, help='seconds measured per level')
+  parser.add_argument('--warmup', type=float, default=1.0, help='seconds before measuring')
+  parser.add_argument('--latency_ms', type=float, default=1.0, help='latency of the fake model server')
+  parser.add_argument('--input_dim', type=int, default=64, help='size of each instance')
+  parser.add_argument('--output_shape', default='10', help='comma separated shape of each output row')
+  parser.add_argument('--proxy_args', default='', help='extra flags of the proxy, e.g. "--batching"')
+  parser.add_argument('--output', help='file where the results are written as json')
+  parser.add_argument('--baseline', help='json results to compare with')
+  parser.add_argument('--tolerance', type=float, default=0.25,
+                      help='relative degradation from the baseline beyond which the command fails')
+  args = parser.parse_args()
+
+  # The proxy is started before grpc creates its threads in this process.
+  port, rpc_port = free_port(), free_port()
+  proxy = start_proxy(port, rpc_port, shlex.split(args.proxy_args))
+  servicer = FakePredictionService(args.latency_ms / 1000.0, args.input_dim,
+                                   [int(d) for d in args.output_shape.split(',') if d])
+  server, _ = start_server(rpc_port, servicer)
+
+  results = []
+  try:
+    url = 'http://127.0.0.1:%d/model/%s:%s' % (port, MODEL, args.method)
+    print('%-9s %6s %11s %10s %9s %9s %13s %7s' % (
+        'method', 'rows', 'concurrency', 'req/s', 'p50 ms', 'p99 ms', 'cpu ms/req', 'errors'))
+    for rows in [int(r) for r in args.rows.split(',')]:
+      body = request_body(args.method, rows, args.input_dim)
+      for concurrency in [int(c) for c in args.concurrency.split(',')]:
+        result = IOLoop.current().run_sync(lambda: run_load(
+            url, body, concurrency, args.duration, args.warmup, proxy.pid))
+        result.update(method=args.method, rows=rows, concurrency=concurrency)
+        results.append(result)
+        if result['requests']:
+          print('%-9s %6d %11d %10.1f %9.2f %9.2f %13.3f %7d' % (
+              args.method, rows, concurrency, result['rps'], result['p50_ms'], result['p99_ms'],
+              result['cpu_ms_per_request'], result['errors']))
+        else:
+          print('%-9s %6d %11d %10s %9s %9s %13s %7d' % (
+              args.method, rows, concurrency, '-', '-', '-', '-', result['errors']))
+  finally:
+    proxy.terminate()
+    proxy.wait()
+    server.stop(0)
+
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(results, f, indent=2, sort_keys=True)
+  if args.baseline:
+    with open(args.baseline) as f:
+      regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+      print('Regression: %s' % regression)
+    if regressions:
+      sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,65 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Coalescing of identical requests in flight.
+
+Requests are keyed by everything their response depends on, including a hash
+of their body. The first request of a key is served as usual; the ones with
+the same key arriving before it completes wait for its response, or its
+error, instead of being sent to the model server again. The key is dropped
+once the first request completes, so that unlike the prediction cache
+nothing is kept beyond the requests in flight.
+"""
+
+
+class SingleFlight(object):
+  """Shares the result of a call among the concurrent calls with the same key.
+
+    Usage::
+
+      coalescer = SingleFlight()
+      future, coalesced = coalescer.run(key, respond, request)
+      response = yield future
+  """
+
+  def __init__(self):
+    self._flights = {}
+    self.calls = 0
+    self.coalesced = 0
+
+  def stats(self):
+    return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._flights)}
+
+  def run(self, key, fn, *args):
+    """Calls fn(*args) unless a call with the same key is in flight.
+
+    Args:
+      key: A hashable key of the call.
+      fn: Function returning a Future, e.g. a coroutine, of a result which
+          must not be modified by the callers sharing it.
+
+    Returns:
+      A tuple of the Future of the result and whether it is shared with a
+      call in flight.
+    """
+    self.calls += 1
+    future = self._flights.get(key)
+    if future is not None:
+      self.coalesced += 1
+      return future, True
+    future = fn(*args)
+    if not future.done():
+      self._flights[key] = future
+      future.add_done_callback(lambda _: self._flights.pop(key, None))
+    return future, False
@@ -0,0 +1,68 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from tornado import gen
+
+from coalescing import SingleFlight
+
+
+class Calls(object):
+    """Coroutine counting its calls and answering its argument after a while."""
+
+    def __init__(self, error=None):
+        self.count = 0
+        self.error = error
+
+    @gen.coroutine
+    def __call__(self, value):
+        self.count += 1
+        yield gen.sleep(0.01)
+        if self.error is not None:
+            raise self.error
+        raise gen.Return(value)
+
+
+@pytest.mark.gen_test
+def test_same_key_shares_one_call():
+    coalescer, calls = SingleFlight(), Calls()
+    first, coalesced = coalescer.run('a', calls, 1)
+    assert not coalesced
+    second, coalesced = coalescer.run('a', calls, 2)
+    assert coalesced
+    other, _ = coalescer.run('b', calls, 3)
+    results = yield [first, second, other]
+    assert results == [1, 1, 3]
+    assert calls.count == 2
+    assert coalescer.stats() == {'calls': 3, 'coalesced': 1, 'in_flight': 0}
+
+@pytest.mark.gen_test
+def test_completed_calls_are_not_shared():
+    coalescer, calls = SingleFlight(), Calls()
+    first, _ = coalescer.run('a', calls, 1)
+    yield first
+    second, coalesced = coalescer.run('a', calls, 2)
+    assert not coalesced
+    result = yield second
+    assert result == 2
+
+@pytest.mark.gen_test
+def test_errors_are_shared():
+    coalescer, calls = SingleFlight(), Calls(error=ValueError('failed'))
+    futures = [coalescer.run('a', calls, 1)[0] for _ in range(2)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            yield future
+    assert calls.count == 1
+    assert coalescer.stats()['in_flight'] == 0
@@ -0,0 +1,146 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Timeouts of the calls to the model server, per model.
+
+A model uses its own timeout when one is configured. Otherwise, in adaptive
+mode, its timeout is a multiple of a high percentile of the latencies of its
+recent calls, within bounds, so that heavy models get the time they usually
+need and calls to light models give up quickly when the model server stops
+answering. Calls which time out are observed with the time they waited, so
+that the timeout of a model which slows down grows up to the upper bound
+rather than failing every call.
+
+Models fall back to the default timeout until enough calls were observed.
+"""
+
+from collections import deque
+
+import numpy as np
+
+import metrics
+
+
+def parse_timeouts(value):
+  """Parses per model timeouts written as `model:seconds,...`.
+
+  Returns:
+    A dict from model name to seconds.
+
+  Raises:
+    ValueError: when a timeout is not valid.
+  """
+  timeouts = {}
+  for timeout in value.split(','):
+    if not timeout.strip():
+      continue
+    try:
+      model, seconds = timeout.strip().rsplit(':', 1)
+      timeouts[model] = float(seconds)
+    except ValueError:
+      raise ValueError('Invalid rpc timeout %s, expected model:seconds.' % timeout)
+  return timeouts
+
+
+class LatencyWindow(object):
+  """A percentile of the latest latencies, updated every few observations.
+
+  Args:
+    percentile: The percentile to compute, between 0 and 100.
+    window: Number of latest latencies kept.
+    min_samples: Number of latencies needed before computing the percentile.
+    update_every: Number of latencies after which the percentile is updated.
+  """
+
+  def __init__(self, percentile, window=1000, min_samples=100, update_every=32):
+    self.percentile = percentile
+    self.min_samples = min_samples
+    self.update_every = update_every
+    self.samples = deque(maxlen=window)
+    self.value = None
+    self._since_update = 0
+
+  def observe(self, seconds):
+    """Adds a latency, returning True when the percentile was updated."""
+    self.samples.append(seconds)
+    self._since_update += 1
+    if len(self.samples) < self.min_samples or self._since_update < self.update_every:
+      return False
+    self._since_update = 0
+    self.value = float(np.percentile(self.samples, self.percentile))
+    return True
+
+
+class RpcTimeouts(object):
+  """Chooses the timeout of the calls to each model.
+
+  Args:
+    default: Seconds for calls to time out when no other timeout applies.
+    overrides: A dict from model name to the seconds of its calls.
+    adaptive: Whether to derive the timeouts of the other models from their
+              latencies.
+    percentile: The percentile of the latencies the timeouts derive from.
+    multiplier: The ratio between a timeout and that percentile.
+    min_timeout: Lower bound of the adaptive timeouts.
+    max_timeout: Upper bound of the adaptive timeouts.
+    window: Number of recent latencies kept per model.
+    min_samples: Number of latencies needed before adapting the timeout.
+    update_every: Number of latencies after which the timeout is updated.
+
+    Usage::
+
+      timeouts = RpcTimeouts(1.0, adaptive=True)
+
+      @coroutine
+      def my_fn(request):
+        start = time.time()
+        response = yield fwrap(stub.Predict.future(
+            request, timeouts.timeout(request.model_spec.name)))
+        timeouts.observe(request.model_spec.name, time.time() - start)
+  """
+
+  def __init__(self, default=1.0, overrides=None, adaptive=False, percentile=99.0,
+               multiplier=2.0, min_timeout=0.05, max_timeout=10.0, window=1000,
+               min_samples=100, update_every=32):
+    self.default = default
+    self.overrides = overrides or {}
+    self.adaptive = adaptive
+    self.percentile = percentile
+    self.multiplier = multiplier
+    self.min_timeout = min_timeout
+    self.max_timeout = max_timeout
+    self.window = window
+    self.min_samples = min_samples
+    self.update_every = update_every
+    self._latencies = {}
+
+  def timeout(self, model_name):
+    """Returns the seconds for a call to the model to time out."""
+    if model_name in self.overrides:
+      return self.overrides[model_name]
+    latencies = self._latencies.get(model_name)
+    if latencies is None or latencies.value is None:
+      return self.default
+    return min(max(self.multiplier * latencies.value, self.min_timeout), self.max_timeout)
+
+  def observe(self, model_name, seconds):
+    """Records the latency of a call to the model, in adaptive mode."""
+    if not self.adaptive or model_name in self.overrides:
+      return
+    latencies = self._latencies.get(model_name)
+    if latencies is None:
+      latencies = self._latencies[model_name] = LatencyWindow(
+          self.percentile, self.window, self.min_samples, self.update_every)
+    if latencies.observe(seconds):
+      metrics.RPC_TIMEOUT_SECONDS.labels(model_name).set(self.timeout(model_name))
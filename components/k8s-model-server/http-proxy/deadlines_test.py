@@ -0,0 +1,58 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from deadlines import parse_timeouts, RpcTimeouts
+
+
+def test_default_and_overrides():
+    timeouts = RpcTimeouts(1.0, overrides={'big': 30.0})
+    assert timeouts.timeout('small') == 1.0
+    assert timeouts.timeout('big') == 30.0
+
+def test_adaptive():
+    timeouts = RpcTimeouts(1.0, adaptive=True, multiplier=2.0, min_samples=10, update_every=1)
+    for _ in range(9):
+        timeouts.observe('m', 0.1)
+    assert timeouts.timeout('m') == 1.0
+    timeouts.observe('m', 0.1)
+    assert abs(timeouts.timeout('m') - 0.2) < 1e-9
+    assert timeouts.timeout('other') == 1.0
+
+def test_adaptive_bounds():
+    timeouts = RpcTimeouts(1.0, adaptive=True, min_timeout=0.05, max_timeout=5.0, min_samples=1,
+                           update_every=1)
+    timeouts.observe('fast', 0.001)
+    timeouts.observe('slow', 100.0)
+    assert timeouts.timeout('fast') == 0.05
+    assert timeouts.timeout('slow') == 5.0
+
+def test_adaptive_follows_recent_latencies():
+    timeouts = RpcTimeouts(1.0, adaptive=True, percentile=50.0, multiplier=1.0, window=10,
+                           min_samples=10, update_every=10)
+    for latency in [0.1] * 10 + [0.3] * 10:
+        timeouts.observe('m', latency)
+    assert abs(timeouts.timeout('m') - 0.3) < 1e-9
+
+def test_overrides_are_not_adapted():
+    timeouts = RpcTimeouts(1.0, overrides={'m': 2.0}, adaptive=True, min_samples=1, update_every=1)
+    timeouts.observe('m', 0.01)
+    assert timeouts.timeout('m') == 2.0
+
+def test_parse_timeouts():
+    assert parse_timeouts('') == {}
+    assert parse_timeouts('a:1.5, b:30') == {'a': 1.5, 'b': 30.0}
+    with pytest.raises(ValueError):
+        parse_timeouts('a')
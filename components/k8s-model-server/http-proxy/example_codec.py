@@ -0,0 +1,198 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Conversion of json instances into the tf.Examples of classify requests.
+
+The kind of every feature (bytes, float or int64) is inferred once per
+request, from the values of all the instances, so that a feature holding
+both integers and floats is always sent as floats.
+
+`serialize_example_list` writes the protobuf wire format of the ExampleList
+directly, without building a message per example, feature and list, and
+`fill_example_list` builds the messages when the wire format is not wanted.
+"""
+
+import struct
+
+import numpy as np
+
+
+BYTES = 'bytes_list'
+FLOAT = 'float_list'
+INT64 = 'int64_list'
+
+# Field numbers of the lists in the Feature message.
+_FIELDS = {BYTES: 1, FLOAT: 2, INT64: 3}
+_UINT64_MASK = (1 << 64) - 1
+
+try:
+  _STRING_TYPES = (bytes, unicode)
+  _INTEGER_TYPES = (int, long)
+except NameError:
+  _STRING_TYPES = (bytes, str)
+  _INTEGER_TYPES = (int,)
+
+# Kinds of the exact types of json values, checked before isinstance.
+_KINDS = dict([(t, BYTES) for t in _STRING_TYPES] + [(t, INT64) for t in _INTEGER_TYPES] +
+              [(float, FLOAT), (bool, INT64)])
+_SMALL_VARINTS = [bytes(bytearray([i])) for i in range(0x80)]
+_pack_float = struct.Struct('<f').pack
+
+
+def _flatten(value):
+  if not isinstance(value, list):
+    return [value]
+  if any(isinstance(v, list) for v in value):
+    return np.array(value).ravel().tolist()
+  return value
+
+
+def _value_kind(value):
+  kind = _KINDS.get(type(value))
+  if kind is not None:
+    return kind
+  if isinstance(value, _STRING_TYPES):
+    return BYTES
+  if isinstance(value, float):
+    return FLOAT
+  if isinstance(value, _INTEGER_TYPES):
+    return INT64
+  raise ValueError('Unsupported feature value: %r' % (value,))
+
+
+def _merge_kinds(key, previous, kind):
+  if previous is None or previous == kind:
+    return kind
+  if BYTES in (previous, kind):
+    raise ValueError('Feature %s holds both strings and numbers.' % key)
+  return FLOAT
+
+
+def feature_kinds(instances):
+  """Infers the kind of every feature of the instances.
+
+  Returns:
+    A dict from feature name to BYTES, FLOAT or INT64.
+
+  Raises:
+    ValueError: when a feature holds both strings and numbers, or values
+    which are neither.
+  """
+  kinds = {}
+  for instance in instances:
+    if not isinstance(instance, dict):
+      raise ValueError('Classify instances have to be json objects.')
+    for key, value in instance.items():
+      previous = kinds.get(key)
+      if isinstance(value, list):
+        kinds[key] = previous
+        for v in _flatten(value):
+          kind = _value_kind(v)
+          if kind != kinds[key]:
+            kinds[key] = _merge_kinds(key, kinds[key], kind)
+      else:
+        kind = _value_kind(value)
+        if kind != previous:
+          kinds[key] = _merge_kinds(key, previous, kind)
+  # Features only given empty lists are sent as floats.
+  return dict((key, kind or FLOAT) for key, kind in kinds.items())
+
+
+def _varint(value):
+  if 0 <= value < 0x80:
+    return _SMALL_VARINTS[value]
+  value &= _UINT64_MASK
+  out = bytearray()
+  while value > 0x7f:
+    out.append((value & 0x7f) | 0x80)
+    value >>= 7
+  out.append(value)
+  return bytes(out)
+
+
+def _length_delimited(tag, data):
+  return tag + _varint(len(data)) + data
+
+
+def _as_bytes(value):
+  return value if isinstance(value, bytes) else value.encode('utf-8')
+
+
+def _serialize_list(kind, values):
+  if kind == FLOAT:
+    try:
+      packed = struct.pack('<%df' % len(values), *values)
+    except OverflowError:
+      packed = np.array(values, dtype='<f4').tobytes()
+    return _length_delimited(b'\x0a', packed) if values else b''
+  if kind == INT64:
+    return _length_delimited(b'\x0a', b''.join(_varint(v) for v in values)) if values else b''
+  return b''.join(_length_delimited(b'\x0a', _as_bytes(v)) for v in values)
+
+
+def serialize_example_list(instances, kinds=None):
+  """Returns the serialized ExampleList of the instances.
+
+  Args:
+    instances: A list of dicts from feature name to value or list of values.
+    kinds: The kind of every feature, inferred from the instances if None.
+  """
+  if kinds is None:
+    kinds = feature_kinds(instances)
+  list_tags = dict((kind, _varint(field << 3 | 2)) for kind, field in _FIELDS.items())
+  # Map entries hold the feature name in field 1 and the Feature in field 2.
+  entry_keys = dict((key, _length_delimited(b'\x0a', _as_bytes(key)) + b'\x12') for key in kinds)
+  # Scalar floats always take 8 bytes, so only their value varies.
+  float_heads = dict((key, b'\x0a' + _varint(len(entry_key) + 9) + entry_key +
+                      b'\x08' + list_tags[FLOAT] + b'\x06\x0a\x04')
+                     for key, entry_key in entry_keys.items() if kinds[key] == FLOAT)
+  examples = []
+  for instance in instances:
+    entries = []
+    for key, value in instance.items():
+      kind = kinds[key]
+      if kind == FLOAT and not isinstance(value, list):
+        try:
+          packed = _pack_float(value)
+        except OverflowError:
+          packed = np.float32(value).tobytes()
+        entries.append(float_heads[key] + packed)
+        continue
+      feature = _length_delimited(list_tags[kind], _serialize_list(kind, _flatten(value)))
+      entries.append(_length_delimited(b'\x0a', entry_keys[key] + _varint(len(feature)) + feature))
+    features = _length_delimited(b'\x0a', b''.join(entries))
+    examples.append(_length_delimited(b'\x0a', features))
+  return b''.join(examples)
+
+
+def fill_example_list(example_list, instances, kinds=None):
+  """Adds the tf.Examples of the instances to an ExampleList message.
+
+  Args:
+    example_list: The ExampleList message.
+    instances: A list of dicts from feature name to value or list of values.
+    kinds: The kind of every feature, inferred from the instances if None.
+  """
+  if kinds is None:
+    kinds = feature_kinds(instances)
+  for instance in instances:
+    feature_map = example_list.examples.add().features.feature
+    for key, value in instance.items():
+      kind = kinds[key]
+      values = _flatten(value)
+      if kind == BYTES:
+        values = [_as_bytes(v) for v in values]
+      feature_list = getattr(feature_map[key], kind)
+      feature_list.SetInParent()
+      feature_list.value.extend(values)
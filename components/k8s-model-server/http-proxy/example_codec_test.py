@@ -0,0 +1,51 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from tensorflow_serving.apis import input_pb2
+
+from example_codec import (feature_kinds, fill_example_list, serialize_example_list,
+                           BYTES, FLOAT, INT64)
+
+
+INSTANCES = [
+    {'a': 1, 'b': [1.5, 2], 'c': u'h\xe9', 'd': [], 'e': [[1, 2], [3, -4]], 'f': True},
+    {'a': 2.5, 'b': [], 'c': [b'x', u'y'], 'e': -1, 'g': 1e300},
+]
+
+def test_feature_kinds():
+    assert feature_kinds(INSTANCES) == {'a': FLOAT, 'b': FLOAT, 'c': BYTES, 'd': FLOAT,
+                                        'e': INT64, 'f': INT64, 'g': FLOAT}
+
+@pytest.mark.parametrize('instances', [[{'a': 1}, {'a': 'x'}], [{'a': None}], ['a']])
+def test_feature_kinds_invalid(instances):
+    with pytest.raises(ValueError):
+        feature_kinds(instances)
+
+def test_serialize_matches_messages():
+    expected = input_pb2.ExampleList()
+    fill_example_list(expected, INSTANCES)
+    actual = input_pb2.ExampleList.FromString(serialize_example_list(INSTANCES))
+    assert actual == expected
+
+def test_fill_example_list():
+    example_list = input_pb2.ExampleList()
+    fill_example_list(example_list, INSTANCES)
+    first, second = [example.features.feature for example in example_list.examples]
+    assert first['a'].float_list.value == [1.0]
+    assert first['c'].bytes_list.value == [u'h\xe9'.encode('utf-8')]
+    assert first['d'].HasField('float_list')
+    assert first['e'].int64_list.value == [1, 2, 3, -4]
+    assert second['c'].bytes_list.value == [b'x', b'y']
+    assert second['g'].float_list.value == [float('inf')]
@@ -0,0 +1,158 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Hedged calls to the model server backends.
+
+A call which is still running after a high percentile of the latencies of
+its model and method gets a second copy sent to another backend. The first
+successful response is used and the other call is cancelled, so that a
+backend stalled by a GC pause or a noisy node only delays the few calls
+which were slower than usual anyway.
+
+Hedges add load to the backends, so at most `max_ratio` of the calls are
+hedged: every call earns `max_ratio` of a hedge, and hedges are sent while
+at least one is earned. Predict and Classify calls do not change the model
+server, so they can safely be sent twice.
+"""
+
+from datetime import timedelta
+import time
+
+from tornado import gen
+
+from deadlines import LatencyWindow
+import metrics
+from tornado_grpc import fwrap
+
+
+PRIMARY = 'primary'
+HEDGE = 'hedge'
+
+
+def _ignore_result(future):
+  # Retrieves the error of a lost call so that tornado does not log it.
+  future.add_done_callback(lambda f: f.exception())
+
+
+class Hedger(object):
+  """Sends calls to a BackendPool, hedging the slow ones on another backend.
+
+  Args:
+    pool: The BackendPool.
+    percentile: The percentile of the latencies after which calls are hedged.
+    min_delay: Seconds before which calls are never hedged.
+    max_ratio: The maximum ratio of hedged calls.
+    max_earned: The maximum number of hedges earned ahead.
+    window: Number of recent latencies kept per model and method.
+    min_samples: Number of latencies needed before hedging calls.
+
+    Usage::
+
+      hedger = Hedger(pool, percentile=95)
+
+      @coroutine
+      def my_fn(request):
+        response = yield hedger.call('Predict', request, timeout, request.model_spec.name)
+  """
+
+  def __init__(self, pool, percentile=95.0, min_delay=0.005, max_ratio=0.1, max_earned=10.0,
+               window=1000, min_samples=100):
+    self.pool = pool
+    self.percentile = percentile
+    self.min_delay = min_delay
+    self.max_ratio = max_ratio
+    self.max_earned = max_earned
+    self.window = window
+    self.min_samples = min_samples
+    self.calls = 0
+    self.hedged = 0
+    self.hedge_wins = 0
+    self._earned = 0.0
+    self._latencies = {}
+
+  def stats(self):
+    return dict(calls=self.calls, hedged=self.hedged, hedge_wins=self.hedge_wins)
+
+  def delay(self, model_name, method):
+    """Returns the seconds after which a call is hedged, None if it is not."""
+    latencies = self._latencies.get((model_name, method))
+    if latencies is None or latencies.value is None:
+      return None
+    return max(latencies.value, self.min_delay)
+
+  def observe(self, model_name, method, seconds):
+    latencies = self._latencies.get((model_name, method))
+    if latencies is None:
+      latencies = self._latencies[(model_name, method)] = LatencyWindow(
+          self.percentile, self.window, self.min_samples)
+    latencies.observe(seconds)
+
+  @gen.coroutine
+  def call(self, method, request, timeout, model_name):
+    """Calls a method of the PredictionService, hedging it when slow.
+
+    Args:
+      method: The name of the method, `Predict` or `Classify`.
+      request: The request message.
+      timeout: Seconds for the call to time out.
+      model_name: The model called, whose latencies are tracked.
+
+    Returns:
+      A future resolving to the first successful response.
+    """
+    start = time.time()
+    self.calls += 1
+    self._earned = min(self._earned + self.max_ratio, self.max_earned)
+    backend = self.pool.pick()
+    primary_call = self.pool.call(method, request, timeout, backend=backend)
+    primary = fwrap(primary_call)
+    delay = self.delay(model_name, method)
+    if delay is None or delay >= timeout or self._earned < 1 or len(self.pool.backends) < 2:
+      result = yield primary
+      self.observe(model_name, method, time.time() - start)
+      raise gen.Return(result)
+
+    try:
+      result = yield gen.with_timeout(timedelta(seconds=delay), primary,
+                                      quiet_exceptions=(Exception,))
+      self.observe(model_name, method, time.time() - start)
+      raise gen.Return(result)
+    except gen.TimeoutError:
+      pass
+
+    self._earned -= 1
+    self.hedged += 1
+    metrics.HEDGED_CALLS.labels(model_name, method).inc()
+    hedge_call = self.pool.call(method, request, max(timeout - (time.time() - start), 0.0),
+                                backend=self.pool.pick(exclude=[backend]))
+    calls = [primary_call, hedge_call]
+    futures = [primary, fwrap(hedge_call)]
+    waiter = gen.WaitIterator(*futures)
+    error = None
+    while not waiter.done():
+      try:
+        result = yield waiter.next()
+      except Exception as e:
+        error = e
+        continue
+      winner = waiter.current_index
+      loser = 1 - winner
+      calls[loser].cancel()
+      _ignore_result(futures[loser])
+      if winner == 1:
+        self.hedge_wins += 1
+      metrics.HEDGE_WINS.labels(model_name, method, HEDGE if winner else PRIMARY).inc()
+      self.observe(model_name, method, time.time() - start)
+      raise gen.Return(result)
+    raise error
@@ -0,0 +1,129 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import Future
+
+import pytest
+from tornado.ioloop import IOLoop
+
+from hedging import Hedger
+
+
+class FakeBackend(object):
+    """Backend answering its name after `delay` seconds, or failing with `error`."""
+
+    def __init__(self, name, delay, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.calls = []
+
+    def future(self, request, timeout):
+        f = Future()
+        self.calls.append(f)
+        IOLoop.current().call_later(self.delay, self._answer, f)
+        return f
+
+    def _answer(self, f):
+        if f.cancelled():
+            return
+        if self.error is not None:
+            f.set_exception(self.error)
+        else:
+            f.set_result(self.name)
+
+
+class FakePool(object):
+    """Pool always picking its first backend which is not excluded."""
+
+    def __init__(self, *backends):
+        self.backends = list(backends)
+
+    def pick(self, exclude=()):
+        return [b for b in self.backends if b not in exclude][0]
+
+    def call(self, method, request, timeout, backend=None):
+        return backend.future(request, timeout)
+
+
+def warmed_hedger(pool, latency=0.01, **kwargs):
+    hedger = Hedger(pool, min_samples=1, **kwargs)
+    for _ in range(32):
+        hedger.observe('m', 'Predict', latency)
+    return hedger
+
+@pytest.mark.gen_test
+def test_no_hedge_before_latencies_are_known():
+    slow, fast = FakeBackend('slow', 0.05), FakeBackend('fast', 0.0)
+    hedger = Hedger(FakePool(slow, fast))
+    result = yield hedger.call('Predict', None, 1.0, 'm')
+    assert result == 'slow'
+    assert hedger.stats() == {'calls': 1, 'hedged': 0, 'hedge_wins': 0}
+
+@pytest.mark.gen_test
+def test_fast_calls_are_not_hedged():
+    first, second = FakeBackend('first', 0.0), FakeBackend('second', 0.0)
+    hedger = warmed_hedger(FakePool(first, second), latency=0.05, max_ratio=1.0)
+    result = yield hedger.call('Predict', None, 1.0, 'm')
+    assert result == 'first'
+    assert len(second.calls) == 0
+
+@pytest.mark.gen_test
+def test_slow_call_is_hedged_and_cancelled():
+    slow, fast = FakeBackend('slow', 10.0), FakeBackend('fast', 0.0)
+    hedger = warmed_hedger(FakePool(slow, fast), max_ratio=1.0)
+    result = yield hedger.call('Predict', None, 1.0, 'm')
+    assert result == 'fast'
+    assert slow.calls[0].cancelled()
+    assert hedger.stats() == {'calls': 1, 'hedged': 1, 'hedge_wins': 1}
+
+@pytest.mark.gen_test
+def test_primary_can_still_win():
+    slow, slower = FakeBackend('slow', 0.03), FakeBackend('slower', 10.0)
+    hedger = warmed_hedger(FakePool(slow, slower), max_ratio=1.0)
+    result = yield hedger.call('Predict', None, 1.0, 'm')
+    assert result == 'slow'
+    assert slower.calls[0].cancelled()
+    assert hedger.stats() == {'calls': 1, 'hedged': 1, 'hedge_wins': 0}
+
+@pytest.mark.gen_test
+def test_failed_copy_waits_for_the_other():
+    failing = FakeBackend('failing', 0.02, error=ValueError('failed'))
+    slow = FakeBackend('slow', 0.04)
+    hedger = warmed_hedger(FakePool(failing, slow), max_ratio=1.0)
+    result = yield hedger.call('Predict', None, 1.0, 'm')
+    assert result == 'slow'
+
+    slow.error = ValueError('failed too')
+    with pytest.raises(ValueError):
+        yield hedger.call('Predict', None, 1.0, 'm')
+
+@pytest.mark.gen_test
+def test_hedges_are_limited():
+    slow, fast = FakeBackend('slow', 0.02), FakeBackend('fast', 0.0)
+    hedger = warmed_hedger(FakePool(slow, fast), max_ratio=0.5)
+    results = []
+    for _ in range(4):
+        result = yield hedger.call('Predict', None, 1.0, 'm')
+        results.append(result)
+    assert results == ['slow', 'fast', 'slow', 'fast']
+    assert hedger.stats()['hedged'] == 2
+
+@pytest.mark.gen_test
+def test_single_backend_is_not_hedged():
+    slow = FakeBackend('slow', 0.02)
+    hedger = warmed_hedger(FakePool(slow), max_ratio=1.0)
+    result = yield hedger.call('Predict', None, 1.0, 'm')
+    assert result == 'slow'
+    assert hedger.stats()['hedged'] == 0
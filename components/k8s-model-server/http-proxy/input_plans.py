@@ -0,0 +1,152 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Input plans, compiled once per signature, to validate and encode instances.
+
+An InputPlan holds, for every input of a signature in a fixed order, the
+NumPy dtype its values are stacked into, the shape expected of the value of
+one instance and whether values are strings, which may be sent as base64,
+or numbers. The value of the first instance is checked against the plan
+before any array is built, following its nesting along its first elements
+only, so that a missing input, a value of the wrong rank or size or a string
+sent to a numeric input, which usually affect every instance, are rejected
+after a few operations. The values of all instances are then stacked in a
+single pass by NumPy; only when that fails are they checked one by one, to
+name the first instance at fault.
+
+Plans are compiled with the signature map of a model, see
+`signature_cache.SignatureMap`.
+"""
+
+import numbers
+
+import numpy as np
+from tensorflow.core.framework import types_pb2
+
+from tensor_codec import check_shape, column_dtype, ndarray_to_tensor_proto
+
+
+_TEXT_TYPES = (bytes, type(u''))
+
+# Marks values whose nesting ends with an empty list, without a first element.
+_EMPTY = object()
+
+
+class ColumnPlan(object):
+  """How the values of one input are checked and encoded.
+
+  Args:
+    name: The name of the input.
+    tensor_info: The `TensorInfo` of the input from the signature.
+  """
+
+  def __init__(self, name, tensor_info):
+    self.name = name
+    self.tensor_info = tensor_info
+    self.dtype = column_dtype(tensor_info)
+    self.is_string = tensor_info.dtype == types_pb2.DT_STRING
+    self.is_numeric = self.dtype != np.dtype(object)
+    shape = tensor_info.tensor_shape
+    if shape.unknown_rank or not shape.dim:
+      # Like check_shape, signatures without dimensions accept any shape.
+      self.instance_shape = None
+    else:
+      self.instance_shape = tuple(int(d.size) for d in shape.dim[1:])
+
+  def check(self, value, index):
+    """Checks the value of this input in the instance at index.
+
+    Raises:
+      ValueError: when the value does not have the rank, the fixed sizes or
+      the kind of values, strings or numbers, of the input.
+    """
+    shape = []
+    while isinstance(value, (list, tuple)):
+      shape.append(len(value))
+      if not value:
+        value = _EMPTY
+        break
+      value = value[0]
+    expected = self.instance_shape
+    if expected is not None and (len(shape) != len(expected) or any(
+        e >= 0 and e != s for e, s in zip(expected, shape))):
+      raise ValueError("Input %s of instance %d has shape %s which is not compatible with %s."
+                       % (self.name, index, shape, list(expected)))
+    if value is _EMPTY:
+      return
+    if self.is_string:
+      if not isinstance(value, _TEXT_TYPES):
+        raise ValueError("Input %s of instance %d must be strings, or base64 encoded as "
+                         "{\"b64\": ...}." % (self.name, index))
+    elif self.is_numeric and not isinstance(value, numbers.Number):
+      raise ValueError("Input %s of instance %d must be numbers." % (self.name, index))
+
+  def stack(self, values, first_index=0):
+    """Stacks the values of consecutive instances into an array of the input dtype.
+
+    Args:
+      values: The values of this input, the first one of the instance at
+              first_index.
+      first_index: The index of the instance of the first value.
+
+    Raises:
+      ValueError: when the values can not be stacked into an array of the
+      dtype and shape of the input, naming the first instance at fault when
+      there is one.
+    """
+    try:
+      array = np.asarray(values, dtype=self.dtype)
+      check_shape(array, self.tensor_info, self.name)
+    except (TypeError, ValueError) as e:
+      for index, value in enumerate(values):
+        self.check(value, first_index + index)
+      raise ValueError("Values of input %s can not be stacked: %s" % (self.name, e))
+    return array
+
+
+class InputPlan(object):
+  """The plan of every input of a signature, sorted by name.
+
+  Args:
+    inputs: The `inputs` map of the signature.
+
+    Usage::
+
+      plan = InputPlan(signature.inputs)
+      plan.encode(request, instances)
+  """
+
+  def __init__(self, inputs):
+    self.columns = [ColumnPlan(name, inputs[name]) for name in sorted(inputs)]
+
+  def encode(self, request, instances):
+    """Fills the inputs of a PredictRequest from a non empty list of instances.
+
+    Raises:
+      ValueError: when an instance misses an input, or when the values of an
+      input do not match its dtype and shape.
+    """
+    for column in self.columns:
+      try:
+        value = instances[0][column.name]
+      except (KeyError, TypeError):
+        raise ValueError("Every instance must have a value for input %s." % column.name)
+      column.check(value, 0)
+    for column in self.columns:
+      try:
+        values = [instance[column.name] for instance in instances]
+      except (KeyError, TypeError):
+        raise ValueError("Every instance must have a value for input %s." % column.name)
+      request.inputs[column.name].CopyFrom(
+          ndarray_to_tensor_proto(column.stack(values), column.tensor_info.dtype))
@@ -0,0 +1,126 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pickle
+
+import numpy as np
+import pytest
+import tensorflow as tf
+from tensorflow.core.framework import types_pb2
+from tensorflow.core.protobuf import meta_graph_pb2
+from tensorflow_serving.apis import predict_pb2
+
+from input_plans import ColumnPlan, InputPlan
+from signature_cache import get_input_plan, SignatureMap
+from tensor_codec import ndarray_to_tensor_proto, tensor_proto_to_ndarray
+
+
+def signature():
+    signature = meta_graph_pb2.SignatureDef()
+    signature.inputs['x'].dtype = types_pb2.DT_FLOAT
+    for size in (-1, 2):
+        signature.inputs['x'].tensor_shape.dim.add().size = size
+    signature.inputs['name'].dtype = types_pb2.DT_STRING
+    signature.inputs['name'].tensor_shape.dim.add().size = -1
+    signature.inputs['any'].dtype = types_pb2.DT_INT64
+    signature.inputs['any'].tensor_shape.unknown_rank = True
+    return signature
+
+
+def encode(instances):
+    request = predict_pb2.PredictRequest()
+    InputPlan(signature().inputs).encode(request, instances)
+    return request
+
+
+def test_plan():
+    plan = InputPlan(signature().inputs)
+    assert [column.name for column in plan.columns] == ['any', 'name', 'x']
+    assert [column.dtype for column in plan.columns] == [np.int64, object, np.float32]
+    assert [column.instance_shape for column in plan.columns] == [None, (), (2,)]
+    assert [column.is_string for column in plan.columns] == [False, True, False]
+
+def test_numeric_values_use_tensor_content():
+    values = [[1.5, 2.0], [3.0, 4.0]]
+    request = encode([{'x': value, 'name': 'a', 'any': 1} for value in values])
+    assert request.inputs['x'].tensor_content
+    np.testing.assert_array_equal(tf.make_ndarray(request.inputs['x']), np.asarray(values, dtype=np.float32))
+
+def test_stack_matches_make_tensor_proto():
+    values = [[1, 2, 3], [4, 5, 6]]
+    column = ColumnPlan('any', signature().inputs['any'])
+    tensor = ndarray_to_tensor_proto(column.stack(values), types_pb2.DT_INT64)
+    expected = tf.make_tensor_proto(values, types_pb2.DT_INT64)
+    np.testing.assert_array_equal(tf.make_ndarray(tensor), tf.make_ndarray(expected))
+    assert tensor.tensor_shape == expected.tensor_shape
+
+def test_encode():
+    request = encode([{'x': [1.0, 2.0], 'name': 'a', 'any': [[1], [2]]},
+                      {'x': [3.0, 4.0], 'name': b'b', 'any': [[3], [4]]}])
+    assert tensor_proto_to_ndarray(request.inputs['x']).tolist() == [[1.0, 2.0], [3.0, 4.0]]
+    assert list(request.inputs['name'].string_val) == [b'a', b'b']
+    assert tensor_proto_to_ndarray(request.inputs['any']).shape == (2, 2, 1)
+
+@pytest.mark.parametrize('instances, message', [
+    ([{'x': [1.0, 2.0], 'name': 'a'}], 'Every instance must have a value for input any.'),
+    ([[1.0, 2.0]], 'Every instance must have a value for input any.'),
+    ([{'x': [1.0, 2.0, 3.0], 'name': 'a', 'any': 1}],
+     'Input x of instance 0 has shape [3] which is not compatible with [2].'),
+    ([{'x': [[1.0, 2.0]], 'name': 'a', 'any': 1}],
+     'Input x of instance 0 has shape [1, 2] which is not compatible with [2].'),
+    ([{'x': [1.0, 2.0], 'name': 1, 'any': 1}], 'Input name of instance 0 must be strings'),
+    ([{'x': ['a', 'b'], 'name': 'a', 'any': 1}], 'Input x of instance 0 must be numbers.'),
+    ([{'x': [1.0, 2.0], 'name': 'a', 'any': 1}, {'x': [1.0], 'name': 'a', 'any': 1}],
+     'Input x of instance 1 has shape [1] which is not compatible with [2].'),
+    ([{'x': [1.0, 2.0], 'name': 'a', 'any': 1}, {'x': [1.0, 'a'], 'name': 'a', 'any': 1}],
+     'Values of input x can not be stacked'),
+])
+def test_invalid_instances(instances, message):
+    with pytest.raises(ValueError) as e:
+        encode(instances)
+    assert message in str(e.value)
+
+def test_signature_map_plans():
+    signature_map = SignatureMap({'serving_default': signature()})
+    plan = get_input_plan(signature_map, 'serving_default')
+    assert plan is get_input_plan(signature_map, 'serving_default')
+    # Large requests are parsed in other processes.
+    copy = pickle.loads(pickle.dumps(signature_map, pickle.HIGHEST_PROTOCOL))
+    assert [column.name for column in copy.input_plans['serving_default'].columns] == [
+        'any', 'name', 'x']
+
+def test_plain_signature_maps_are_compiled():
+    plan = get_input_plan({'serving_default': signature()}, 'serving_default')
+    assert len(plan.columns) == 3
+
+def test_signatures_without_plan_only_reject_their_requests():
+    invalid = signature()
+    invalid.inputs['x'].dtype = types_pb2.DT_INVALID
+    signature_map = SignatureMap({'serving_default': signature(), 'invalid': invalid})
+    assert len(get_input_plan(signature_map, 'serving_default').columns) == 3
+    with pytest.raises(ValueError) as e:
+        get_input_plan(signature_map, 'invalid')
+    assert 'Signature invalid can not be used with instances' in str(e.value)
+    copy = pickle.loads(pickle.dumps(signature_map, pickle.HIGHEST_PROTOCOL))
+    with pytest.raises(ValueError):
+        get_input_plan(copy, 'invalid')
+
+def test_bfloat16_and_quantized_inputs():
+    inputs = signature().inputs
+    inputs['x'].dtype = types_pb2.DT_BFLOAT16
+    inputs['any'].dtype = types_pb2.DT_QUINT8
+    request = predict_pb2.PredictRequest()
+    InputPlan(inputs).encode(request, [{'x': [1.0, 2.5], 'name': 'a', 'any': 200}])
+    assert tensor_proto_to_ndarray(request.inputs['x']).tolist() == [[1.0, 2.5]]
+    assert tensor_proto_to_ndarray(request.inputs['any']).tolist() == [200]
@@ -0,0 +1,127 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""JSON codecs of the request and response bodies.
+
+The fastest library installed is used by default: `ujson`, then
+`simplejson`, then the standard `json` module.
+
+ujson does not format floats so that they parse back to the same value, so
+it only encodes integer and boolean arrays; everything else is encoded by
+the json module, which formats floats with `repr`. All codecs
+encode without spaces and encode NumPy arrays and scalars.
+
+Arrays are still converted into nested lists with `tolist` before being
+encoded: neither the json modules of python 2 nor ujson 1.35, its last
+release supporting python 2, can encode NumPy buffers directly. `tolist`
+builds the lists in C, which costs much less than encoding them, but a copy
+of every value as a python object is held while a response is encoded.
+"""
+
+import json
+
+import numpy as np
+
+try:
+  import simplejson
+except ImportError:
+  simplejson = None
+
+try:
+  import ujson
+except ImportError:
+  ujson = None
+
+
+SEPARATORS = (',', ':')
+
+
+def _default(obj):
+  if isinstance(obj, np.ndarray):
+    return obj.tolist()
+  if isinstance(obj, np.generic):
+    return obj.item()
+  raise TypeError('%r is not JSON serializable' % (obj,))
+
+
+class JsonCodec(object):
+  """Codec based on a module with the interface of the `json` module.
+
+  Args:
+    module: `json` or `simplejson`.
+  """
+
+  def __init__(self, module):
+    self.module = module
+    self.name = module.__name__
+
+  def __reduce__(self):
+    # Modules can not be pickled, codecs are sent to worker processes by name.
+    return get_codec, (self.name,)
+
+  def loads(self, data):
+    """Decodes a body, raising ValueError when it is not valid json."""
+    if not isinstance(data, str):
+      # The json module of python 2 decodes str faster than unicode.
+      data = data.decode('utf-8')
+    return self.module.loads(data)
+
+  def dumps(self, obj):
+    return self.module.dumps(obj, separators=SEPARATORS, default=_default)
+
+  def dumps_array(self, array):
+    """Encodes an array into nested json lists."""
+    return self.module.dumps(array.tolist(), separators=SEPARATORS)
+
+
+class UjsonCodec(JsonCodec):
+  """Codec decoding with ujson, encoding floats with another module.
+
+  Args:
+    fallback: The module encoding everything but integer and boolean arrays,
+              with the interface of the `json` module.
+  """
+
+  def __init__(self, fallback):
+    super(UjsonCodec, self).__init__(fallback)
+    self.name = 'ujson'
+
+  def loads(self, data):
+    return ujson.loads(data, precise_float=True)
+
+  def dumps_array(self, array):
+    if array.dtype.kind in 'biu':
+      return ujson.dumps(array.tolist())
+    return super(UjsonCodec, self).dumps_array(array)
+
+
+def get_codec(name='auto'):
+  """Returns the codec named `ujson`, `simplejson` or `json`.
+
+  Args:
+    name: The library to use, or `auto` for the fastest one installed.
+
+  Raises:
+    ValueError: when the library is unknown or not installed.
+  """
+  if name == 'auto':
+    name = 'ujson' if ujson is not None else 'simplejson' if simplejson is not None else 'json'
+  if name == 'ujson' and ujson is not None:
+    # The json module encodes floats faster than simplejson.
+    return UjsonCodec(json)
+  if name == 'simplejson' and simplejson is not None:
+    return JsonCodec(simplejson)
+  if name == 'json':
+    return JsonCodec(json)
+  raise ValueError('JSON library %s is not available.' % name)
@@ -0,0 +1,62 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+import numpy as np
+import pytest
+
+import json_codec
+from json_codec import get_codec
+from server import encode_predictions
+
+
+AVAILABLE = ['json'] + [name for name in ('simplejson', 'ujson')
+                        if getattr(json_codec, name) is not None]
+
+
+@pytest.fixture(params=AVAILABLE)
+def codec(request):
+    return get_codec(request.param)
+
+def test_loads(codec):
+    assert codec.loads(b'{"instances": [{"x": 0.1}, {"x": 1.0000000000000002}]}') == \
+        {'instances': [{'x': 0.1}, {'x': 1.0000000000000002}]}
+    with pytest.raises(ValueError):
+        codec.loads(b'{"instances": ')
+
+def test_dumps_numpy(codec):
+    obj = {'a': np.float32(0.5), 'b': np.arange(3), 'c': [np.int64(1)]}
+    assert json.loads(codec.dumps(obj)) == {'a': 0.5, 'b': [0, 1, 2], 'c': [1]}
+
+def test_dumps_array_exact_floats(codec):
+    array = np.array([[0.1, 1e-12], [1 / 3.0, 123456789.123]])
+    assert np.array_equal(np.array(json.loads(codec.dumps_array(array))), array)
+    array = np.array([True, False])
+    assert json.loads(codec.dumps_array(array)) == [True, False]
+
+def test_encode_predictions(codec):
+    outputs = [('a', np.array([1.5, 2.5], dtype=np.float32)), ('b', np.array([[1, 2], [3, 4]])),
+               ('c', np.array(['x', 'y'], dtype=object))]
+    assert json.loads(encode_predictions(outputs, 2, codec=codec)) == \
+        {'predictions': [{'a': 1.5, 'b': [1, 2], 'c': 'x'}, {'a': 2.5, 'b': [3, 4], 'c': 'y'}]}
+    assert json.loads(encode_predictions(outputs, 2, 'columns', codec)) == \
+        {'predictions': {'a': [1.5, 2.5], 'b': [[1, 2], [3, 4]], 'c': ['x', 'y']}}
+
+def test_auto_is_fastest():
+    assert get_codec().name == AVAILABLE[-1]
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        get_codec('yaml')
@@ -0,0 +1,140 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Prometheus metrics of the proxy, served on /metrics.
+
+Requests are timed per model and per phase:
+
+- `decode`: parsing the request body,
+- `b64_decode`: decoding base64 values,
+- `encode`: building the tensors or examples sent to the model server,
+- `rpc`: waiting for the model server,
+- `serialize`: building the response body.
+
+Every metric has a `model` label, which is only set to models known to
+exist, so that arbitrary urls do not create new series: models whose
+signatures could be fetched and, for classify requests, which do not need
+the signatures, models the model server has answered a call for. The
+admission metrics of requests to other models use the `(unknown)` label.
+"""
+
+from contextlib import contextmanager
+import glob
+import os
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from prometheus_client import multiprocess, values
+
+
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0,
+                   2.5, 5.0, 10.0, float('inf'))
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, float('inf'))
+
+REQUEST_SECONDS = Histogram(
+    'http_proxy_request_seconds', 'Latency of the requests to the proxy.',
+    ['model', 'method'], buckets=LATENCY_BUCKETS)
+PHASE_SECONDS = Histogram(
+    'http_proxy_phase_seconds', 'Time spent in each phase of the requests.',
+    ['model', 'method', 'phase'], buckets=LATENCY_BUCKETS)
+IN_FLIGHT = Gauge(
+    'http_proxy_in_flight_requests', 'Requests being served by the proxy.',
+    ['model', 'method'], multiprocess_mode='livesum')
+INSTANCES = Histogram(
+    'http_proxy_request_instances', 'Number of instances per request.',
+    ['model', 'method'], buckets=SIZE_BUCKETS)
+BATCH_INSTANCES = Histogram(
+    'http_proxy_batch_instances', 'Number of instances per batched predict call.',
+    ['model'], buckets=SIZE_BUCKETS)
+RPC_ERRORS = Counter(
+    'http_proxy_rpc_errors_total', 'Failed calls to the model server by grpc status.',
+    ['model', 'method', 'code'])
+PREDICTION_CACHE_INSTANCES = Counter(
+    'http_proxy_prediction_cache_instances_total',
+    'Instances looked up in the prediction cache.', ['model', 'result'])
+REQUEST_LOG_INSTANCES = Counter(
+    'http_proxy_request_log_instances_total',
+    'Sampled instances written to or dropped from the request log.', ['result'])
+RPC_TIMEOUT_SECONDS = Gauge(
+    'http_proxy_rpc_timeout_seconds', 'Adaptive timeout of the calls to each model.',
+    ['model'], multiprocess_mode='max')
+HEDGED_CALLS = Counter(
+    'http_proxy_hedged_calls_total', 'Calls to the model server sent a second time.',
+    ['model', 'method'])
+HEDGE_WINS = Counter(
+    'http_proxy_hedge_wins_total', 'Hedged calls by the copy answering first.',
+    ['model', 'method', 'winner'])
+ADMISSION_QUEUED = Gauge(
+    'http_proxy_admission_queued_requests', 'Requests waiting to be admitted.',
+    ['model'], multiprocess_mode='livesum')
+ADMISSION_SHED = Counter(
+    'http_proxy_admission_shed_total', 'Requests rejected by admission control.',
+    ['model', 'reason'])
+COALESCED_REQUESTS = Counter(
+    'http_proxy_coalesced_requests_total',
+    'Requests sharing the response of an identical request in flight.', ['model', 'method'])
+
+
+def enable_multiprocess(directory):
+  """Shares the metrics of all worker processes through files in directory.
+
+  Has to be called before forking and before any metric is updated. The
+  metrics left in directory by a previous run are removed.
+  """
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+  for path in glob.glob(os.path.join(directory, '*.db')):
+    os.remove(path)
+  os.environ['prometheus_multiproc_dir'] = directory
+  values.ValueClass = values.get_value_class()
+
+
+def exposition():
+  """Returns the content type and the text of the metrics of the proxy."""
+  if 'prometheus_multiproc_dir' in os.environ:
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+  else:
+    registry = REGISTRY
+  return CONTENT_TYPE_LATEST, generate_latest(registry)
+
+
+@contextmanager
+def timed(model, method, phase):
+  """Observes the time spent in the block as the given phase of a request."""
+  start = time.time()
+  try:
+    yield
+  finally:
+    PHASE_SECONDS.labels(model, method, phase).observe(time.time() - start)
+
+
+@contextmanager
+def recorded(phases, phase):
+  """Adds the time spent in the block to the dict phases.
+
+  For code running where metrics can not be updated, like another process.
+  """
+  start = time.time()
+  try:
+    yield
+  finally:
+    phases[phase] = phases.get(phase, 0.0) + time.time() - start
+
+
+def observe_phases(model, method, phases):
+  """Observes the durations recorded in a dict from phase to seconds."""
+  for phase, seconds in phases.items():
+    PHASE_SECONDS.labels(model, method, phase).observe(seconds)
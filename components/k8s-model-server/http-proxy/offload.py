@@ -0,0 +1,92 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs the CPU heavy stages of large requests off the IOLoop thread.
+
+Decoding a large body, or encoding a large response, blocks every other
+request served by the process. Such stages are submitted to an executor
+instead. With a thread pool, the IOLoop keeps serving other requests in
+between, as the GIL is switched periodically, and work releasing the GIL
+runs in parallel. A process pool also runs python code in parallel, at the
+cost of pickling arguments and results. Stages of small requests still run
+inline, where they are cheaper than a round trip to the executor.
+
+Functions run in a process pool have to be picklable, and so do their
+arguments and results.
+"""
+
+import sys
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from tornado import gen
+
+
+THREAD_EXECUTOR = 'thread'
+PROCESS_EXECUTOR = 'process'
+
+
+def create_executor(kind, max_workers):
+  """Returns a thread or a process pool executor.
+
+  Raises:
+    ValueError: when kind is neither THREAD_EXECUTOR nor PROCESS_EXECUTOR.
+  """
+  if kind == THREAD_EXECUTOR:
+    return ThreadPoolExecutor(max_workers)
+  if kind == PROCESS_EXECUTOR:
+    return ProcessPoolExecutor(max_workers)
+  raise ValueError('Unknown executor: %s' % kind)
+
+
+class Offloader(object):
+  """Runs functions in an executor when their input is large enough.
+
+  Args:
+    executor: A concurrent.futures executor, or None to run everything inline.
+    min_bytes: Size from which functions are run in the executor.
+
+    Usage::
+
+      offloader = Offloader(ThreadPoolExecutor(4), min_bytes=1 << 20)
+
+      @coroutine
+      def my_fn(body):
+        data = yield offloader.run(len(body), json.loads, body)
+  """
+
+  def __init__(self, executor=None, min_bytes=1 << 20):
+    self.executor = executor
+    self.min_bytes = min_bytes
+    self.inline = 0
+    self.offloaded = 0
+
+  def stats(self):
+    return dict(inline=self.inline, offloaded=self.offloaded)
+
+  def run(self, size, fn, *args):
+    """Calls fn(*args), in the executor when size is at least min_bytes.
+
+    Returns:
+      A future resolving to the result of the call.
+    """
+    if self.executor is None or size < self.min_bytes:
+      self.inline += 1
+      future = gen.Future()
+      try:
+        future.set_result(fn(*args))
+      except Exception:
+        future.set_exc_info(sys.exc_info())
+      return future
+    self.offloaded += 1
+    return self.executor.submit(fn, *args)
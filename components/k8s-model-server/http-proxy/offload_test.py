@@ -0,0 +1,69 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import threading
+
+import pytest
+
+from json_codec import get_codec
+from offload import create_executor, Offloader, PROCESS_EXECUTOR, THREAD_EXECUTOR
+from server import parse_predict_request
+from server_test import doubling_signature_map
+
+
+def current_thread_name():
+    return threading.current_thread().name
+
+def fail():
+    raise ValueError('invalid')
+
+@pytest.mark.gen_test
+def test_small_inputs_run_inline():
+    offloader = Offloader(create_executor(THREAD_EXECUTOR, 1), min_bytes=100)
+    name = yield offloader.run(99, current_thread_name)
+    assert name == threading.current_thread().name
+    assert offloader.stats() == {'inline': 1, 'offloaded': 0}
+
+@pytest.mark.gen_test
+def test_large_inputs_are_offloaded():
+    offloader = Offloader(create_executor(THREAD_EXECUTOR, 1), min_bytes=100)
+    name = yield offloader.run(100, current_thread_name)
+    assert name != threading.current_thread().name
+    assert offloader.stats() == {'inline': 0, 'offloaded': 1}
+
+@pytest.mark.gen_test
+@pytest.mark.parametrize('min_bytes', [0, 100])
+def test_errors(min_bytes):
+    offloader = Offloader(create_executor(THREAD_EXECUTOR, 1), min_bytes=min_bytes)
+    with pytest.raises(ValueError):
+        yield offloader.run(10, fail)
+
+@pytest.mark.gen_test
+def test_process_executor():
+    offloader = Offloader(create_executor(PROCESS_EXECUTOR, 1), min_bytes=0)
+    body = json.dumps({'instances': [{'x': 1.0}, {'x': 2.0}]})
+    request, num_rows, output_format, instances, phases = yield offloader.run(
+        len(body), parse_predict_request, body, 'application/json', {}, 'double', '2',
+        doubling_signature_map(), 'instances', get_codec(), False)
+    assert request.model_spec.name == 'double'
+    assert request.model_spec.version.value == 2
+    assert num_rows == 2
+    assert instances is None
+    assert set(phases) == {'decode', 'encode'}
+    offloader.executor.shutdown()
+
+def test_unknown_executor():
+    with pytest.raises(ValueError):
+        create_executor('fiber', 1)
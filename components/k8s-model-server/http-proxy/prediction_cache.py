@@ -0,0 +1,219 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bounded LRU cache of predictions, per instance.
+
+Every instance of a PredictRequest is keyed by a hash of the model spec
+(name, version and signature), the output filter and the values of the
+instance for every input. Only the instances missing from the cache are sent
+to the model server, and the response is assembled from the cached and the
+fresh rows. Models answering with outputs which can not be split into rows
+are not cached anymore once they did.
+"""
+
+from collections import OrderedDict
+import hashlib
+import logging
+import time
+
+from tensorflow_serving.apis import predict_pb2
+from tornado import gen
+import numpy as np
+
+from batching import batch_size
+import metrics
+from tensor_codec import ndarray_to_tensor_proto, tensor_proto_to_ndarray
+
+
+# Bookkeeping bytes accounted for every entry, on top of its arrays.
+ENTRY_OVERHEAD_BYTES = 200
+
+
+def _row_size(row):
+  size = ENTRY_OVERHEAD_BYTES
+  for _, _, array in row:
+    size += array.nbytes
+    if array.dtype == object:
+      size += sum(len(v) for v in array.ravel().tolist())
+  return size
+
+
+def take_rows(request, indices):
+  """Returns a copy of a PredictRequest with only the given instances."""
+  selected = predict_pb2.PredictRequest()
+  selected.model_spec.CopyFrom(request.model_spec)
+  selected.output_filter.extend(request.output_filter)
+  for name, tensor in request.inputs.items():
+    array = tensor_proto_to_ndarray(tensor)[indices]
+    selected.inputs[name].CopyFrom(ndarray_to_tensor_proto(array, tensor.dtype))
+  return selected
+
+
+class PredictionCache(object):
+  """Caches the outputs of every instance sent to the model server.
+
+  Args:
+    max_bytes: The size budget of the cache. Least recently used entries are
+               evicted beyond it.
+    ttl: Seconds for which an entry is served.
+    models: Names of the models whose predictions are cached, or None to cache
+            the predictions of every model.
+    clock: Function returning the current time in seconds.
+
+    Usage::
+
+      cache = PredictionCache(max_bytes=64 << 20, ttl=60)
+
+      @coroutine
+      def my_fn(request):
+        response = yield cache.predict(request, send_predict_request)
+  """
+
+  def __init__(self, max_bytes, ttl=60.0, models=None, clock=time.time):
+    self.max_bytes = max_bytes
+    self.ttl = ttl
+    self.models = frozenset(models) if models else None
+    self._clock = clock
+    self._entries = OrderedDict()
+    # Models whose outputs do not have one row per instance.
+    self._unbatched = set()
+    self.bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def enabled(self, model_name):
+    """Returns whether the predictions of a model are cached."""
+    if model_name in self._unbatched:
+      return False
+    return self.models is None or model_name in self.models
+
+  def stats(self):
+    return dict(entries=len(self._entries), bytes=self.bytes, hits=self.hits,
+                misses=self.misses, evictions=self.evictions)
+
+  def row_keys(self, request):
+    """Returns the cache key of every instance of a PredictRequest.
+
+    Returns:
+      A list with one key per instance, or None when the request has no batch
+      dimension.
+    """
+    num_rows = batch_size(request)
+    if num_rows is None:
+      return None
+    prefix = hashlib.sha1(request.model_spec.SerializeToString())
+    for name in request.output_filter:
+      prefix.update(b'\0' + name.encode('utf-8'))
+    hashes = [prefix.copy() for _ in range(num_rows)]
+    for name in sorted(request.inputs):
+      tensor = request.inputs[name]
+      array = tensor_proto_to_ndarray(tensor)
+      header = ('\0%s\0%d\0%s\0' % (name, tensor.dtype, array.shape[1:])).encode('utf-8')
+      if array.dtype == object:
+        rows = [repr(row).encode('utf-8') for row in array.tolist()]
+      else:
+        rows = np.ascontiguousarray(array).reshape(num_rows, -1)
+      for h, row in zip(hashes, rows):
+        h.update(header)
+        h.update(row if isinstance(row, bytes) else row.tobytes())
+    return [h.digest() for h in hashes]
+
+  def get(self, key):
+    """Returns the cached row for key, or None."""
+    entry = self._entries.pop(key, None)
+    if entry is None:
+      self.misses += 1
+      return None
+    expires_at, size, row = entry
+    if expires_at <= self._clock():
+      self.bytes -= size
+      self.misses += 1
+      return None
+    self._entries[key] = entry
+    self.hits += 1
+    return row
+
+  def put(self, key, row):
+    """Caches a row, a list of (output name, dtype, array) triples."""
+    size = _row_size(row)
+    if size > self.max_bytes:
+      return
+    previous = self._entries.pop(key, None)
+    if previous is not None:
+      self.bytes -= previous[1]
+    self._entries[key] = (self._clock() + self.ttl, size, row)
+    self.bytes += size
+    while self.bytes > self.max_bytes:
+      _, (_, evicted_size, _) = self._entries.popitem(last=False)
+      self.bytes -= evicted_size
+      self.evictions += 1
+
+  @gen.coroutine
+  def predict(self, request, send):
+    """Answers a PredictRequest from the cache, sending only the misses.
+
+    Args:
+      request: The PredictRequest.
+      send: Function sending a PredictRequest to the model server and
+            returning a future of its PredictResponse.
+
+    Returns:
+      A future resolving to the PredictResponse of the whole request.
+    """
+    model_name = request.model_spec.name
+    keys = None if model_name in self._unbatched else self.row_keys(request)
+    if keys is None:
+      response = yield send(request)
+      raise gen.Return(response)
+
+    rows = [self.get(key) for key in keys]
+    missing = [i for i, row in enumerate(rows) if row is None]
+    metrics.PREDICTION_CACHE_INSTANCES.labels(model_name, 'hit').inc(len(rows) - len(missing))
+    metrics.PREDICTION_CACHE_INSTANCES.labels(model_name, 'miss').inc(len(missing))
+    if not missing:
+      raise gen.Return(self._assemble(request, rows))
+
+    if len(missing) == len(rows):
+      response = yield send(request)
+    else:
+      response = yield send(take_rows(request, missing))
+
+    outputs = [(name, tensor.dtype, tensor_proto_to_ndarray(tensor))
+               for name, tensor in sorted(response.outputs.items())]
+    if any(not array.ndim or array.shape[0] != len(missing) for _, _, array in outputs):
+      # Outputs without batch dimension can not be split into rows, nor
+      # answer the instances which were not sent.
+      logging.warn("Predictions of model %s can not be split into rows, they are not cached anymore",
+                   model_name)
+      self._unbatched.add(model_name)
+      if len(missing) != len(rows):
+        response = yield send(request)
+      raise gen.Return(response)
+    for j, i in enumerate(missing):
+      rows[i] = [(name, dtype, np.array(array[j])) for name, dtype, array in outputs]
+      self.put(keys[i], rows[i])
+
+    if len(missing) == len(rows):
+      raise gen.Return(response)
+    response = self._assemble(request, rows)
+    raise gen.Return(response)
+
+  def _assemble(self, request, rows):
+    response = predict_pb2.PredictResponse()
+    response.model_spec.CopyFrom(request.model_spec)
+    for k, (name, dtype, _) in enumerate(rows[0]):
+      array = np.stack([row[k][2] for row in rows])
+      response.outputs[name].CopyFrom(ndarray_to_tensor_proto(array, dtype))
+    return response
@@ -0,0 +1,127 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+import tensorflow as tf
+from tensorflow.core.framework import types_pb2
+from tensorflow_serving.apis import predict_pb2
+from tornado import gen
+
+from prediction_cache import PredictionCache
+
+
+class DoublingBackend(object):
+    """Fake model server answering y = 2 * x, recording the rows it got."""
+
+    def __init__(self):
+        self.rows = []
+        self.scalar = False
+
+    def __call__(self, request):
+        x = tf.make_ndarray(request.inputs['x'])
+        self.rows.append(x.tolist())
+        response = predict_pb2.PredictResponse()
+        response.outputs['y'].CopyFrom(tf.make_tensor_proto(x * 2))
+        if self.scalar:
+            # An output without batch dimension, like a count of instances.
+            response.outputs['n'].CopyFrom(tf.make_tensor_proto(len(x)))
+        future = gen.Future()
+        future.set_result(response)
+        return future
+
+
+def make_request(rows, model='m'):
+    request = predict_pb2.PredictRequest()
+    request.model_spec.name = model
+    request.inputs['x'].CopyFrom(tf.make_tensor_proto(np.asarray(rows, dtype=np.float32)))
+    return request
+
+
+def predictions(response):
+    return tf.make_ndarray(response.outputs['y']).tolist()
+
+
+def test_row_keys():
+    cache = PredictionCache(max_bytes=1 << 20)
+    first = cache.row_keys(make_request([[1, 2], [3, 4], [1, 2]]))
+    assert first[0] == first[2] != first[1]
+    assert cache.row_keys(make_request([[1, 2]], model='other'))[0] != first[0]
+
+
+@pytest.mark.gen_test
+def test_only_misses_are_sent():
+    backend = DoublingBackend()
+    cache = PredictionCache(max_bytes=1 << 20)
+    response = yield cache.predict(make_request([[1, 2], [3, 4]]), backend)
+    assert predictions(response) == [[2, 4], [6, 8]]
+
+    response = yield cache.predict(make_request([[3, 4], [5, 6], [1, 2]]), backend)
+    assert predictions(response) == [[6, 8], [10, 12], [2, 4]]
+    assert backend.rows == [[[1, 2], [3, 4]], [[5, 6]]]
+    assert response.outputs['y'].dtype == types_pb2.DT_FLOAT
+
+    response = yield cache.predict(make_request([[5, 6]]), backend)
+    assert predictions(response) == [[10, 12]]
+    assert len(backend.rows) == 2
+    assert cache.stats()['hits'] == 3
+    assert cache.stats()['misses'] == 3
+
+
+@pytest.mark.gen_test
+def test_outputs_without_batch_dimension_are_not_cached():
+    backend = DoublingBackend()
+    cache = PredictionCache(max_bytes=1 << 20)
+    yield cache.predict(make_request([[1, 2]]), backend)
+    backend.scalar = True
+    response = yield cache.predict(make_request([[1, 2], [3, 4]]), backend)
+    # The partial response can not answer the cached instance, the whole request is sent.
+    assert backend.rows == [[[1, 2]], [[3, 4]], [[1, 2], [3, 4]]]
+    assert predictions(response) == [[2, 4], [6, 8]]
+    assert tf.make_ndarray(response.outputs['n']) == 2
+    assert not cache.enabled('m')
+
+    yield cache.predict(make_request([[1, 2]]), backend)
+    assert backend.rows[-1] == [[1, 2]]
+    assert len(backend.rows) == 4
+
+
+@pytest.mark.gen_test
+def test_entries_expire():
+    clock = [0]
+    backend = DoublingBackend()
+    cache = PredictionCache(max_bytes=1 << 20, ttl=10, clock=lambda: clock[0])
+    yield cache.predict(make_request([[1, 2]]), backend)
+    clock[0] = 11
+    yield cache.predict(make_request([[1, 2]]), backend)
+    assert len(backend.rows) == 2
+
+
+@pytest.mark.gen_test
+def test_least_recently_used_entries_are_evicted():
+    backend = DoublingBackend()
+    cache = PredictionCache(max_bytes=1000)
+    for i in range(20):
+        yield cache.predict(make_request([[i, i]]), backend)
+    assert cache.bytes <= 1000
+    assert cache.stats()['evictions'] > 0
+    yield cache.predict(make_request([[19, 19]]), backend)
+    assert len(backend.rows) == 20
+
+
+def test_enabled_models():
+    assert PredictionCache(max_bytes=1).enabled('any')
+    cache = PredictionCache(max_bytes=1, models=['a'])
+    assert cache.enabled('a')
+    assert not cache.enabled('b')
@@ -0,0 +1,162 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Binary request bodies accepted by the predict route.
+
+Besides json, clients can post:
+
+- a serialized `PredictRequest` (`application/x-protobuf`), forwarded as is,
+- a `.npy` array (`application/x-npy`), for signatures with a single input,
+- a `.npz` archive (`application/x-npz`), with one array per input,
+- an Arrow IPC stream (`application/vnd.apache.arrow.stream`), with one
+  column per input. This needs `pyarrow` to be installed.
+
+Array formats are decoded into a dict from input name to NumPy array, batch
+dimension first. Json bodies carry binary values as `{"b64": "..."}` objects.
+"""
+
+import base64
+import io
+import zipfile
+import zlib
+
+import numpy as np
+
+try:
+  import pyarrow
+except ImportError:
+  pyarrow = None
+
+
+JSON_CONTENT_TYPE = 'application/json'
+PROTOBUF_CONTENT_TYPE = 'application/x-protobuf'
+NPY_CONTENT_TYPE = 'application/x-npy'
+NPZ_CONTENT_TYPE = 'application/x-npz'
+ARROW_CONTENT_TYPE = 'application/vnd.apache.arrow.stream'
+B64_KEY = 'b64'
+
+
+def media_type(content_type):
+  """Returns the lower case media type of a Content-Type header value."""
+  return (content_type or '').split(';', 1)[0].strip().lower()
+
+
+def accepts(accept, content_type):
+  """Returns whether an Accept header value explicitly lists content_type."""
+  return content_type in [media_type(t) for t in (accept or '').split(',')]
+
+
+def has_b64(text):
+  """Returns whether a json text may hold {"b64": "..."} objects.
+
+  Lets decoding skip walking bodies without any. Keys written with escape
+  sequences are not detected.
+  """
+  return b'"b64"' in text
+
+
+def decode_b64_if_needed(data):
+  """Decodes the {"b64": "..."} objects nested in a decoded json value."""
+  if isinstance(data, list):
+    return [decode_b64_if_needed(val) for val in data]
+  elif isinstance(data, dict):
+    if data.viewkeys() == {B64_KEY}:
+      return base64.b64decode(data[B64_KEY])
+    else:
+      return {k: decode_b64_if_needed(v) for k, v in data.iteritems()}
+  else:
+    return data
+
+
+def decode_npy(body, inputs, input_name=None):
+  """Decodes a .npy body into the only input of a signature.
+
+  Args:
+    body: The request body.
+    inputs: The `inputs` map of the signature used.
+    input_name: The input to feed, required when the signature has several.
+
+  Returns:
+    A dict from input name to array.
+
+  Raises:
+    ValueError: when the body is not a valid .npy array or when the input to
+    feed can not be determined.
+  """
+  if input_name is None:
+    if len(inputs) != 1:
+      raise ValueError("Signature has %d inputs, the input name is required "
+                       "for .npy requests." % len(inputs))
+    input_name = list(inputs.keys())[0]
+  try:
+    array = np.load(io.BytesIO(body), allow_pickle=False)
+  except IOError as e:
+    raise ValueError(str(e))
+  if not isinstance(array, np.ndarray):
+    raise ValueError("Request body is a .npz archive, not a .npy array.")
+  return {input_name: array}
+
+
+def decode_npz(body):
+  """Decodes a .npz body into a dict from input name to array.
+
+  Raises:
+    ValueError: when the body is not a valid .npz archive.
+  """
+  try:
+    archive = np.load(io.BytesIO(body), allow_pickle=False)
+    if not hasattr(archive, 'files'):
+      raise ValueError("Request body is a .npy array, not a .npz archive.")
+    # The arrays of an archive are only read when accessed.
+    return dict((name, archive[name]) for name in archive.files)
+  except (IOError, EOFError, zipfile.BadZipfile, zlib.error) as e:
+    raise ValueError("Request body is not a valid .npz archive: %s" % e)
+
+
+def _arrow_chunk_to_ndarray(chunk):
+  try:
+    # Primitive arrays without nulls are viewed without copying.
+    return chunk.to_numpy()
+  except NotImplementedError:
+    pass
+  # Lists and strings are converted through python, not pandas which may not
+  # be installed.
+  values = chunk.to_pylist()
+  array = np.array(values)
+  if array.dtype.kind in 'SU':
+    # Unlike fixed size NumPy strings, objects keep trailing null bytes.
+    array = np.array(values, dtype=object)
+  return array
+
+
+def _arrow_column_to_ndarray(column):
+  chunks = column.data.chunks if hasattr(column, 'data') else column.chunks
+  parts = [_arrow_chunk_to_ndarray(chunk) for chunk in chunks]
+  return np.concatenate(parts) if len(parts) != 1 else parts[0]
+
+
+def decode_arrow(body):
+  """Decodes an Arrow IPC stream into a dict from column name to array.
+
+  Raises:
+    ValueError: when pyarrow is not installed or the stream is not valid.
+  """
+  if pyarrow is None:
+    raise ValueError("Arrow requests need pyarrow to be installed.")
+  try:
+    table = pyarrow.ipc.open_stream(pyarrow.py_buffer(body)).read_all()
+  except pyarrow.ArrowException as e:
+    raise ValueError(str(e))
+  return dict((name, _arrow_column_to_ndarray(column))
+              for name, column in zip(table.schema.names, table.columns))
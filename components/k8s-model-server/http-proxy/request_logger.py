@@ -0,0 +1,215 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Request logging off the IOLoop thread.
+
+Sampled instances are put in a bounded queue and written by a background
+thread, one json object per line, in batches: the thread takes everything
+queued so far, writes it with a single call and flushes once. Instances are
+dropped, and counted, when the queue is full, so that a slow disk never
+becomes request latency, and when they can not be encoded as json.
+
+The log file is rotated like `logging.handlers.RotatingFileHandler` does, so
+that it can still be tailed by fluentd. With `compress`, the file is gzipped
+instead, every batch being sync flushed so that it can be decompressed as soon
+as it is written.
+"""
+
+import gzip
+import json
+import logging
+import os
+import random
+import threading
+
+try:
+  import Queue as queue
+except ImportError:
+  import queue
+
+import numpy as np
+
+import metrics
+
+
+def sample_instances(instances, prob):
+  """Returns the instances of a request kept with probability prob each.
+
+  The number of instances kept is drawn once per request, so that requests
+  with nothing to log, the vast majority at low rates, cost a single draw.
+  """
+  count = np.random.binomial(len(instances), prob)
+  if not count:
+    return []
+  if count == len(instances):
+    return list(instances)
+  return random.sample(instances, count)
+
+
+def worker_path(path, worker_id):
+  """Returns the path of a file of one worker process, like request-0.log.
+
+  Workers forked with --num_processes each write their own request log, so
+  that they neither rotate the file another worker writes nor interleave
+  their gzip streams.
+  """
+  if worker_id is None:
+    return path
+  root, ext = os.path.splitext(path)
+  return '%s-%d%s' % (root, worker_id, ext)
+
+
+class RequestLogger(object):
+  """Writes instances to a rotated log file from a background thread.
+
+  Args:
+    path: The log file.
+    max_bytes: Size beyond which the log file is rotated.
+    backup_count: Number of rotated files kept, as path.1, path.2...
+    queue_size: Maximum number of batches of instances waiting to be written.
+    max_batch: Maximum number of batches written at once.
+    compress: Whether to gzip the log file, named path.gz then.
+
+    Usage::
+
+      request_logger = RequestLogger('/tmp/logs/request.log')
+      request_logger.start()
+      request_logger.log(sample_instances(instances, 0.01))
+  """
+
+  def __init__(self, path, max_bytes=1000000, backup_count=1, queue_size=10000,
+               max_batch=1000, compress=False):
+    self.path = path + '.gz' if compress else path
+    self.max_bytes = max_bytes
+    self.backup_count = backup_count
+    self.max_batch = max_batch
+    self.compress = compress
+    self._queue = queue.Queue(queue_size)
+    self._thread = None
+    self._file = None
+    self.written = 0
+    self.dropped = 0
+    self.flushes = 0
+    self.rotations = 0
+
+  def start(self):
+    directory = os.path.dirname(self.path)
+    if directory and not os.path.isdir(directory):
+      os.makedirs(directory)
+    self._open()
+    self._thread = threading.Thread(target=self._run, name='RequestLogger')
+    self._thread.daemon = True
+    self._thread.start()
+
+  def close(self):
+    """Writes the instances queued so far and stops the background thread."""
+    if self._thread is not None:
+      self._queue.put(None)
+      self._thread.join()
+      self._thread = None
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
+  def stats(self):
+    return dict(queued=self._queue.qsize(), written=self.written,
+                dropped=self.dropped, flushes=self.flushes, rotations=self.rotations)
+
+  def log(self, instances):
+    """Queues instances to be written, without ever blocking.
+
+    Returns:
+      Whether the instances were queued, they are dropped when the queue is
+      full.
+    """
+    if not instances:
+      return True
+    try:
+      self._queue.put_nowait(instances)
+    except queue.Full:
+      self._drop(len(instances))
+      return False
+    return True
+
+  def _drop(self, count):
+    self.dropped += count
+    metrics.REQUEST_LOG_INSTANCES.labels('dropped').inc(count)
+
+  def _open(self):
+    if self.compress:
+      self._file = gzip.open(self.path, 'ab')
+    else:
+      self._file = open(self.path, 'ab')
+
+  def _rotate(self):
+    self._file.close()
+    for i in range(self.backup_count - 1, 0, -1):
+      source = '%s.%d' % (self.path, i)
+      if os.path.exists(source):
+        os.rename(source, '%s.%d' % (self.path, i + 1))
+    if self.backup_count > 0:
+      os.rename(self.path, self.path + '.1')
+    else:
+      os.remove(self.path)
+    self._open()
+    self.rotations += 1
+
+  def _run(self):
+    stopping = False
+    while not stopping:
+      batches = [self._queue.get()]
+      while len(batches) < self.max_batch:
+        try:
+          batches.append(self._queue.get_nowait())
+        except queue.Empty:
+          break
+      if None in batches:
+        stopping = True
+        batches = [b for b in batches if b is not None]
+      lines = self._encode(batches)
+      try:
+        self._write(lines)
+      except Exception as e:
+        logging.warn("Could not write %d logged instances: %s", len(lines), e)
+        self._drop(len(lines))
+
+  def _encode(self, batches):
+    """Encodes every instance on its own, dropping those json can not encode."""
+    lines = []
+    failed = 0
+    for instances in batches:
+      for instance in instances:
+        try:
+          lines.append(json.dumps(instance))
+        except (TypeError, ValueError, OverflowError):
+          failed += 1
+    if failed:
+      logging.warn("Dropped %d logged instances which can not be encoded as json", failed)
+      self._drop(failed)
+    return lines
+
+  def _write(self, lines):
+    if not lines:
+      return
+    data = ('\n'.join(lines) + '\n').encode('utf-8')
+    self._file.write(data)
+    self._file.flush()
+    self.flushes += 1
+    self.written += len(lines)
+    metrics.REQUEST_LOG_INSTANCES.labels('written').inc(len(lines))
+    if self.max_bytes > 0 and os.path.getsize(self.path) >= self.max_bytes:
+      try:
+        self._rotate()
+      except (IOError, OSError) as e:
+        logging.warn("Could not rotate the request log: %s", e)
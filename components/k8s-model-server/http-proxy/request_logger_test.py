@@ -0,0 +1,91 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import json
+import os
+
+import numpy as np
+
+from request_logger import RequestLogger, sample_instances, worker_path
+
+
+def read_lines(path, opener=open):
+    with opener(path, 'rb') as f:
+        return [json.loads(line) for line in f.read().decode('utf-8').splitlines()]
+
+def test_sample_instances():
+    instances = list(range(100))
+    assert sample_instances(instances, 0.0) == []
+    assert sample_instances(instances, 1.0) == instances
+    np.random.seed(0)
+    sampled = sample_instances(instances, 0.1)
+    assert 0 < len(sampled) < 100
+    assert set(sampled) <= set(instances)
+
+def test_logs_instances(tmpdir):
+    path = str(tmpdir.join('logs', 'request.log'))
+    logger = RequestLogger(path)
+    logger.start()
+    assert logger.log([{'x': 1}, {'x': 2}])
+    assert logger.log([])
+    assert logger.log([{'x': 3}])
+    logger.close()
+    assert read_lines(path) == [{'x': 1}, {'x': 2}, {'x': 3}]
+    assert logger.stats()['written'] == 3
+
+def test_drops_instances_json_can_not_encode(tmpdir):
+    path = str(tmpdir.join('request.log'))
+    logger = RequestLogger(path)
+    logger.start()
+    logger.log([{'x': 1}, {'x': object()}, {'x': 2}])
+    logger.close()
+    assert read_lines(path) == [{'x': 1}, {'x': 2}]
+    assert logger.stats()['written'] == 2
+    assert logger.stats()['dropped'] == 1
+
+def test_drops_when_full(tmpdir):
+    logger = RequestLogger(str(tmpdir.join('request.log')), queue_size=1)
+    # Not started, nothing is written.
+    assert logger.log([{'x': 1}])
+    assert not logger.log([{'x': 2}, {'x': 3}])
+    assert logger.stats()['dropped'] == 2
+    assert logger.stats()['queued'] == 1
+
+def test_rotates(tmpdir):
+    path = str(tmpdir.join('request.log'))
+    logger = RequestLogger(path, max_bytes=1, backup_count=2)
+    logger.start()
+    for i in range(3):
+        logger.log([{'x': i}])
+        logger.close()
+        logger.start()
+    logger.close()
+    assert read_lines(path + '.1') == [{'x': 2}]
+    assert read_lines(path + '.2') == [{'x': 1}]
+    assert not os.path.exists(path + '.3')
+    assert logger.stats()['rotations'] == 3
+
+def test_compress(tmpdir):
+    path = str(tmpdir.join('request.log'))
+    logger = RequestLogger(path, compress=True)
+    logger.start()
+    logger.log([{'x': 1}])
+    logger.close()
+    assert read_lines(path + '.gz', gzip.open) == [{'x': 1}]
+
+def test_worker_path():
+    assert worker_path('/tmp/logs/request.log', None) == '/tmp/logs/request.log'
+    assert worker_path('/tmp/logs/request.log', 2) == '/tmp/logs/request-2.log'
+    assert worker_path('/tmp/logs/request.log.pos', 0) == '/tmp/logs/request.log-0.pos'
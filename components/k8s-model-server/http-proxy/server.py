@@ -16,274 +16,887 @@
 
 from __future__ import print_function
 
+import tf_protos
+
+if __name__ == "__main__":
+  # Serving only needs the protos of TensorFlow, see tf_protos.
+  tf_protos.skip_tensorflow_init()
+
+from functools import partial
+import hashlib
 from itertools import repeat
-import base64
-import json
 import logging
-import random
+import os
+import tempfile
+import time
 
 from google.protobuf.json_format import MessageToDict
+from google.protobuf.message import DecodeError
 import grpc
 from grpc.beta import implementations
-import numpy as np
 from tensorflow_serving.apis import classification_pb2
-from tensorflow_serving.apis import input_pb2
 from tensorflow_serving.apis import predict_pb2
 from tensorflow_serving.apis import prediction_service_pb2
-from tensorflow_serving.apis import get_model_metadata_pb2
 from tornado import gen
+from tornado.httpserver import HTTPServer
 from tornado.ioloop import IOLoop
+from tornado.netutil import bind_sockets
+from tornado.process import fork_processes
 from tornado.options import define, options, parse_command_line
-import tensorflow as tf
-from tensorflow.python.saved_model import signature_constants
+from tornado.util import basestring_type
 import tornado.web
 
+from admission import AdmissionController, Overloaded, parse_limits, UNKNOWN_MODELS
+from backend_pool import BackendPool
+from batching import PredictBatcher, batch_size
+from coalescing import SingleFlight
+from deadlines import parse_timeouts, RpcTimeouts
+from example_codec import feature_kinds, fill_example_list, serialize_example_list
+from hedging import Hedger
+from json_codec import get_codec
+import metrics
+from metrics import recorded
+from offload import create_executor, Offloader
+from prediction_cache import PredictionCache
+from request_logger import RequestLogger, sample_instances, worker_path
+from request_formats import (accepts, decode_arrow, decode_b64_if_needed, decode_npy,
+                             decode_npz, has_b64, media_type, ARROW_CONTENT_TYPE, NPY_CONTENT_TYPE,
+                             NPZ_CONTENT_TYPE, PROTOBUF_CONTENT_TYPE)
+from signature_cache import get_input_plan, get_signature, SignatureCache
+from stats import StatsReporter
+from streaming import PredictBodyParser
+from tensor_codec import decode_outputs, encode_arrays
+from tornado_grpc import fwrap, rpc_status_code
+from warmup import parse_models, Warmer
+
 
 define("port", default=8888, help="run on the given port", type=int)
+define("num_processes", default=1, help="number of worker processes serving the port, 0 for one per cpu", type=int)
+define("reuse_port", default=False, help="bind the port in every worker with SO_REUSEPORT instead of sharing the socket bound before forking")
+define("stats_dir", default='', help="directory where workers share their stats, defaults to a temporary directory in multi-process mode", type=str)
 define("rpc_timeout", default=1.0, help="seconds for time out rpc request", type=float)
+define("rpc_model_timeouts", default='', help="comma separated model:seconds timeouts overriding rpc_timeout", type=str)
+define("adaptive_rpc_timeout", default=False, help="whether to derive the timeout of the calls to each model from the latencies of its recent calls")
+define("adaptive_timeout_percentile", default=99.0, help="percentile of the latencies of a model its adaptive timeout derives from", type=float)
+define("adaptive_timeout_multiplier", default=2.0, help="ratio between the adaptive timeout of a model and that percentile of its latencies", type=float)
+define("adaptive_timeout_min", default=0.05, help="seconds below which adaptive timeouts are not lowered", type=float)
+define("adaptive_timeout_max", default=10.0, help="seconds beyond which adaptive timeouts are not raised", type=float)
+define("deadline_header", default='X-Request-Timeout-Ms', help="request header in which clients pass the milliseconds they wait for the response", type=str)
 define("rpc_port", default=9000, help="tf serving on the given port", type=int)
 define("rpc_address", default='localhost', help="tf serving on the given address", type=str)
+define("rpc_backends", default='', help="comma separated host:port addresses of tf serving backends, defaults to rpc_address:rpc_port", type=str)
+define("rpc_resolve_interval", default=0.0, help="seconds between resolutions of rpc_address into all of its tf serving backends (e.g. a headless service), 0 to disable", type=float)
+define("grpc_engine", default='beta', help="grpc API of the calls to tf serving: beta for the stub of grpc.beta, or ga for the stub generated for the GA API", type=str)
+define("rpc_channels_per_backend", default=2, help="number of grpc channels opened to each tf serving backend", type=int)
+define("rpc_max_failures", default=3, help="consecutive unavailable errors after which a tf serving backend is ejected", type=int)
+define("rpc_ejection_sec", default=10.0, help="seconds for which an ejected tf serving backend is not used", type=float)
+define("hedge_percentile", default=0.0, help="percentile of the latencies of a model after which a second copy of a call is sent to another backend, 0 to disable hedging", type=float)
+define("hedge_min_delay_ms", default=5.0, help="milliseconds before which calls are never hedged", type=float)
+define("hedge_max_ratio", default=0.1, help="maximum ratio of the calls which are hedged", type=float)
 define("instances_key", default='instances', help="requested instances json object key")
+define("serialize_examples", default=True, help="whether to write the tf.Examples of classify requests in wire format rather than building their messages")
+define("offload_executor", default='', help="executor decoding and encoding large requests off the main thread, thread or process, none by default", type=str)
+define("offload_workers", default=4, help="number of threads or processes of the offload executor", type=int)
+define("offload_min_bytes", default=1 << 20, help="size from which requests and responses are decoded and encoded in the offload executor", type=int)
+define("max_body_mb", default=100.0, help="megabytes beyond which request bodies are rejected", type=float)
+define("coalesce_predictions", default=False, help="whether predict requests identical to one in flight share its response instead of calling the model server again")
+define("stream_request_body", default=None, help="whether to parse json predict bodies while they are received, by default unless an offload executor is set", type=bool)
+define("json_codec", default='auto', help="json library used for the bodies, ujson, simplejson or json, defaults to the fastest installed")
+define("max_concurrency_per_model", default=0, help="requests served at once per model, beyond which they wait in a queue, 0 for no limit", type=int)
+define("max_queue_per_model", default=64, help="requests waiting per model beyond which requests are shed", type=int)
+define("admission_queue_timeout_ms", default=0.0, help="milliseconds after which a waiting request is shed, 0 to wait until it is admitted", type=float)
+define("admission_limits", default='', help="comma separated model:concurrency:queue limits overriding max_concurrency_per_model and max_queue_per_model", type=str)
+define("shed_status_code", default=503, help="status of the responses to shed requests, 503 or 429", type=int)
+define("shed_retry_after_sec", default=1, help="seconds sent in the Retry-After header of the responses to shed requests", type=int)
+define("warmup_models", default='', help="comma separated model or model:version to warm up before reporting ready on /ready", type=str)
+define("warmup_requests", default=False, help="whether to send a synthetic predict request to every warm-up model")
+define("warmup_timeout_sec", default=300.0, help="seconds after which the proxy reports ready even if warm-up models are not available, 0 to wait until they are", type=float)
 define("debug", default=False, help="run in debug mode")
 define("log_request", default=False, help="whether to log requests")
 define("request_log_file", default="/tmp/logs/request.log")
 define("request_log_pos_file", default="/tmp/logs/request.log.pos")
 define("request_log_prob", default=0.01, help="probability to log the request (will be sampled uniformly)")
-B64_KEY = 'b64'
+define("request_log_max_bytes", default=1000000, help="size beyond which the request log is rotated", type=int)
+define("request_log_backups", default=1, help="number of rotated request logs kept", type=int)
+define("request_log_queue_size", default=10000, help="maximum number of requests waiting to be logged, beyond which they are dropped", type=int)
+define("request_log_compress", default=False, help="whether to gzip the request log, written to request_log_file.gz")
+define("signature_cache_ttl", default=300.0, help="seconds after which model signatures are refreshed", type=float)
+define("signature_negative_ttl", default=5.0, help="seconds after which a failed model signature lookup is retried", type=float)
+define("prediction_cache_mb", default=0.0, help="megabytes of predictions to cache, 0 to disable the prediction cache", type=float)
+define("prediction_cache_ttl", default=60.0, help="seconds for which a cached prediction is served", type=float)
+define("prediction_cache_models", default='', help="comma separated models whose predictions are cached, defaults to all models", type=str)
+define("batching", default=False, help="whether to merge concurrent predict requests into batches")
+define("max_batch_size", default=32, help="maximum number of instances in a merged predict request", type=int)
+define("batch_timeout_ms", default=5.0, help="milliseconds to wait for more requests before sending a batch", type=float)
+ROWS_FORMAT = 'rows'
+COLUMNS_FORMAT = 'columns'
+BINARY_CONTENT_TYPES = (PROTOBUF_CONTENT_TYPE, NPY_CONTENT_TYPE, NPZ_CONTENT_TYPE,
+                        ARROW_CONTENT_TYPE)
 WELCOME = "Hello World"
+DEFAULT_JSON_CODEC = get_codec()
 MODEL_SERVER_METADATA_TIMEOUT_SEC = 20
 
 
-DATA_TYPE = {
-    np.string_: lambda r: {'bytes_list': tf.train.BytesList(value=r)},
-    np.float64: lambda r: {'float_list': tf.train.FloatList(value=r)},
-    np.int64: lambda r: {'int64_list': tf.train.Int64List(value=r)}
-}
-
-
-def from_data_to_feature(data):
-  return tf.train.Feature(**DATA_TYPE[data.dtype.type](data))
+def prepare_classify_requests(instances, model_name, model_version, serialize=True):
+  """Builds the ClassificationRequest of json instances.
 
+  Args:
+    instances: A list of dicts from feature name to value or list of values.
+    model_name: The model to query.
+    model_version: The version to query, or None for the latest one.
+    serialize: Whether to write the examples in wire format rather than
+               building a message per example and feature.
 
-def prepare_classify_requests(instances, model_name, model_version):
+  Raises:
+    ValueError: when the instances can not be converted into tf.Examples.
+  """
   request = classification_pb2.ClassificationRequest()
   request.model_spec.name = model_name
 
   if model_version is not None:
-    request.model_spec.version = model_version
-
-  instance_examples = []
-  for instance in instances:
-    feature_dict = {}
-    for key, value in instance.items():
-      if not isinstance(value, list):
-        value = [value]
-      feature_dict[key] = from_data_to_feature(np.array(value).ravel())
-    instance_examples.append(tf.train.Example(features=tf.train.Features(feature=feature_dict)))
-
-  request.input.CopyFrom(input_pb2.Input(example_list=input_pb2.ExampleList(examples=instance_examples)))
+    request.model_spec.version.value = int(model_version)
+
+  kinds = feature_kinds(instances)
+  if serialize:
+    request.input.example_list.MergeFromString(serialize_example_list(instances, kinds))
+  else:
+    fill_example_list(request.input.example_list, instances, kinds)
+  request.input.example_list.SetInParent()
   return request
 
 
-#### START code took from https://github.com/grpc/grpc/wiki/Integration-with-tornado-(python)
+def _json_rows(array, num_rows, codec):
+  """Returns the json encoding of each of the first `num_rows` rows of array."""
+  if array.ndim == 0 or array.shape[0] != num_rows:
+    return repeat(codec.dumps_array(array), num_rows)
+  if array.dtype.kind in 'biuf' and array.ndim <= 2:
+    # Numbers never contain the separators, so the rows can be cut out of the
+    # encoding of the whole array.
+    encoded = codec.dumps_array(array)[1:-1]
+    if array.ndim == 1:
+      return encoded.split(',')
+    return ['[%s]' % row for row in encoded[1:-1].split('],[')]
+  return [codec.dumps(row) for row in array.tolist()]
 
-def _fwrap(f, gf):
-  try:
-    f.set_result(gf.result())
-  except Exception as e:
-    f.set_exception(e)
-
-
-def fwrap(gf, ioloop=None):
-  '''
-  Wraps a GRPC result in a future that can be yielded by tornado
-      
-    Usage::
-      
-      @coroutine
-      def my_fn(param):
-        result = yield fwrap(stub.function_name.future(param, timeout))
-  '''
-  f = gen.Future()
-
-  if ioloop is None:
-    ioloop = IOLoop.current()
-
-  gf.add_done_callback(lambda _: ioloop.add_callback(_fwrap, f, gf))
-  return f
-
-#### END code took from https://github.com/grpc/grpc/wiki/Integration-with-tornado-(python)
-
-def decode_b64_if_needed(data):
-  if isinstance(data, list):
-    return [decode_b64_if_needed(val) for val in data]
-  elif isinstance(data, dict):
-    if data.viewkeys() == {"b64"}:
-      return base64.b64decode(data["b64"])
-    else:
-      return {k: decode_b64_if_needed(v) for k, v in data.iteritems()}
-  else:
-    return data
 
-def get_signature_map(model_server_stub, model_name):
-  """ Gets tensorflow signature map from the model server stub.
+def encode_predictions(outputs, num_rows, output_format=ROWS_FORMAT, codec=None):
+  """Encodes the outputs of a predict call into the json response body.
 
   Args:
-    model_server_stub: The grpc stub to call GetModelMetadata.
-    model_name: The model name.
+    outputs: A list of (output name, array) pairs.
+    num_rows: The number of instances in the request.
+    output_format: ROWS_FORMAT to return one object per instance, or
+                   COLUMNS_FORMAT to return one array per output.
+    codec: The JsonCodec encoding the arrays, defaults to the fastest one.
 
   Returns:
-    The signature map of the model.
+    The json encoded response body.
   """
-  request = get_model_metadata_pb2.GetModelMetadataRequest()
-  request.model_spec.name = model_name
-  request.metadata_field.append("signature_def")
-  try:
-    response = model_server_stub.GetModelMetadata(request, MODEL_SERVER_METADATA_TIMEOUT_SEC)
-  except grpc.RpcError as rpc_error:
-    logging.exception("GetModelMetadata call to model server failed with code "
-                      "%s and message %s", rpc_error.code(),
-                      rpc_error.details())
-    return None
-
-  signature_def_map_proto = get_model_metadata_pb2.SignatureDefMap()
-  response.metadata["signature_def"].Unpack(signature_def_map_proto)
-  signature_def_map = signature_def_map_proto.signature_def
-  if not signature_def_map:
-    logging.error("Graph has no signatures.")
-
-  # Delete incomplete signatures without input dtypes.
-  invalid_signatures = []
-  for signature_name in signature_def_map:
-    for tensor in signature_def_map[signature_name].inputs.itervalues():
-      if not tensor.dtype:
-        logging.warn("Signature %s has incomplete dtypes, removing from "
-                     "usable signatures", signature_name)
-        invalid_signatures.append(signature_name)
-        break
-  for signature_name in invalid_signatures:
-    del signature_def_map[signature_name]
-
-  return signature_def_map
-
-def get_signature(signature_map, signature_name=None):
-  """Gets tensorflow signature for the given signature_name.
+  codec = codec or DEFAULT_JSON_CODEC
+  if output_format == COLUMNS_FORMAT:
+    columns = ','.join('%s:%s' % (codec.dumps(key), codec.dumps_array(array))
+                       for key, array in outputs)
+    return '{"predictions":{%s}}' % columns
 
-  Args:
-    signature_name: string The signature name to use to choose the signature
-                    from the signature map.
+  # Rows are assembled from the encoded values of each column through a
+  # single format string, without building a dict per instance.
+  template = '{%s}' % ','.join('%s:%%s' % codec.dumps(key).replace('%', '%%')
+                               for key, _ in outputs)
+  columns = [_json_rows(array, num_rows, codec) for _, array in outputs]
+  rows = [template % row for row in zip(*columns)]
+  return '{"predictions":[%s]}' % ','.join(rows)
 
-  Returns:
-    a pair of signature_name and signature. The first element is the
-    signature name in string that is actually used. The second one is the
-    signature.
+
+def check_version(version_name):
+  """Raises a 400 HTTPError when a model version is given and not a number."""
+  if version_name is not None and not version_name.isdigit():
+    raise tornado.web.HTTPError(400, "Model version must be a number: %s" % version_name)
+
+
+@gen.coroutine
+def get_signature_map(settings, model_name, version_name=None):
+  """Gets the signature map of a model from the application signature cache.
 
   Raises:
-    KeyError: when the signature is not found with the given signature
-    name or when there are more than one signatures in the signature map.
+    HTTPError: when the version is not a number or when the signature map
+    can not be fetched from the model server.
   """
-  # The way to find signature is:
-  # 1) if signature_name is specified, try to find it in the signature_map. If
-  # not found, raise an exception.
-  # 2) if signature_name is not specified, check if signature_map only
-  # contains one entry. If so, return the only signature.
-  # 3) Otherwise, use the default signature_name and do 1).
-  if not signature_name and len(signature_map) == 1:
-    return signature_map.keys()[0], signature_map.values()[0]
-
-  key = (signature_name or
-         signature_constants.DEFAULT_SERVING_SIGNATURE_DEF_KEY)
-  if key in signature_map:
-    return key, signature_map[key]
-  else:
-    raise KeyError("No signature found for signature key %s." % signature_name)
+  check_version(version_name)
+  signature_map = yield settings['signature_cache'].get(model_name, version_name)
+  if signature_map is None:
+    raise tornado.web.HTTPError(503, "Signatures of model %s are not available" % model_name)
+  raise gen.Return(signature_map)
 
 
-class MetadataHandler(tornado.web.RequestHandler):
+class JsonHandler(tornado.web.RequestHandler):
+  """
+  Base of the handlers with json bodies, encoded and decoded with the codec of the application.
+  """
+  @property
+  def json_codec(self):
+    return self.settings['json_codec']
+
+  def write_json(self, obj):
+    self.set_header("Content-Type", "application/json; charset=UTF-8")
+    self.write(self.json_codec.dumps(obj))
+
+
+class OverloadedError(tornado.web.HTTPError):
+  """An HTTPError answered with a Retry-After header."""
+
+  def __init__(self, status_code, retry_after, log_message=None, *args):
+    # Python 2 does not know the reason of 429 responses.
+    reason = 'Too Many Requests' if status_code == 429 else None
+    super(OverloadedError, self).__init__(status_code, log_message, *args, reason=reason)
+    self.retry_after = retry_after
+
+
+class ModelHandler(JsonHandler):
+  """
+  Base of the handlers serving a model, records the metrics of the requests.
+  """
+  method = None
+
+  def prepare(self):
+    self.model_label = None
+    self.admission_key = None
+    self.admission_future = None
+    self.admitted_model = None
+    self.client_timeout = None
+    header = self.request.headers.get(self.settings['deadline_header'])
+    if header is not None:
+      try:
+        self.client_timeout = float(header) / 1000.0
+      except ValueError:
+        raise tornado.web.HTTPError(400, 'Invalid %s header: %s' % (
+            self.settings['deadline_header'], header))
+
+  def observe_model(self, model_name):
+    """Starts recording metrics for this request, once the model is known to exist."""
+    self.model_label = model_name
+    metrics.IN_FLIGHT.labels(model_name, self.method).inc()
+
+  @gen.coroutine
+  def admit(self, model_name, known=True):
+    """Waits until the admission controller lets this request to the model through.
+
+    Args:
+      known: Whether the model is known to exist. Requests to other models
+             share one gate, so that unknown names do not add new ones.
+
+    Raises:
+      OverloadedError: when the request is shed.
+    """
+    admission = self.settings.get('admission')
+    if admission is None:
+      return
+    self.admission_key = model_name if known else UNKNOWN_MODELS
+    self.admission_future = admission.acquire(self.admission_key)
+    try:
+      yield self.admission_future
+    except Overloaded as e:
+      raise OverloadedError(self.settings['shed_status_code'], self.settings['shed_retry_after_sec'],
+                            'Model %s is overloaded: %s', model_name, e)
+    self.admitted_model = self.admission_key
+
+  def timed(self, phase):
+    return metrics.timed(self.model_label, self.method, phase)
+
+  def rpc_timeout(self, model_name=None):
+    """Returns the seconds for a call to the model server to time out.
+
+    That is the timeout of the model, the one of this request by default, or
+    the time left before the deadline of the client when it is sooner.
+
+    Raises:
+      HTTPError: when the deadline of the client has passed.
+    """
+    timeout = self.settings['rpc_timeouts'].timeout(model_name or self.model_label)
+    if self.client_timeout is not None:
+      left = self.client_timeout - self.request.request_time()
+      if left <= 0:
+        raise tornado.web.HTTPError(504, 'Deadline exceeded before calling the model server')
+      timeout = min(timeout, left)
+    return timeout
+
+  def call_model_server(self, method, request, model_name=None):
+    """Calls a method of the model server, hedged when a hedger is configured.
+
+    Returns:
+      A future resolving to the response.
+    """
+    model_name = model_name or self.model_label
+    if self.settings.get('hedger') is not None:
+      return self.settings['hedger'].call(method, request, self.rpc_timeout(model_name),
+                                          model_name)
+    stub = self.settings['stub']
+    return fwrap(getattr(stub, method).future(request, self.rpc_timeout(model_name)))
+
+  @gen.coroutine
+  def timed_rpc(self, future, model_name=None, known=True):
+    """Waits for a call to the model server, counting its errors by grpc status.
+
+    Args:
+      known: Whether the model is known to exist. Calls to other models are
+             only recorded once they succeed, so that requests to unknown
+             models do not create new series.
+
+    Raises:
+      HTTPError: 504 when the call timed out.
+    """
+    model_name = model_name or self.model_label
+    start = time.time()
+    try:
+      result = yield future
+    except tornado.web.HTTPError:
+      if known:
+        metrics.PHASE_SECONDS.labels(model_name, self.method, 'rpc').observe(time.time() - start)
+      raise
+    except Exception as e:
+      code = rpc_status_code(e)
+      if known:
+        metrics.PHASE_SECONDS.labels(model_name, self.method, 'rpc').observe(time.time() - start)
+        metrics.RPC_ERRORS.labels(model_name, self.method,
+                                  code.name if code else 'UNKNOWN').inc()
+      if code == grpc.StatusCode.DEADLINE_EXCEEDED:
+        if known:
+          self.settings['rpc_timeouts'].observe(model_name, time.time() - start)
+        raise tornado.web.HTTPError(504, 'Model server call timed out')
+      raise
+    metrics.PHASE_SECONDS.labels(model_name, self.method, 'rpc').observe(time.time() - start)
+    self.settings['rpc_timeouts'].observe(model_name, time.time() - start)
+    raise gen.Return(result)
+
+  def write_error(self, status_code, **kwargs):
+    error = kwargs.get('exc_info', (None, None))[1]
+    if isinstance(error, OverloadedError):
+      self.set_header('Retry-After', str(error.retry_after))
+    super(ModelHandler, self).write_error(status_code, **kwargs)
+
+  def on_connection_close(self):
+    if self.admission_future is not None and not self.admission_future.done():
+      self.settings['admission'].cancel(self.admission_key, self.admission_future)
+
+  def on_finish(self):
+    if self.admitted_model is not None:
+      self.settings['admission'].release(self.admitted_model)
+      self.admitted_model = None
+    if self.model_label is not None:
+      metrics.IN_FLIGHT.labels(self.model_label, self.method).dec()
+      metrics.REQUEST_SECONDS.labels(self.model_label, self.method).observe(
+          self.request.request_time())
+
+
+class MetadataHandler(JsonHandler):
   """
   Metadata Handler proxy return Model metadata (Currently it only supports signature map with latest version).
   Defined here https://github.com/tensorflow/serving/blob/master/tensorflow_serving/apis/prediction_service.proto#L29
   """
   @gen.coroutine
   def get(self, model_name):
-    if not self.settings['signature_map'].get(model_name):
-      self.settings['signature_map'][model_name] = get_signature_map(self.settings['stub'], model_name)
-    signature_map = self.settings['signature_map'][model_name]
-    self.write(dict((key, MessageToDict(value)) for key, value in signature_map.items()))
+    signature_map = yield get_signature_map(self.settings, model_name)
+    self.write_json(dict((key, MessageToDict(value)) for key, value in signature_map.items()))
 
-class PredictHandler(tornado.web.RequestHandler):
+@tornado.web.stream_request_body
+class PredictHandler(ModelHandler):
   """
   Predict Handler proxy predict method, the input of tf savedModel is expected to be a 
   `Map<strinbg, tf.Tensor>` protobuf. Defined here https://github.com/tensorflow/serving/blob/master/tensorflow_serving/apis/prediction_service.proto#L23
+
+  Json bodies are parsed while they are received, other bodies once complete.
   """
+  SUPPORTED_METHODS = ("POST",)
+  method = 'predict'
+
+  @gen.coroutine
+  def prepare(self):
+    super(PredictHandler, self).prepare()
+    max_body_size = self.settings['max_body_size']
+    content_length = self.request.headers.get('Content-Length', '')
+    if content_length.isdigit() and int(content_length) > max_body_size:
+      raise tornado.web.HTTPError(413, 'Request body is larger than %d bytes.' % max_body_size)
+    self.request.connection.set_max_body_size(max_body_size)
+
+    model_name, version_name = (list(self.path_args) + [None])[:2]
+    self.signature_map = yield get_signature_map(self.settings, model_name, version_name)
+    self.observe_model(model_name)
+    # Waiting requests are not read, their body stays in the socket buffers.
+    yield self.admit(model_name)
+
+    self.content_type = media_type(self.request.headers.get('Content-Type'))
+    self.chunks = []
+    self.body_hash = hashlib.sha256() if self.settings.get('coalescer') is not None else None
+    self.body_parser = None
+    self.body_error = None
+    if self.settings['stream_request_body'] and self.content_type not in BINARY_CONTENT_TYPES:
+      log_prob = 0.0
+      if self.settings['request_logger'] is not None:
+        log_prob = self.settings['request_log_prob']
+      self.body_parser = PredictBodyParser(
+          self.signature_map, self.get_query_argument('signature_name', None),
+          self.settings['request_key'], self.json_codec, log_prob)
+
+  def data_received(self, chunk):
+    if self.body_hash is not None:
+      self.body_hash.update(chunk)
+    if self.body_parser is None:
+      self.chunks.append(chunk)
+    elif self.body_error is None:
+      try:
+        self.body_parser.feed(chunk)
+      except ValueError as e:
+        # Reported once the whole body is received, the rest of it is ignored.
+        self.body_error = e
+
   @gen.coroutine
   def post(self, model_name, version_name=None):
-    if not self.settings['signature_map'].get(model_name):
-      self.settings['signature_map'][model_name] = get_signature_map(self.settings['stub'], model_name)
+    coalescer = self.settings.get('coalescer')
+    if coalescer is None or self.client_timeout is not None:
+      # Requests with a deadline are not coalesced, it would be the one of
+      # the first request.
+      content_type, body = yield self.predict(model_name, version_name)
+    else:
+      future, coalesced = coalescer.run(self.coalescing_key(model_name, version_name),
+                                        self.predict, model_name, version_name)
+      if coalesced:
+        self.chunks = None
+        metrics.COALESCED_REQUESTS.labels(model_name, self.method).inc()
+      content_type, body = yield future
+    self.set_header("Content-Type", content_type)
+    self.write(body)
 
-    request_key = self.settings['request_key']
-    request_data = tornado.escape.json_decode(self.request.body)
-    instances = request_data.get(request_key)
-    if not instances:
-      self.send_error('Request json object have to use the key: %s' % request_key)
-    if len(instances) < 1 or not isinstance(instances, (list, tuple)):
-      self.send_error('Request instances object have to use be a list')
-    instances = decode_b64_if_needed(instances)
+  def coalescing_key(self, model_name, version_name):
+    """Returns the key of everything the response to this request depends on."""
+    return (model_name, version_name, self.content_type, self.request.query,
+            accepts(self.request.headers.get('Accept'), PROTOBUF_CONTENT_TYPE),
+            self.body_hash.digest())
+
+  @gen.coroutine
+  def predict(self, model_name, version_name):
+    """Serves the request.
+
+    Returns:
+      A tuple of the content type and the body of the response.
+    """
+    if self.body_parser is not None:
+      request, num_rows, output_format, logged_instances = self.finish_body(
+          model_name, version_name)
+    else:
+      body = b''.join(self.chunks)
+      self.chunks = None
+      arguments = dict((name, self.get_query_argument(name, None))
+                       for name in ('format', 'signature_name', 'input', 'outputs'))
+      try:
+        request, num_rows, output_format, instances, phases = yield self.settings['offloader'].run(
+            len(body), parse_predict_request, body, self.content_type, arguments, model_name,
+            version_name, self.signature_map, self.settings['request_key'], self.json_codec,
+            self.settings['request_logger'] is not None)
+      except (ValueError, DecodeError) as e:
+        raise tornado.web.HTTPError(400, str(e))
+      metrics.observe_phases(model_name, self.method, phases)
+      logged_instances = None
+      if instances is not None:
+        logged_instances = sample_instances(instances, self.settings['request_log_prob'])
+    if output_format not in (ROWS_FORMAT, COLUMNS_FORMAT):
+      raise tornado.web.HTTPError(400, 'Unknown response format: %s' % output_format)
+    metrics.INSTANCES.labels(model_name, self.method).observe(num_rows)
+
+    prediction_cache = self.settings.get('prediction_cache')
+    if prediction_cache is not None and prediction_cache.enabled(model_name):
+      result = yield self.timed_rpc(prediction_cache.predict(request, self.send_request))
+    else:
+      result = yield self.timed_rpc(self.send_request(request))
+    if version_name is None and result.model_spec.HasField("version"):
+      self.settings['signature_cache'].observe_version(model_name, result.model_spec.version.value)
+
+    with self.timed('serialize'):
+      if accepts(self.request.headers.get('Accept'), PROTOBUF_CONTENT_TYPE):
+        content_type, body = PROTOBUF_CONTENT_TYPE, result.SerializeToString()
+      else:
+        content_type = "application/json; charset=UTF-8"
+        body = yield self.settings['offloader'].run(
+            result.ByteSize(), encode_predict_response, result, num_rows, output_format,
+            self.json_codec, list(request.output_filter))
+
+    if logged_instances:
+      self.settings['request_logger'].log(logged_instances)
+    raise gen.Return((content_type, body))
+
+  def finish_body(self, model_name, version_name):
+    """Returns the request parsed from a streamed json body.
+
+    Returns:
+      A tuple of the PredictRequest, the number of instances, the response
+      format and the instances to log.
+    """
+    try:
+      if self.body_error is not None:
+        raise self.body_error
+      request, request_data = self.body_parser.finish()
+      _, signature = get_signature(self.signature_map, request.model_spec.signature_name)
+      set_output_filter(request, request_data.get("outputs"), signature)
+    except ValueError as e:
+      raise tornado.web.HTTPError(400, str(e))
+    finally:
+      metrics.observe_phases(model_name, self.method, self.body_parser.phases)
+    set_model_spec(request.model_spec, model_name, version_name)
+    return (request, self.body_parser.num_rows, request_data.get("format", ROWS_FORMAT),
+            self.body_parser.logged_instances)
+
+  def send_request(self, request):
+    """Sends a PredictRequest to the model server, through the batcher if any."""
+    if self.settings.get('batcher') is not None:
+      return self.settings['batcher'].predict(request, self.rpc_timeout())
+    return self.call_model_server('Predict', request)
+
+
+def set_model_spec(model_spec, model_name, version_name):
+  """Sets the model and version of a ModelSpec, the latest version if None."""
+  model_spec.name = model_name
+  if version_name is not None:
+    model_spec.version.value = int(version_name)
+  else:
+    model_spec.ClearField("version")
+
+
+def set_output_filter(request, outputs, signature):
+  """Sets the outputs a PredictRequest asks for, all of them if outputs is empty.
+
+  Raises:
+    ValueError: when outputs is not a list of outputs of the signature.
+  """
+  if not outputs:
+    return
+  if not isinstance(outputs, list) or not all(isinstance(name, basestring_type) for name in outputs):
+    raise ValueError('The outputs key has to be a list of output names.')
+  unknown = [name for name in outputs if name not in signature.outputs]
+  if unknown:
+    raise ValueError('Unknown outputs %s, the signature has %s.' % (
+        ', '.join(unknown), ', '.join(sorted(signature.outputs))))
+  request.output_filter.extend(outputs)
+
+
+def parse_predict_request(body, content_type, arguments, model_name, version_name,
+                          signature_map, request_key, codec, keep_instances=True):
+  """Builds the PredictRequest of a predict body, according to its content type.
+
+  Large bodies are parsed in the offload executor, so that every argument has
+  to be picklable.
+
+  Args:
+    body: The request body.
+    content_type: The media type of the body.
+    arguments: A dict of the `format`, `signature_name`, `input` and
+               `outputs` query arguments, which are None when missing.
+    model_name: The model to query.
+    version_name: The version to query, or None for the latest one.
+    signature_map: The signatures of the model.
+    request_key: The key of the instances in json bodies.
+    codec: The JsonCodec decoding json bodies.
+    keep_instances: Whether to return the instances of json bodies.
+
+  Returns:
+    A tuple of the PredictRequest, the number of instances, the response
+    format, the list of instances, which is None for binary bodies or when
+    not kept, and a dict of the seconds spent in each phase.
 
+  Raises:
+    ValueError: when the body does not match the signature.
+    DecodeError: when a protobuf body can not be parsed.
+  """
+  phases = {}
+  output_format = arguments.get('format') or ROWS_FORMAT
+  outputs = [name for name in (arguments.get('outputs') or '').split(',') if name]
+  instances = None
+
+  if content_type == PROTOBUF_CONTENT_TYPE:
+    # Forwarded as is, only the model is taken from the url.
+    with recorded(phases, 'decode'):
+      request = predict_pb2.PredictRequest.FromString(body)
+    signature_name = request.model_spec.signature_name
+  elif content_type in BINARY_CONTENT_TYPES:
+    signature_name = arguments.get('signature_name')
+  else:
+    with recorded(phases, 'decode'):
+      request_data = codec.loads(body)
+    if not isinstance(request_data, dict):
+      raise ValueError('Request body must be a json object')
+    instances = request_data.get(request_key)
+    if not instances or not isinstance(instances, (list, tuple)):
+      raise ValueError('Request json object have to use the key %s with a '
+                       'non empty list of instances' % request_key)
+    if has_b64(body):
+      with recorded(phases, 'b64_decode'):
+        instances = decode_b64_if_needed(instances)
+    output_format = request_data.get("format", ROWS_FORMAT)
     signature_name = request_data.get("signature_name")
-    signature_name_used, signature = get_signature(self.settings['signature_map'][model_name],
-                                                   signature_name)
-    input_columns = signature.inputs.keys()
+    outputs = request_data.get("outputs")
 
+  try:
+    signature_name_used, signature = get_signature(signature_map, signature_name)
+  except KeyError as e:
+    raise ValueError(e.args[0])
+
+  if content_type != PROTOBUF_CONTENT_TYPE:
     request = predict_pb2.PredictRequest()
-    request.model_spec.name = model_name
-    request.model_spec.signature_name = signature_name_used
+    if instances is not None:
+      with recorded(phases, 'encode'):
+        get_input_plan(signature_map, signature_name_used).encode(request, instances)
+    else:
+      with recorded(phases, 'decode'):
+        if content_type == NPY_CONTENT_TYPE:
+          arrays = decode_npy(body, signature.inputs, arguments.get('input'))
+        elif content_type == NPZ_CONTENT_TYPE:
+          arrays = decode_npz(body)
+        else:
+          arrays = decode_arrow(body)
+      with recorded(phases, 'encode'):
+        encode_arrays(request, arrays, signature.inputs)
 
-    if version_name is not None:
-      request.model_spec.version = version_name
-    
-    inputs_type_map = signature.inputs
-    for input_column in input_columns:
-      values = [instance[input_column] for instance in instances]
-      request.inputs[input_column].CopyFrom(tf.make_tensor_proto(values, inputs_type_map[input_column].dtype))
+  request.model_spec.signature_name = signature_name_used
+  set_model_spec(request.model_spec, model_name, version_name)
+  if content_type != PROTOBUF_CONTENT_TYPE:
+    set_output_filter(request, outputs, signature)
 
-    stub = self.settings['stub']
-    result = yield fwrap(stub.Predict.future(request, self.settings['rpc_timeout']))
-    output_keys = result.outputs.keys()
-    predictions = zip(*[tf.make_ndarray(result.outputs[output_key]).tolist() for output_key in output_keys])
-    predictions = [dict(zip(*t)) for t in zip(repeat(output_keys), predictions)]
-    self.write(dict(predictions=predictions))
+  if instances is not None:
+    num_rows = len(instances)
+  else:
+    num_rows = batch_size(request) or 0
+  return (request, num_rows, output_format, instances if keep_instances else None,
+          phases)
+
+
+def encode_predict_response(response, num_rows, output_format, codec, outputs=None):
+  """Returns the json body of a PredictResponse, see encode_predictions.
+
+  Only the outputs named in outputs are converted, all of them when empty.
+  """
+  return encode_predictions(decode_outputs(response, outputs), num_rows, output_format, codec)
+
+
+class BatchPredictHandler(ModelHandler):
+  """
+  Batch Predict Handler sends the same instances to several models at once, e.g. the members of
+  an ensemble. The body holds the shared instances and the list of the targets:
+
+    {"instances": [...], "targets": [{"model": "a"}, {"model": "b", "version": 2,
+     "signature_name": "scores"}], "format": "rows"}
+
+  Targets can also name the `outputs` they return. The instances are decoded once, the calls to
+  the models are sent concurrently and the response lists the predictions of every target, or
+  its error, in the order of the targets.
+  """
+  SUPPORTED_METHODS = ("POST",)
+  method = 'predict'
+
+  @gen.coroutine
+  def post(self):
+    try:
+      request_data = self.json_codec.loads(self.request.body)
+    except ValueError as e:
+      raise tornado.web.HTTPError(400, 'Invalid json body: %s' % e)
+    if not isinstance(request_data, dict):
+      raise tornado.web.HTTPError(400, 'Request body must be a json object')
+    instances = request_data.get(self.settings['request_key'])
+    if not instances or not isinstance(instances, (list, tuple)):
+      raise tornado.web.HTTPError(400, 'Request json object have to use the key %s with a '
+                                  'non empty list of instances' % self.settings['request_key'])
+    targets = request_data.get('targets')
+    if not targets or not isinstance(targets, list):
+      raise tornado.web.HTTPError(400, 'Request json object have to use the key targets with a '
+                                  'non empty list of models')
+    targets = [parse_target(target) for target in targets]
+    output_format = request_data.get('format', ROWS_FORMAT)
+    if output_format not in (ROWS_FORMAT, COLUMNS_FORMAT):
+      raise tornado.web.HTTPError(400, 'Unknown response format: %s' % output_format)
+    if has_b64(self.request.body):
+      instances = decode_b64_if_needed(instances)
 
-    if self.settings['request_logger'] is not None:
-      for instance in instances:
-        if random.random() < self.settings['request_log_prob']:
-          self.settings['request_logger'].info(json.dumps(instance))
+    results = yield [self.predict_target(model_name, version_name, signature_name, outputs,
+                                         instances, output_format)
+                     for model_name, version_name, signature_name, outputs in targets]
+    self.set_header("Content-Type", "application/json; charset=UTF-8")
+    self.write('{"results":[%s]}' % ','.join(results))
 
+  @gen.coroutine
+  def predict_target(self, model_name, version_name, signature_name, outputs, instances,
+                     output_format):
+    """Sends the instances to one target.
+
+    Returns:
+      The json encoded result of the target, with its predictions or its error.
+    """
+    codec = self.json_codec
+    result = '{"model":%s' % codec.dumps(model_name)
+    admitted = False
+    try:
+      signature_map = yield get_signature_map(self.settings, model_name, version_name)
+      try:
+        signature_name, signature = get_signature(signature_map, signature_name)
+      except KeyError as e:
+        raise tornado.web.HTTPError(400, e.args[0])
+      request = predict_pb2.PredictRequest()
+      with metrics.timed(model_name, self.method, 'encode'):
+        try:
+          get_input_plan(signature_map, signature_name).encode(request, instances)
+          set_output_filter(request, outputs, signature)
+        except ValueError as e:
+          raise tornado.web.HTTPError(400, str(e))
+      request.model_spec.signature_name = signature_name
+      set_model_spec(request.model_spec, model_name, version_name)
+      metrics.INSTANCES.labels(model_name, self.method).observe(len(instances))
+
+      if self.settings.get('admission') is not None:
+        try:
+          yield self.settings['admission'].acquire(model_name)
+        except Overloaded as e:
+          raise OverloadedError(self.settings['shed_status_code'],
+                                self.settings['shed_retry_after_sec'],
+                                'Model %s is overloaded: %s', model_name, e)
+        admitted = True
+      if self.settings.get('batcher') is not None:
+        future = self.settings['batcher'].predict(request, self.rpc_timeout(model_name))
+      else:
+        future = self.call_model_server('Predict', request, model_name)
+      response = yield self.timed_rpc(future, model_name)
+    except tornado.web.HTTPError as e:
+      message = e.log_message % e.args if e.log_message else str(e)
+      raise gen.Return('%s,"code":%d,"error":%s}' % (result, e.status_code, codec.dumps(message)))
+    except Exception as e:
+      logging.warn("Batch predict call to model %s failed: %s", model_name, e)
+      raise gen.Return('%s,"code":500,"error":%s}' % (result, codec.dumps(str(e))))
+    finally:
+      if admitted:
+        self.settings['admission'].release(model_name)
+
+    if version_name is None and response.model_spec.HasField("version"):
+      self.settings['signature_cache'].observe_version(model_name, response.model_spec.version.value)
+    with metrics.timed(model_name, self.method, 'serialize'):
+      body = encode_predictions(decode_outputs(response, request.output_filter), len(instances),
+                                output_format, codec)
+    # The predictions are spliced from the body of a single model response.
+    raise gen.Return('%s,%s' % (result, body[1:]))
+
+
+def parse_target(target):
+  """Returns the model, version, signature and output names of a batch predict target.
 
-class ClassifyHandler(tornado.web.RequestHandler):
+  Raises:
+    HTTPError: when the target is not an object with a model name and an
+    optional version number.
+  """
+  if not isinstance(target, dict) or not target.get('model'):
+    raise tornado.web.HTTPError(400, 'Every target must be an object with a model')
+  version = target.get('version')
+  if version is not None:
+    version = str(version)
+    check_version(version)
+  return target['model'], version, target.get('signature_name'), target.get('outputs')
+
+
+class ClassifyHandler(ModelHandler):
   """
   Classify Handler proxy classify method, the input of tf savedModel is expected to be a `tf.Examples` protobuf
   Defined here https://github.com/tensorflow/serving/blob/master/tensorflow_serving/apis/prediction_service.proto#L17
   """
+  method = 'classify'
+
   @gen.coroutine
   def post(self, model, version=None):
-    request_key = self.settings['request_key']
-    request_data = tornado.escape.json_decode(self.request.body)
-    instances = request_data.get(request_key)
-    if not instances:
-      self.send_error('Request json object have to use the key: %s'%request_key)
+    check_version(version)
+    # Classify does not need the signatures of the model. Only models known to
+    # the model server are labelled in the metrics: those whose signatures
+    # were fetched right away, the others once the model server answered.
+    if self.settings['signature_cache'].known(model, version):
+      self.observe_model(model)
+    yield self.admit(model, known=self.model_label is not None)
 
-    if len(instances) < 1 or not isinstance(instances, (list, tuple)):
-      self.send_error('Request instances object have to use be a list')
+    try:
+      request, num_instances, phases = yield self.settings['offloader'].run(
+          len(self.request.body), parse_classify_request, self.request.body, model, version,
+          self.settings['request_key'], self.json_codec, self.settings['serialize_examples'])
+    except ValueError as e:
+      raise tornado.web.HTTPError(400, str(e))
 
-    instances = decode_b64_if_needed(instances)
+    result = yield self.timed_rpc(self.call_model_server('Classify', request, model), model,
+                                  known=self.model_label is not None)
+    if self.model_label is None:
+      self.observe_model(model)
+    metrics.observe_phases(model, self.method, phases)
+    metrics.INSTANCES.labels(model, self.method).observe(num_instances)
 
-    request = prepare_classify_requests(instances, model, version)
+    with self.timed('serialize'):
+      self.write_json(MessageToDict(result))
 
-    stub = self.settings['stub']
-    result = yield fwrap(stub.Classify.future(request, self.settings['rpc_timeout']))
 
-    self.write(MessageToDict(result))
+def parse_classify_request(body, model_name, model_version, request_key, codec, serialize=True):
+  """Builds the ClassificationRequest of a classify json body.
+
+  Large bodies are parsed in the offload executor, so that every argument has
+  to be picklable.
+
+  Returns:
+    A tuple of the ClassificationRequest, the number of instances and a dict
+    of the seconds spent in each phase.
+
+  Raises:
+    ValueError: when the body is not valid.
+  """
+  phases = {}
+  with recorded(phases, 'decode'):
+    request_data = codec.loads(body)
+  if not isinstance(request_data, dict):
+    raise ValueError('Request body must be a json object')
+  instances = request_data.get(request_key)
+  if not instances or not isinstance(instances, (list, tuple)):
+    raise ValueError('Request json object have to use the key %s with a '
+                     'non empty list of instances' % request_key)
+
+  if has_b64(body):
+    with recorded(phases, 'b64_decode'):
+      instances = decode_b64_if_needed(instances)
+
+  with recorded(phases, 'encode'):
+    request = prepare_classify_requests(instances, model_name, model_version, serialize)
+  return request, len(instances), phases
+
+
+def collect_stats(settings):
+  """Returns the stats of this process."""
+  stats = {}
+  if settings.get('prediction_cache') is not None:
+    stats['prediction_cache'] = settings['prediction_cache'].stats()
+  if settings.get('request_logger') is not None:
+    stats['request_logger'] = settings['request_logger'].stats()
+  stats['offloader'] = settings['offloader'].stats()
+  if settings.get('hedger') is not None:
+    stats['hedger'] = settings['hedger'].stats()
+  if settings.get('admission') is not None:
+    stats['admission'] = settings['admission'].stats()
+  if settings.get('coalescer') is not None:
+    stats['coalescer'] = settings['coalescer'].stats()
+  return stats
+
+
+class StatsHandler(tornado.web.RequestHandler):
+  """
+  Stats Handler returns the counters of the proxy caches, summed over all worker processes.
+  """
+  def get(self):
+    if self.settings.get('stats_reporter') is not None:
+      self.write(self.settings['stats_reporter'].aggregate())
+    else:
+      self.write(collect_stats(self.settings))
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+  """
+  Metrics Handler returns the prometheus metrics of the proxy, over all worker processes.
+  """
+  def get(self):
+    content_type, text = metrics.exposition()
+    self.set_header("Content-Type", content_type)
+    self.write(text)
 
 
 class IndexHanlder(tornado.web.RequestHandler):
@@ -291,48 +904,199 @@ class IndexHanlder(tornado.web.RequestHandler):
     self.write(WELCOME)
 
 
+class ReadyHandler(tornado.web.RequestHandler):
+  """
+  Ready Handler answers 200 once the warm-up models are warm, 503 until then, for readiness probes.
+  """
+  def get(self):
+    warmer = self.settings.get('warmer')
+    if warmer is not None and not warmer.ready:
+      raise tornado.web.HTTPError(503, "Warming up")
+    self.write("ready")
+
+
+def stream_request_body():
+  """Whether json predict bodies are parsed while they are received.
+
+  Streamed bodies are parsed on the IOLoop as they arrive, so by default they
+  are not when an offload executor is set, to leave large bodies to it.
+  """
+  if options.stream_request_body is None:
+    return not options.offload_executor
+  return options.stream_request_body
+
+
 def get_application(**settings):
+  settings.setdefault('json_codec', get_codec(options.json_codec))
+  settings.setdefault('offloader', Offloader())
+  settings.setdefault('max_body_size', int(options.max_body_mb * (1 << 20)))
+  settings.setdefault('stream_request_body', stream_request_body())
+  settings.setdefault('rpc_timeouts', RpcTimeouts(options.rpc_timeout))
+  settings.setdefault('deadline_header', options.deadline_header)
+  settings.setdefault('shed_status_code', options.shed_status_code)
+  settings.setdefault('shed_retry_after_sec', options.shed_retry_after_sec)
   return tornado.web.Application(
       [
+      (r"/models:batchPredict", BatchPredictHandler),
       (r"/model/(.*):metadata", MetadataHandler),
       (r"/model/(.*):predict", PredictHandler),
       (r"/model/(.*):classify", ClassifyHandler),
       (r"/model/(.*)/version/(.*):predict", PredictHandler),
       (r"/model/(.*)/version/(.*):classify", ClassifyHandler),
+      (r"/stats", StatsHandler),
+      (r"/metrics", MetricsHandler),
+      (r"/ready", ReadyHandler),
       (r"/", IndexHanlder),
       ],
       xsrf_cookies=False,
       debug=options.debug,
-      rpc_timeout = options.rpc_timeout,
       request_key = options.instances_key,
+      serialize_examples = options.serialize_examples,
       **settings)
 
 
+BETA_ENGINE = 'beta'
+GA_ENGINE = 'ga'
+
+
+def create_stub(host, port, channel_index=0, engine=BETA_ENGINE):
+  """Creates a PredictionService stub over a channel of its own.
+
+  The channel index is passed as a channel argument so that grpc does not
+  share one connection between the channels opened to the same backend.
+
+  Both stubs have `future` methods returning grpc futures, which `fwrap`
+  bridges into tornado, but the beta stub wraps every call, its future and
+  its errors into the objects of the beta API, while the GA one returns the
+  call of the channel itself.
+
+  Raises:
+    ValueError: when engine is neither BETA_ENGINE nor GA_ENGINE.
+  """
+  if engine not in (BETA_ENGINE, GA_ENGINE):
+    raise ValueError('Unknown grpc engine: %s' % engine)
+  channel = grpc.insecure_channel('%s:%d' % (host, port),
+                                  options=[('grpc.channel_index', channel_index)])
+  if engine == GA_ENGINE:
+    return prediction_service_pb2.PredictionServiceStub(channel)
+  return prediction_service_pb2.beta_create_PredictionService_stub(
+      implementations.Channel(channel))
+
+
 def main():
   parse_command_line()
 
-  channel = implementations.insecure_channel(options.rpc_address, options.rpc_port)
-  stub = prediction_service_pb2.beta_create_PredictionService_stub(channel)
+  # Everything holding grpc channels or an IOLoop is created after forking.
+  worker_id = None
+  if options.num_processes != 1:
+    stats_dir = options.stats_dir or tempfile.mkdtemp(prefix='http-proxy-stats-')
+    metrics.enable_multiprocess(os.path.join(stats_dir, 'prometheus'))
+    if not options.reuse_port:
+      sockets = bind_sockets(options.port)
+    worker_id = fork_processes(options.num_processes)
+    if options.reuse_port:
+      sockets = bind_sockets(options.port, reuse_port=True)
+  else:
+    sockets = bind_sockets(options.port)
+
+  stub = BackendPool(partial(create_stub, engine=options.grpc_engine),
+                     channels_per_backend=options.rpc_channels_per_backend,
+                     max_failures=options.rpc_max_failures,
+                     ejection_sec=options.rpc_ejection_sec)
+  if options.rpc_backends:
+    stub.set_backends(options.rpc_backends.split(','))
+  else:
+    stub.set_backends(['%s:%d' % (options.rpc_address, options.rpc_port)])
+  if options.rpc_resolve_interval > 0:
+    stub.start_resolving(options.rpc_address, options.rpc_port, options.rpc_resolve_interval)
 
   if options.log_request:
-    request_logger = logging.getLogger("RequestLogger")
-    request_logger.setLevel(logging.INFO)
-    rorate_handler = logging.handlers.RotatingFileHandler(
-        options.request_log_file, maxBytes=1000000, backupCount=1)
-    request_logger.addHandler(rorate_handler)
+    request_logger = RequestLogger(worker_path(options.request_log_file, worker_id),
+                                   max_bytes=options.request_log_max_bytes,
+                                   backup_count=options.request_log_backups,
+                                   queue_size=options.request_log_queue_size,
+                                   compress=options.request_log_compress)
+    request_logger.start()
     # touch the pos file.
-    open(options.request_log_pos_file, "a").close()
+    open(worker_path(options.request_log_pos_file, worker_id), "a").close()
   else:
     request_logger = None
 
+  if options.batching:
+    batcher = PredictBatcher(stub,
+                             max_batch_size=options.max_batch_size,
+                             max_wait_ms=options.batch_timeout_ms,
+                             rpc_timeout=options.rpc_timeout)
+  else:
+    batcher = None
+
+  if options.prediction_cache_mb > 0:
+    prediction_cache = PredictionCache(
+        max_bytes=int(options.prediction_cache_mb * (1 << 20)),
+        ttl=options.prediction_cache_ttl,
+        models=[m for m in options.prediction_cache_models.split(',') if m])
+  else:
+    prediction_cache = None
+
+  if options.offload_executor:
+    executor = create_executor(options.offload_executor, options.offload_workers)
+  else:
+    executor = None
+
+  admission_limits = parse_limits(options.admission_limits)
+  if options.max_concurrency_per_model > 0 or admission_limits:
+    admission = AdmissionController(max_concurrency=options.max_concurrency_per_model,
+                                    max_queue=options.max_queue_per_model,
+                                    queue_timeout=options.admission_queue_timeout_ms / 1000.0,
+                                    limits=admission_limits)
+  else:
+    admission = None
+
+  if options.hedge_percentile > 0:
+    hedger = Hedger(stub,
+                    percentile=options.hedge_percentile,
+                    min_delay=options.hedge_min_delay_ms / 1000.0,
+                    max_ratio=options.hedge_max_ratio)
+  else:
+    hedger = None
+
+  signature_cache = SignatureCache(stub,
+                                   ttl=options.signature_cache_ttl,
+                                   negative_ttl=options.signature_negative_ttl,
+                                   rpc_timeout=MODEL_SERVER_METADATA_TIMEOUT_SEC)
+  warmer = Warmer(stub, signature_cache, parse_models(options.warmup_models),
+                  synthetic_requests=options.warmup_requests,
+                  rpc_timeout=MODEL_SERVER_METADATA_TIMEOUT_SEC,
+                  timeout=options.warmup_timeout_sec)
+
   extra_settings = dict(
+      offloader = Offloader(executor, min_bytes=options.offload_min_bytes),
       stub = stub,
-      signature_map = {},
+      batcher = batcher,
+      hedger = hedger,
+      prediction_cache = prediction_cache,
+      coalescer = SingleFlight() if options.coalesce_predictions else None,
+      signature_cache = signature_cache,
+      warmer = warmer,
       request_logger = request_logger,
       request_log_prob = options.request_log_prob,
+      admission = admission,
+      rpc_timeouts = RpcTimeouts(options.rpc_timeout,
+                                 overrides=parse_timeouts(options.rpc_model_timeouts),
+                                 adaptive=options.adaptive_rpc_timeout,
+                                 percentile=options.adaptive_timeout_percentile,
+                                 multiplier=options.adaptive_timeout_multiplier,
+                                 min_timeout=options.adaptive_timeout_min,
+                                 max_timeout=options.adaptive_timeout_max),
   )
   app = get_application(**extra_settings)
-  app.listen(options.port)
+  if worker_id is not None:
+    app.settings['stats_reporter'] = StatsReporter(
+        stats_dir, worker_id, lambda: collect_stats(app.settings))
+    app.settings['stats_reporter'].start()
+  server = HTTPServer(app, max_body_size=app.settings['max_body_size'])
+  server.add_sockets(sockets)
+  IOLoop.current().spawn_callback(warmer.run)
   logging.info('running at http://localhost:%s'%options.port)
   tornado.ioloop.IOLoop.current().start()
 
@@ -12,18 +12,91 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
 import json
 import base64
+from concurrent import futures
+from concurrent.futures import Future
 
+import grpc
+from grpc.framework.interfaces.face import face
+import numpy as np
 import pytest
+import tensorflow as tf
+from tensorflow.core.framework import types_pb2
+from tensorflow.core.protobuf import meta_graph_pb2
+from tensorflow_serving.apis import classification_pb2
+from tensorflow_serving.apis import predict_pb2
+from tensorflow_serving.apis import prediction_service_pb2
 from tornado import gen
+from tornado.httpclient import HTTPRequest
+from tornado.options import options
 
-from server import decode_b64_if_needed, get_application, WELCOME
+from admission import AdmissionController, UNKNOWN_MODELS
+from coalescing import SingleFlight
+from deadlines import RpcTimeouts
+from offload import create_executor, Offloader, THREAD_EXECUTOR
+from prediction_cache import PredictionCache
+from request_formats import decode_arrow
+from server import (create_stub, decode_b64_if_needed, encode_predictions, get_application,
+                    stream_request_body, BETA_ENGINE, GA_ENGINE, WELCOME)
+from signature_cache import SignatureCache
+
+
+class DoublingStub(object):
+    """Fake PredictionService stub answering y = 2 * x and z = -x."""
+
+    def __init__(self):
+        self.requests = []
+        self.timeouts = []
+        self.Predict = self
+        self.Classify = ClassifyMethod(self.requests)
+
+    def future(self, request, timeout):
+        self.requests.append(request)
+        self.timeouts.append(timeout)
+        x = tf.make_ndarray(request.inputs['x'])
+        response = predict_pb2.PredictResponse()
+        response.outputs['y'].CopyFrom(tf.make_tensor_proto(x * 2))
+        response.outputs['z'].CopyFrom(tf.make_tensor_proto(-x))
+        f = Future()
+        f.set_result(response)
+        return f
+
+
+class ClassifyMethod(object):
+    """Classifies every example with its number of features as score."""
+
+    def __init__(self, requests):
+        self.requests = requests
+
+    def future(self, request, timeout):
+        self.requests.append(request)
+        response = classification_pb2.ClassificationResponse()
+        for example in request.input.example_list.examples:
+            response.result.classifications.add().classes.add(
+                label='n', score=len(example.features.feature))
+        f = Future()
+        f.set_result(response)
+        return f
+
+
+def doubling_signature_map():
+    signature = meta_graph_pb2.SignatureDef()
+    signature.inputs['x'].dtype = types_pb2.DT_FLOAT
+    signature.outputs['y'].dtype = types_pb2.DT_FLOAT
+    signature.outputs['z'].dtype = types_pb2.DT_FLOAT
+    return {'serving_default': signature}
 
 
 @pytest.fixture
 def app():
-    return get_application(stub=None)
+    stub = DoublingStub()
+    signature_cache = SignatureCache(stub)
+    signature_cache.put('double', doubling_signature_map())
+    signature_cache.put('cached', doubling_signature_map())
+    return get_application(stub=stub, signature_cache=signature_cache, request_logger=None,
+                           prediction_cache=PredictionCache(max_bytes=1 << 20, models=['cached']))
 
 @pytest.fixture(params=['xa', u'sada'])
 def mock_data(request):
@@ -85,3 +158,470 @@ def test_predict_with_post_without_payload(app, http_client, base_url, io_loop):
         assert 'Body must not be None for method POST' in e.value.message
     io_loop.run_sync(test_gen)
 
+
+def test_encode_predictions_rows():
+    outputs = [('a', np.array([1.5, 2.5])), ('b', np.array([[1, 2], [3, 4]])),
+               ('c', np.array(['x', 'y'], dtype=object))]
+    actual = json.loads(encode_predictions(outputs, 2))
+    assert actual == {'predictions': [{'a': 1.5, 'b': [1, 2], 'c': 'x'},
+                                      {'a': 2.5, 'b': [3, 4], 'c': 'y'}]}
+
+def test_encode_predictions_columns():
+    outputs = [('a', np.array([1.5, 2.5])), ('b', np.array([[1, 2], [3, 4]]))]
+    actual = json.loads(encode_predictions(outputs, 2, 'columns'))
+    assert actual == {'predictions': {'a': [1.5, 2.5], 'b': [[1, 2], [3, 4]]}}
+
+@pytest.mark.gen_test
+def test_predict_rows(app, http_client, base_url):
+    body = json.dumps({'instances': [{'x': 1.0}, {'x': 2.0}]})
+    response = yield http_client.fetch('%s/model/double:predict' % base_url, method='POST', body=body)
+    assert json.loads(response.body) == {'predictions': [{'y': 2.0, 'z': -1.0}, {'y': 4.0, 'z': -2.0}]}
+
+@pytest.mark.gen_test
+def test_predict_columns(app, http_client, base_url):
+    body = json.dumps({'instances': [{'x': 1.0}, {'x': 2.0}], 'format': 'columns'})
+    response = yield http_client.fetch('%s/model/double:predict' % base_url, method='POST', body=body)
+    assert json.loads(response.body) == {'predictions': {'y': [2.0, 4.0], 'z': [-1.0, -2.0]}}
+
+@pytest.mark.gen_test
+def test_predict_unknown_format(app, http_client, base_url):
+    body = json.dumps({'instances': [{'x': 1.0}], 'format': 'csv'})
+    with pytest.raises(Exception) as e:
+        yield http_client.fetch('%s/model/double:predict' % base_url, method='POST', body=body)
+    assert e.value.code == 400
+
+@pytest.mark.parametrize('stream', [True, False])
+@pytest.mark.parametrize('method', ['predict', 'classify'])
+@pytest.mark.parametrize('body', ['[{"x": 1.0}]', '1', '"instances"', 'null'])
+@pytest.mark.gen_test
+def test_body_not_a_json_object(app, http_client, base_url, stream, method, body):
+    app.settings['stream_request_body'] = stream
+    with pytest.raises(Exception) as e:
+        yield http_client.fetch('%s/model/double:%s' % (base_url, method), method='POST', body=body)
+    assert e.value.code == 400
+
+@pytest.mark.gen_test
+def test_predict_unavailable_model(app, http_client, base_url):
+    body = json.dumps({'instances': [{'x': 1.0}]})
+    with pytest.raises(Exception) as e:
+        yield http_client.fetch('%s/model/missing:predict' % base_url, method='POST', body=body)
+    assert e.value.code == 503
+
+@pytest.mark.gen_test
+def test_predict_npy(app, http_client, base_url):
+    body = io.BytesIO()
+    np.save(body, np.array([1.0, 2.0], dtype=np.float32))
+    response = yield http_client.fetch('%s/model/double:predict?format=columns' % base_url, method='POST',
+                                       body=body.getvalue(), headers={'Content-Type': 'application/x-npy'})
+    assert json.loads(response.body) == {'predictions': {'y': [2.0, 4.0], 'z': [-1.0, -2.0]}}
+
+@pytest.mark.parametrize('stream', [True, False])
+@pytest.mark.gen_test
+def test_predict_outputs(app, http_client, base_url, stream):
+    app.settings['stream_request_body'] = stream
+    url = '%s/model/double:predict' % base_url
+    body = json.dumps({'instances': [{'x': 1.0}], 'outputs': ['z']})
+    response = yield http_client.fetch(url, method='POST', body=body)
+    assert json.loads(response.body) == {'predictions': [{'z': -1.0}]}
+    assert list(app.settings['stub'].requests[-1].output_filter) == ['z']
+
+    body = json.dumps({'instances': [{'x': 1.0}], 'outputs': ['w']})
+    with pytest.raises(Exception) as e:
+        yield http_client.fetch(url, method='POST', body=body)
+    assert e.value.code == 400
+
+@pytest.mark.gen_test
+def test_predict_npy_outputs(app, http_client, base_url):
+    body = io.BytesIO()
+    np.save(body, np.array([1.0, 2.0], dtype=np.float32))
+    response = yield http_client.fetch('%s/model/double:predict?outputs=y' % base_url, method='POST',
+                                       body=body.getvalue(), headers={'Content-Type': 'application/x-npy'})
+    assert json.loads(response.body) == {'predictions': [{'y': 2.0}, {'y': 4.0}]}
+
+@pytest.mark.gen_test
+def test_predict_npz(app, http_client, base_url):
+    body = io.BytesIO()
+    np.savez(body, x=np.array([3.0]))
+    response = yield http_client.fetch('%s/model/double:predict' % base_url, method='POST',
+                                       body=body.getvalue(), headers={'Content-Type': 'application/x-npz'})
+    assert json.loads(response.body) == {'predictions': [{'y': 6.0, 'z': -3.0}]}
+
+@pytest.mark.gen_test
+def test_predict_npz_missing_input(app, http_client, base_url):
+    body = io.BytesIO()
+    np.savez(body, other=np.array([3.0]))
+    with pytest.raises(Exception) as e:
+        yield http_client.fetch('%s/model/double:predict' % base_url, method='POST',
+                                body=body.getvalue(), headers={'Content-Type': 'application/x-npz'})
+    assert e.value.code == 400
+
+@pytest.mark.parametrize('length', [30, -30])
+@pytest.mark.gen_test
+def test_predict_corrupt_npz(app, http_client, base_url, length):
+    body = io.BytesIO()
+    np.savez(body, x=np.array([3.0]))
+    body = body.getvalue()
+    body = body[:length] if length > 0 else body[:length] + b'\0' * -length
+    with pytest.raises(Exception) as e:
+        yield http_client.fetch('%s/model/double:predict' % base_url, method='POST',
+                                body=body, headers={'Content-Type': 'application/x-npz'})
+    assert e.value.code == 400
+
+@pytest.mark.gen_test
+def test_predict_protobuf(app, http_client, base_url):
+    request = predict_pb2.PredictRequest()
+    request.model_spec.name = 'ignored'
+    request.inputs['x'].CopyFrom(tf.make_tensor_proto([1.0, 2.0], dtype=tf.float32))
+    response = yield http_client.fetch('%s/model/double:predict' % base_url, method='POST',
+                                       body=request.SerializeToString(),
+                                       headers={'Content-Type': 'application/x-protobuf',
+                                                'Accept': 'application/x-protobuf'})
+    assert response.headers['Content-Type'] == 'application/x-protobuf'
+    result = predict_pb2.PredictResponse.FromString(response.body)
+    np.testing.assert_array_equal(tf.make_ndarray(result.outputs['y']), [2.0, 4.0])
+    assert app.settings['stub'].requests[-1].model_spec.name == 'double'
+
+@pytest.mark.gen_test
+def test_predict_arrow(app, http_client, base_url):
+    pyarrow = pytest.importorskip('pyarrow')
+    batch = pyarrow.RecordBatch.from_arrays([pyarrow.array([1.0, 2.0])], ['x'])
+    sink = pyarrow.BufferOutputStream()
+    writer = pyarrow.RecordBatchStreamWriter(sink, batch.schema)
+    writer.write_batch(batch)
+    writer.close()
+    response = yield http_client.fetch('%s/model/double:predict' % base_url, method='POST',
+                                       body=sink.getvalue().to_pybytes(),
+                                       headers={'Content-Type': 'application/vnd.apache.arrow.stream'})
+    assert json.loads(response.body) == {'predictions': [{'y': 2.0, 'z': -1.0}, {'y': 4.0, 'z': -2.0}]}
+
+def test_decode_arrow_lists_and_strings():
+    pyarrow = pytest.importorskip('pyarrow')
+    batch = pyarrow.RecordBatch.from_arrays(
+        [pyarrow.array([[1.0, 2.0], [3.0, 4.0]]), pyarrow.array([b'a\0', b'b'])], ['x', 's'])
+    sink = pyarrow.BufferOutputStream()
+    writer = pyarrow.RecordBatchStreamWriter(sink, batch.schema)
+    writer.write_batch(batch)
+    writer.write_batch(batch)
+    writer.close()
+    arrays = decode_arrow(sink.getvalue().to_pybytes())
+    assert arrays['x'].tolist() == [[1.0, 2.0], [3.0, 4.0]] * 2
+    assert arrays['s'].tolist() == [b'a\0', b'b'] * 2
+
+@pytest.mark.gen_test
+def test_predict_cached(app, http_client, base_url):
+    for _ in range(2):
+        body = json.dumps({'instances': [{'x': 1.0}, {'x': 2.0}]})
+        response = yield http_client.fetch('%s/model/cached:predict' % base_url, method='POST', body=body)
+        assert json.loads(response.body) == {'predictions': [{'y': 2.0, 'z': -1.0}, {'y': 4.0, 'z': -2.0}]}
+    assert len(app.settings['stub'].requests) == 1
+    response = yield http_client.fetch('%s/stats' % base_url)
+    assert json.loads(response.body)['prediction_cache']['hits'] == 2
+
+class FailingStub(object):
+    """Fake PredictionService stub failing every call with DEADLINE_EXCEEDED."""
+
+    def __init__(self):
+        self.Predict = self
+
+    def future(self, request, timeout):
+        f = Future()
+        f.set_exception(face.ExpirationError(None, None, grpc.StatusCode.DEADLINE_EXCEEDED, 'timeout'))
+        return f
+
+@pytest.mark.gen_test
+def test_metrics(app, http_client, base_url):
+    body = json.dumps({'instances': [{'x': 1.0}, {'x': 2.0}]})
+    yield http_client.fetch('%s/model/double:predict' % base_url, method='POST', body=body)
+    app.settings['stub'] = FailingStub()
+    with pytest.raises(Exception):
+        yield http_client.fetch('%s/model/double:predict' % base_url, method='POST', body=body)
+    with pytest.raises(Exception):
+        yield http_client.fetch('%s/model/unknown-model:predict' % base_url, method='POST', body=body)
+
+    response = yield http_client.fetch('%s/metrics' % base_url)
+    assert response.headers['Content-Type'].startswith('text/plain')
+    text = response.body.decode('utf-8')
+    assert 'http_proxy_request_seconds_count{method="predict",model="double"}' in text
+    assert 'http_proxy_phase_seconds_count{method="predict",model="double",phase="rpc"}' in text
+    assert 'http_proxy_request_instances_sum{method="predict",model="double"}' in text
+    assert 'http_proxy_rpc_errors_total{code="DEADLINE_EXCEEDED",method="predict",model="double"}' in text
+    assert 'http_proxy_in_flight_requests{method="predict",model="double"} 0.0' in text
+    assert 'unknown-model' not in text
+
+@pytest.mark.gen_test
+def test_classify(app, http_client, base_url):
+    body = json.dumps({'instances': [{'x': 1, 'y': 'a'}, {'x': 2.5}]})
+    response = yield http_client.fetch('%s/model/double:classify' % base_url, method='POST', body=body)
+    assert json.loads(response.body) == {'result': {'classifications': [
+        {'classes': [{'label': 'n', 'score': 2.0}]}, {'classes': [{'label': 'n', 'score': 1.0}]}]}}
+    examples = app.settings['stub'].requests[-1].input.example_list.examples
+    assert examples[0].features.feature['x'].float_list.value == [1.0]
+    assert examples[0].features.feature['y'].bytes_list.value == [b'a']
+
+@pytest.mark.gen_test
+def test_classify_does_not_need_metadata(app, http_client, base_url):
+    body = json.dumps({'instances': [{'x': 1}]})
+    response = yield http_client.fetch('%s/model/classifier:classify' % base_url, method='POST', body=body)
+    assert json.loads(response.body) == {'result': {'classifications': [{'classes': [{'label': 'n', 'score': 1.0}]}]}}
+    app.settings['stub'].Classify = FailingStub()
+    with pytest.raises(Exception) as e:
+        yield http_client.fetch('%s/model/unknown-classifier:classify' % base_url, method='POST', body=body)
+    assert e.value.code == 504
+
+    text = (yield http_client.fetch('%s/metrics' % base_url)).body.decode('utf-8')
+    assert 'http_proxy_request_seconds_count{method="classify",model="classifier"}' in text
+    assert 'http_proxy_phase_seconds_count{method="classify",model="classifier",phase="rpc"}' in text
+    assert 'unknown-classifier' not in text
+
+@pytest.mark.gen_test
+def test_classify_mixed_kinds(app, http_client, base_url):
+    body = json.dumps({'instances': [{'x': 1}, {'x': 'a'}]})
+    with pytest.raises(Exception) as e:
+        yield http_client.fetch('%s/model/double:classify' % base_url, method='POST', body=body)
+    assert e.value.code == 400
+
+@pytest.mark.gen_test
+def test_offloaded(app, http_client, base_url):
+    app.settings['offloader'] = Offloader(create_executor(THREAD_EXECUTOR, 2), min_bytes=0)
+    app.settings['stream_request_body'] = False
+    body = json.dumps({'instances': [{'x': 1.0}, {'x': 2.0}]})
+    response = yield http_client.fetch('%s/model/double:predict' % base_url, method='POST', body=body)
+    assert json.loads(response.body) == {'predictions': [{'y': 2.0, 'z': -1.0}, {'y': 4.0, 'z': -2.0}]}
+    response = yield http_client.fetch('%s/model/double:classify' % base_url, method='POST', body=body)
+    assert len(json.loads(response.body)['result']['classifications']) == 2
+    assert app.settings['offloader'].stats() == {'inline': 0, 'offloaded': 3}
+
+@pytest.mark.gen_test
+def test_predict_chunked_body(app, http_client, base_url):
+    body = json.dumps({'format': 'columns', 'instances': [{'x': float(i)} for i in range(100)]})
+
+    @gen.coroutine
+    def body_producer(write):
+        for i in range(0, len(body), 7):
+            yield write(body[i:i + 7])
+
+    response = yield http_client.fetch(HTTPRequest('%s/model/double:predict' % base_url,
+                                                   method='POST', body_producer=body_producer))
+    assert json.loads(response.body)['predictions']['y'] == [2.0 * i for i in range(100)]
+
+@pytest.mark.gen_test
+def test_predict_body_too_large(app, http_client, base_url):
+    app.settings['max_body_size'] = 100
+    body = json.dumps({'instances': [{'x': float(i)} for i in range(100)]})
+    with pytest.raises(Exception) as e:
+        yield http_client.fetch('%s/model/double:predict' % base_url, method='POST', body=body)
+    assert e.value.code == 413
+    assert len(app.settings['stub'].requests) == 0
+
+class PendingStub(object):
+    """Fake PredictionService stub answering like DoublingStub once released."""
+
+    def __init__(self):
+        self.Predict = self
+        self.requests = []
+        self.pending = []
+
+    def future(self, request, timeout):
+        self.requests.append(request)
+        f = Future()
+        self.pending.append((request, f))
+        return f
+
+    def release(self):
+        pending, self.pending = self.pending, []
+        for request, f in pending:
+            f.set_result(DoublingStub().future(request, None).result())
+
+@gen.coroutine
+def wait_for(condition):
+    while not condition():
+        yield gen.sleep(0.005)
+
+@pytest.mark.gen_test
+def test_admission_control(app, http_client, base_url):
+    stub = app.settings['stub'] = PendingStub()
+    admission = app.settings['admission'] = AdmissionController(max_concurrency=1, max_queue=1)
+    body = json.dumps({'instances': [{'x': 1.0}]})
+    url = '%s/model/double:predict' % base_url
+    first = http_client.fetch(url, method='POST', body=body)
+    yield wait_for(lambda: stub.pending)
+    second = http_client.fetch(url, method='POST', body=body)
+    yield wait_for(lambda: admission.stats()['double']['queued'])
+
+    with pytest.raises(Exception) as e:
+        yield http_client.fetch(url, method='POST', body=body)
+    assert e.value.code == 503
+    assert e.value.response.headers['Retry-After'] == '1'
+
+    stub.release()
+    yield first
+    yield wait_for(lambda: stub.pending)
+    stub.release()
+    response = yield second
+    assert json.loads(response.body) == {'predictions': [{'y': 2.0, 'z': -1.0}]}
+    assert admission.stats() == {'double': {'active': 0, 'queued': 0, 'shed': 1}}
+    response = yield http_client.fetch('%s/metrics' % base_url)
+    assert 'http_proxy_admission_shed_total{model="double",reason="queue_full"}' in response.body.decode('utf-8')
+
+@pytest.mark.gen_test
+def test_unknown_models_share_an_admission_gate(app, http_client, base_url):
+    admission = app.settings['admission'] = AdmissionController(max_concurrency=1, max_queue=1)
+    body = json.dumps({'instances': [{'x': 1}]})
+    for model in ['double', 'random-1', 'random-2']:
+        yield http_client.fetch('%s/model/%s:classify' % (base_url, model), method='POST', body=body)
+    assert sorted(admission._gates) == sorted(['double', UNKNOWN_MODELS])
+
+@pytest.mark.gen_test
+def test_coalesced_predictions(app, http_client, base_url):
+    stub = app.settings['stub'] = PendingStub()
+    coalescer = app.settings['coalescer'] = SingleFlight()
+    url = '%s/model/double:predict' % base_url
+    body = json.dumps({'instances': [{'x': 1.0}]})
+    other_body = json.dumps({'instances': [{'x': 2.0}]})
+    responses = [http_client.fetch(url, method='POST', body=body) for _ in range(3)]
+    responses.append(http_client.fetch(url, method='POST', body=other_body))
+    responses.append(http_client.fetch(url + '?signature_name=serving_default', method='POST', body=body))
+    # Requests with a deadline are never coalesced.
+    responses.append(http_client.fetch(url, method='POST', body=body,
+                                       headers={'X-Request-Timeout-Ms': '10000'}))
+    yield wait_for(lambda: coalescer.stats()['calls'] == 5 and len(stub.requests) == 4)
+    stub.release()
+    responses = yield responses
+    bodies = [json.loads(response.body) for response in responses]
+    assert bodies[:3] + bodies[4:] == [{'predictions': [{'y': 2.0, 'z': -1.0}]}] * 5
+    assert bodies[3] == {'predictions': [{'y': 4.0, 'z': -2.0}]}
+    assert coalescer.stats() == {'calls': 5, 'coalesced': 2, 'in_flight': 0}
+
+    app.settings['stub'] = DoublingStub()
+    yield http_client.fetch(url, method='POST', body=body)
+    assert coalescer.stats()['coalesced'] == 2
+    response = yield http_client.fetch('%s/metrics' % base_url)
+    assert 'http_proxy_coalesced_requests_total{method="predict",model="double"} 2.0' in response.body.decode('utf-8')
+
+@pytest.mark.gen_test
+def test_batch_predict(app, http_client, base_url):
+    stub = app.settings['stub'] = PendingStub()
+    app.settings['signature_cache'].put('cached', doubling_signature_map(), version='3')
+    body = json.dumps({'instances': [{'x': 1.0}, {'x': 2.0}],
+                       'targets': [{'model': 'double'}, {'model': 'missing'},
+                                   {'model': 'cached', 'version': 3, 'signature_name': 'serving_default',
+                                    'outputs': ['y']}],
+                       'format': 'columns'})
+    response = http_client.fetch('%s/models:batchPredict' % base_url, method='POST', body=body)
+    # Both calls are in flight at once.
+    yield wait_for(lambda: len(stub.pending) == 2)
+    assert [r.model_spec.name for r in stub.requests] == ['double', 'cached']
+    assert stub.requests[1].model_spec.version.value == 3
+    stub.release()
+    response = yield response
+    assert json.loads(response.body) == {'results': [
+        {'model': 'double', 'predictions': {'y': [2.0, 4.0], 'z': [-1.0, -2.0]}},
+        {'model': 'missing', 'code': 503, 'error': 'Signatures of model missing are not available'},
+        {'model': 'cached', 'predictions': {'y': [2.0, 4.0]}}]}
+
+@pytest.mark.gen_test
+def test_batch_predict_errors(app, http_client, base_url):
+    url = '%s/models:batchPredict' % base_url
+    for body in [{'instances': [{'x': 1.0}]}, {'targets': [{'model': 'double'}]},
+                 {'instances': [{'x': 1.0}], 'targets': [{'version': 1}]}]:
+        with pytest.raises(Exception) as e:
+            yield http_client.fetch(url, method='POST', body=json.dumps(body))
+        assert e.value.code == 400
+
+    body = json.dumps({'instances': [{'w': 1.0}], 'targets': [{'model': 'double'}]})
+    response = yield http_client.fetch(url, method='POST', body=body)
+    assert json.loads(response.body) == {'results': [
+        {'model': 'double', 'code': 400, 'error': 'Every instance must have a value for input x.'}]}
+
+@pytest.mark.gen_test
+def test_deadline_header(app, http_client, base_url):
+    app.settings['rpc_timeouts'] = RpcTimeouts(1.0, overrides={'cached': 3.0})
+    body = json.dumps({'instances': [{'x': 1.0}]})
+    url = '%s/model/double:predict' % base_url
+    yield http_client.fetch(url, method='POST', body=body)
+    yield http_client.fetch(url, method='POST', body=body, headers={'X-Request-Timeout-Ms': '200'})
+    yield http_client.fetch('%s/model/cached:predict' % base_url, method='POST', body=body,
+                            headers={'X-Request-Timeout-Ms': '5000'})
+    timeouts = app.settings['stub'].timeouts
+    assert timeouts[0] == 1.0
+    assert 0.1 < timeouts[1] < 0.2
+    assert timeouts[2] == 3.0
+
+    for header, code in [('0', 504), ('soon', 400)]:
+        with pytest.raises(Exception) as e:
+            yield http_client.fetch(url, method='POST', body=body,
+                                    headers={'X-Request-Timeout-Ms': header})
+        assert e.value.code == code
+    assert len(timeouts) == 3
+
+@pytest.mark.gen_test
+def test_rpc_timeout(app, http_client, base_url):
+    app.settings['stub'] = FailingStub()
+    body = json.dumps({'instances': [{'x': 1.0}]})
+    with pytest.raises(Exception) as e:
+        yield http_client.fetch('%s/model/double:predict' % base_url, method='POST', body=body)
+    assert e.value.code == 504
+
+@pytest.mark.gen_test
+def test_ready(app, http_client, base_url):
+    response = yield http_client.fetch('%s/ready' % base_url)
+    assert response.code == 200
+
+    class ColdWarmer(object):
+        ready = False
+
+    app.settings['warmer'] = ColdWarmer()
+    with pytest.raises(Exception) as e:
+        yield http_client.fetch('%s/ready' % base_url)
+    assert e.value.code == 503
+
+
+class DoublingServicer(prediction_service_pb2.PredictionServiceServicer):
+    """PredictionService answering y = 2 * x and z = -x, and NOT_FOUND for model missing."""
+
+    def Predict(self, request, context):
+        if request.model_spec.name == 'missing':
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details('Servable not found')
+            return predict_pb2.PredictResponse()
+        return DoublingStub().future(request, None).result()
+
+
+@pytest.fixture
+def grpc_port(request):
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+    prediction_service_pb2.add_PredictionServiceServicer_to_server(DoublingServicer(), server)
+    port = server.add_insecure_port('127.0.0.1:0')
+    server.start()
+    request.addfinalizer(lambda: server.stop(0))
+    return port
+
+@pytest.mark.parametrize('engine', [BETA_ENGINE, GA_ENGINE])
+@pytest.mark.gen_test
+def test_grpc_engines(app, http_client, base_url, grpc_port, engine):
+    app.settings['stub'] = create_stub('127.0.0.1', grpc_port, engine=engine)
+    body = json.dumps({'instances': [{'x': 1.0}, {'x': 2.0}]})
+    response = yield http_client.fetch('%s/model/double:predict' % base_url, method='POST', body=body)
+    assert json.loads(response.body) == {'predictions': [{'y': 2.0, 'z': -1.0}, {'y': 4.0, 'z': -2.0}]}
+
+    app.settings['signature_cache'].put('missing', doubling_signature_map())
+    with pytest.raises(Exception) as e:
+        yield http_client.fetch('%s/model/missing:predict' % base_url, method='POST', body=body)
+    assert e.value.code == 500
+
+def test_unknown_grpc_engine():
+    with pytest.raises(ValueError):
+        create_stub('127.0.0.1', 9000, engine='aio')
+
+def test_offload_executor_turns_streaming_off(request):
+    saved = options.offload_executor, options.stream_request_body
+
+    def restore():
+        options.offload_executor, options.stream_request_body = saved
+    request.addfinalizer(restore)
+    options.offload_executor, options.stream_request_body = '', None
+    assert stream_request_body()
+    options.offload_executor = THREAD_EXECUTOR
+    assert not stream_request_body()
+    options.stream_request_body = True
+    assert stream_request_body()
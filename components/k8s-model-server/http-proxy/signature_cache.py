@@ -0,0 +1,258 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Asynchronous cache of the signature maps served by the model server.
+
+Signature maps are fetched with a non blocking GetModelMetadata call, at most
+once at a time per model and version. Entries expire after a TTL; an expired
+entry keeps being served while it is refreshed in the background. Failed
+lookups are only cached for a short time so that a model which is still
+loading becomes usable as soon as it is available.
+"""
+
+import logging
+import time
+
+from tensorflow_serving.apis import get_model_metadata_pb2
+from tornado import gen
+
+from input_plans import InputPlan
+from tornado_grpc import fwrap
+
+
+# The signature used when none is named, see
+# tensorflow.python.saved_model.signature_constants.
+DEFAULT_SERVING_SIGNATURE_DEF_KEY = 'serving_default'
+
+
+def get_signature(signature_map, signature_name=None):
+  """Gets tensorflow signature for the given signature_name.
+
+  Args:
+    signature_name: string The signature name to use to choose the signature
+                    from the signature map.
+
+  Returns:
+    a pair of signature_name and signature. The first element is the
+    signature name in string that is actually used. The second one is the
+    signature.
+
+  Raises:
+    KeyError: when the signature is not found with the given signature
+    name or when there are more than one signatures in the signature map.
+  """
+  # The way to find signature is:
+  # 1) if signature_name is specified, try to find it in the signature_map. If
+  # not found, raise an exception.
+  # 2) if signature_name is not specified, check if signature_map only
+  # contains one entry. If so, return the only signature.
+  # 3) Otherwise, use the default signature_name and do 1).
+  if not signature_name and len(signature_map) == 1:
+    return signature_map.keys()[0], signature_map.values()[0]
+
+  key = signature_name or DEFAULT_SERVING_SIGNATURE_DEF_KEY
+  if key in signature_map:
+    return key, signature_map[key]
+  else:
+    raise KeyError("No signature found for signature key %s." % signature_name)
+
+
+class SignatureMap(dict):
+  """The signatures of a model by name, with the InputPlan of each one.
+
+  The plans are compiled once, when the signatures are fetched, and shared
+  by every request to the model. A signature whose plan can not be compiled,
+  e.g. because an input has an unsupported dtype, is still served to the
+  requests which do not encode instances with it, like :metadata; the others
+  are rejected with the error of its plan.
+  """
+
+  def __init__(self, signatures):
+    super(SignatureMap, self).__init__(signatures)
+    self.input_plans = {}
+    self.plan_errors = {}
+    for name, signature in self.items():
+      try:
+        self.input_plans[name] = InputPlan(signature.inputs)
+      except ValueError as e:
+        logging.warn("Signature %s can not encode instances: %s", name, e)
+        self.plan_errors[name] = str(e)
+
+
+def get_input_plan(signature_map, signature_name):
+  """Returns the InputPlan of a signature, compiled on the fly for plain maps.
+
+  Raises:
+    ValueError: when the plan of the signature can not be compiled.
+  """
+  plans = getattr(signature_map, 'input_plans', None)
+  if plans is None:
+    return InputPlan(signature_map[signature_name].inputs)
+  if signature_name in signature_map.plan_errors:
+    raise ValueError("Signature %s can not be used with instances: %s"
+                     % (signature_name, signature_map.plan_errors[signature_name]))
+  return plans[signature_name]
+
+
+def signature_map_from_metadata(response):
+  """Extracts the usable signatures from a GetModelMetadataResponse.
+
+  Args:
+    response: The GetModelMetadataResponse of the model server.
+
+  Returns:
+    The signature map of the model.
+  """
+  signature_def_map_proto = get_model_metadata_pb2.SignatureDefMap()
+  response.metadata["signature_def"].Unpack(signature_def_map_proto)
+  signature_def_map = signature_def_map_proto.signature_def
+  if not signature_def_map:
+    logging.error("Graph has no signatures.")
+
+  # Delete incomplete signatures without input dtypes.
+  invalid_signatures = []
+  for signature_name in signature_def_map:
+    for tensor in signature_def_map[signature_name].inputs.values():
+      if not tensor.dtype:
+        logging.warn("Signature %s has incomplete dtypes, removing from "
+                     "usable signatures", signature_name)
+        invalid_signatures.append(signature_name)
+        break
+  for signature_name in invalid_signatures:
+    del signature_def_map[signature_name]
+
+  return signature_def_map
+
+
+class _Entry(object):
+
+  def __init__(self, signature_map, model_version, expires_at):
+    self.signature_map = signature_map
+    self.model_version = model_version
+    self.expires_at = expires_at
+
+
+class SignatureCache(object):
+  """Caches the signature map of every model, and version, served.
+
+  Args:
+    stub: The grpc stub to call GetModelMetadata.
+    ttl: Seconds after which a signature map is refreshed.
+    negative_ttl: Seconds after which a failed lookup is retried.
+    rpc_timeout: Seconds for the GetModelMetadata call to time out.
+    clock: Function returning the current time in seconds.
+
+    Usage::
+
+      cache = SignatureCache(stub)
+
+      @coroutine
+      def my_fn(model_name):
+        signature_map = yield cache.get(model_name)
+  """
+
+  def __init__(self, stub, ttl=300.0, negative_ttl=5.0, rpc_timeout=20.0,
+               clock=time.time):
+    self.stub = stub
+    self.ttl = ttl
+    self.negative_ttl = negative_ttl
+    self.rpc_timeout = rpc_timeout
+    self._clock = clock
+    self._entries = {}
+    self._inflight = {}
+
+  def put(self, model_name, signature_map, version=None, model_version=None):
+    """Adds the signature map of a model to the cache."""
+    self._entries[(model_name, version)] = _Entry(
+        SignatureMap(signature_map), model_version, self._clock() + self.ttl)
+
+  def known(self, model_name, version=None):
+    """Returns whether a signature map of the model was fetched, without fetching it."""
+    entry = self._entries.get((model_name, version))
+    return entry is not None and entry.signature_map is not None
+
+  @gen.coroutine
+  def get(self, model_name, version=None):
+    """Gets the signature map of a model.
+
+    Args:
+      model_name: The model name.
+      version: The model version, or None for the latest one.
+
+    Returns:
+      A future resolving to the SignatureMap of the model, or to None when
+      it can not be fetched from the model server.
+    """
+    key = (model_name, version)
+    entry = self._entries.get(key)
+    if entry is not None and self._clock() >= entry.expires_at:
+      if entry.signature_map is None:
+        entry = None
+      else:
+        self._refresh(key)
+    if entry is not None:
+      raise gen.Return(entry.signature_map)
+    signature_map = yield self._refresh(key)
+    raise gen.Return(signature_map)
+
+  def observe_version(self, model_name, model_version):
+    """Notes the model version which answered a request for the latest model.
+
+    The signature map of the latest version is refreshed in the background
+    when the model server has loaded a new version of the model.
+    """
+    key = (model_name, None)
+    entry = self._entries.get(key)
+    if (entry is not None and entry.model_version is not None and
+        entry.model_version != model_version):
+      self._refresh(key)
+
+  def _refresh(self, key):
+    future = self._inflight.get(key)
+    if future is None:
+      future = self._inflight[key] = self._fetch(key)
+      future.add_done_callback(lambda f: self._done(key, f))
+    return future
+
+  def _done(self, key, future):
+    if self._inflight.get(key) is future:
+      del self._inflight[key]
+
+  @gen.coroutine
+  def _fetch(self, key):
+    model_name, version = key
+    request = get_model_metadata_pb2.GetModelMetadataRequest()
+    request.model_spec.name = model_name
+    if version is not None:
+      request.model_spec.version.value = int(version)
+    request.metadata_field.append("signature_def")
+    try:
+      response = yield fwrap(self.stub.GetModelMetadata.future(request, self.rpc_timeout))
+    except Exception as e:
+      logging.warn("GetModelMetadata call to model server for %s failed: %s",
+                   model_name, e)
+      entry = self._entries.get(key)
+      if entry is None or entry.signature_map is None:
+        entry = self._entries[key] = _Entry(None, None, 0)
+      # Keep serving a previously fetched signature map, but retry soon.
+      entry.expires_at = self._clock() + self.negative_ttl
+      raise gen.Return(entry.signature_map)
+
+    signature_map = SignatureMap(signature_map_from_metadata(response))
+    model_version = None
+    if response.model_spec.HasField("version"):
+      model_version = response.model_spec.version.value
+    self._entries[key] = _Entry(signature_map, model_version,
+                                self._clock() + self.ttl)
+    raise gen.Return(signature_map)
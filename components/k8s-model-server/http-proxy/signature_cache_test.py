@@ -0,0 +1,125 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import Future
+
+import pytest
+from tensorflow.core.framework import types_pb2
+from tensorflow_serving.apis import get_model_metadata_pb2
+from tornado import gen
+
+from signature_cache import SignatureCache
+
+
+class MetadataStub(object):
+    """Fake PredictionService stub serving one signature per model version."""
+
+    def __init__(self):
+        self.requests = []
+        self.version = 1
+        self.available = True
+        self.GetModelMetadata = self
+
+    def future(self, request, timeout):
+        self.requests.append(request)
+        f = Future()
+        if not self.available:
+            f.set_exception(RuntimeError('model not loaded'))
+            return f
+        signature_def_map = get_model_metadata_pb2.SignatureDefMap()
+        name = 'v%d' % self.version
+        signature_def_map.signature_def[name].inputs['x'].dtype = types_pb2.DT_FLOAT
+        response = get_model_metadata_pb2.GetModelMetadataResponse()
+        response.model_spec.name = request.model_spec.name
+        response.model_spec.version.value = self.version
+        response.metadata['signature_def'].Pack(signature_def_map)
+        f.set_result(response)
+        return f
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.gen_test
+def test_concurrent_lookups_share_one_rpc():
+    stub = MetadataStub()
+    cache = SignatureCache(stub)
+    first, second = yield [cache.get('m'), cache.get('m')]
+    assert len(stub.requests) == 1
+    assert list(first.keys()) == ['v1']
+    assert first is second
+    assert [column.name for column in first.input_plans['v1'].columns] == ['x']
+    yield cache.get('m')
+    assert len(stub.requests) == 1
+
+
+@pytest.mark.gen_test
+def test_versions_are_cached_separately():
+    stub = MetadataStub()
+    cache = SignatureCache(stub)
+    yield [cache.get('m'), cache.get('m', '1')]
+    assert len(stub.requests) == 2
+    assert stub.requests[1].model_spec.version.value == 1
+
+
+@pytest.mark.gen_test
+def test_expired_entry_is_served_while_refreshing():
+    stub = MetadataStub()
+    clock = Clock()
+    cache = SignatureCache(stub, ttl=10, clock=clock)
+    yield cache.get('m')
+    stub.version = 2
+    clock.now += 11
+    signature_map = yield cache.get('m')
+    assert list(signature_map.keys()) == ['v1']
+    yield gen.sleep(0.01)
+    signature_map = yield cache.get('m')
+    assert list(signature_map.keys()) == ['v2']
+
+
+@pytest.mark.gen_test
+def test_failed_lookup_is_retried_after_negative_ttl():
+    stub = MetadataStub()
+    stub.available = False
+    clock = Clock()
+    cache = SignatureCache(stub, negative_ttl=5, clock=clock)
+    signature_map = yield cache.get('m')
+    assert signature_map is None
+    stub.available = True
+    signature_map = yield cache.get('m')
+    assert signature_map is None
+    clock.now += 6
+    signature_map = yield cache.get('m')
+    assert list(signature_map.keys()) == ['v1']
+
+
+@pytest.mark.gen_test
+def test_new_model_version_triggers_refresh():
+    stub = MetadataStub()
+    cache = SignatureCache(stub)
+    yield cache.get('m')
+    cache.observe_version('m', 1)
+    assert len(stub.requests) == 1
+    stub.version = 2
+    cache.observe_version('m', 2)
+    yield gen.sleep(0.01)
+    signature_map = yield cache.get('m')
+    assert list(signature_map.keys()) == ['v2']
+    assert len(stub.requests) == 2
@@ -0,0 +1,82 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Aggregation of the stats of the worker processes of the proxy.
+
+In multi-process mode every worker periodically writes a snapshot of its own
+stats into a directory shared by all workers, in a file named after its task
+id. Any worker can then serve the sum of all of them.
+"""
+
+import glob
+import json
+import logging
+import numbers
+import os
+
+from tornado.ioloop import PeriodicCallback
+
+
+def merge_stats(snapshots):
+  """Sums stats snapshots, which are nested dicts of numbers."""
+  merged = {}
+  for snapshot in snapshots:
+    for key, value in snapshot.items():
+      if isinstance(value, dict):
+        merged[key] = merge_stats([merged.get(key, {}), value])
+      elif isinstance(value, numbers.Number):
+        merged[key] = merged.get(key, 0) + value
+  return merged
+
+
+class StatsReporter(object):
+  """Shares the stats of one worker process with the other ones.
+
+  Args:
+    stats_dir: The directory shared by the workers.
+    worker_id: The task id of this worker.
+    collect: Function returning the stats of this worker.
+    interval_sec: Seconds between two snapshots.
+  """
+
+  def __init__(self, stats_dir, worker_id, collect, interval_sec=1.0):
+    self.stats_dir = stats_dir
+    self.path = os.path.join(stats_dir, 'worker-%d.json' % worker_id)
+    self.collect = collect
+    self.interval_sec = interval_sec
+
+  def start(self):
+    self.write()
+    PeriodicCallback(self.write, self.interval_sec * 1000).start()
+
+  def write(self):
+    """Writes the stats of this worker, atomically."""
+    tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+    with open(tmp_path, 'w') as f:
+      json.dump(self.collect(), f)
+    os.rename(tmp_path, self.path)
+
+  def aggregate(self):
+    """Returns the sum of the latest stats of every worker."""
+    self.write()
+    snapshots = []
+    for path in glob.glob(os.path.join(self.stats_dir, 'worker-*.json')):
+      try:
+        with open(path) as f:
+          snapshots.append(json.load(f))
+      except (IOError, ValueError) as e:
+        logging.warn("Could not read worker stats %s: %s", path, e)
+    merged = merge_stats(snapshots)
+    merged['processes'] = len(snapshots)
+    return merged
@@ -0,0 +1,34 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from stats import StatsReporter, merge_stats
+
+
+def test_merge_stats():
+    merged = merge_stats([{'cache': {'hits': 1, 'misses': 2}, 'name': 'a'},
+                          {'cache': {'hits': 3}, 'requests': 4}])
+    assert merged == {'cache': {'hits': 4, 'misses': 2}, 'requests': 4}
+
+
+def test_workers_stats_are_aggregated(tmpdir):
+    first = StatsReporter(str(tmpdir), 0, lambda: {'cache': {'hits': 1}})
+    second = StatsReporter(str(tmpdir), 1, lambda: {'cache': {'hits': 2}})
+    second.write()
+    assert first.aggregate() == {'cache': {'hits': 3}, 'processes': 2}
+
+
+def test_restarted_worker_replaces_its_stats(tmpdir):
+    StatsReporter(str(tmpdir), 0, lambda: {'hits': 5}).write()
+    restarted = StatsReporter(str(tmpdir), 0, lambda: {'hits': 1})
+    assert restarted.aggregate() == {'hits': 1, 'processes': 1}
@@ -0,0 +1,294 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Incremental parsing of json predict bodies, chunk by chunk.
+
+The body is scanned as it is received, only looking at brackets and strings.
+Every element of the instances array is decoded as soon as it is complete
+and its values appended to one buffer per signature input, which are
+converted into arrays of the input dtype every few hundred instances. The
+raw body and the decoded json tree of the whole batch are never held in
+memory.
+
+The other keys of the body are decoded at the end. Instances are encoded
+with the signature named by the `signature_name` query argument or, when
+it comes before the instances, by the `signature_name` key of the body.
+"""
+
+import json
+import re
+
+import numpy as np
+from tensorflow_serving.apis import predict_pb2
+
+from metrics import recorded
+from request_formats import decode_b64_if_needed, has_b64
+from signature_cache import get_input_plan, get_signature
+from tensor_codec import ndarray_to_tensor_proto
+
+
+_STRUCTURE = re.compile(br'[{}\[\]"]')
+_STRING_END = re.compile(br'["\\]')
+
+
+class _Column(object):
+  """Values of one input, converted into arrays every `rows_per_chunk` rows."""
+
+  def __init__(self, plan, rows_per_chunk):
+    self.plan = plan
+    self.name = plan.name
+    self.rows_per_chunk = rows_per_chunk
+    self.values = []
+    self.chunks = []
+    self.rows = 0
+
+  def append(self, value):
+    if not self.rows and not self.values:
+      # The first instance is checked before the rest of the body is read.
+      self.plan.check(value, 0)
+    self.values.append(value)
+    if len(self.values) >= self.rows_per_chunk:
+      self.flush()
+
+  def flush(self):
+    if self.values:
+      self.chunks.append(self.plan.stack(self.values, self.rows))
+      self.rows += len(self.values)
+      self.values = []
+
+  def tensor_proto(self):
+    self.flush()
+    if len(self.chunks) == 1:
+      array = self.chunks[0]
+    elif len(set(chunk.shape[1:] for chunk in self.chunks)) != 1:
+      raise ValueError("Instances have different shapes for input %s." % self.name)
+    else:
+      array = np.concatenate(self.chunks)
+    self.chunks = []
+    return ndarray_to_tensor_proto(array, self.plan.tensor_info.dtype)
+
+
+class PredictBodyParser(object):
+  """Builds a PredictRequest from a json body fed chunk by chunk.
+
+  Args:
+    signature_map: The signatures of the model.
+    signature_name: The `signature_name` query argument, or None.
+    request_key: The key of the instances in the body.
+    codec: The JsonCodec decoding the instances.
+    log_prob: The probability to keep each instance for the request log.
+    rows_per_chunk: Number of instances whose values are converted at once.
+
+    Usage::
+
+      parser = PredictBodyParser(signature_map, None, 'instances', get_codec())
+      for chunk in chunks:
+        parser.feed(chunk)
+      request, request_data = parser.finish()
+  """
+
+  def __init__(self, signature_map, signature_name, request_key, codec, log_prob=0.0,
+               rows_per_chunk=256):
+    self.signature_map = signature_map
+    self.signature_name = signature_name
+    self.codec = codec
+    self.rows_per_chunk = rows_per_chunk
+    self.num_rows = 0
+    self.phases = {}
+    self.logged_instances = []
+    # Logged instances are drawn through the gaps between them.
+    self._log_prob = min(log_prob, 1.0)
+    self._next_logged = np.random.geometric(self._log_prob) - 1 if log_prob > 0 else None
+    self._request_key = request_key
+    self._key = re.compile(re.escape(json.dumps(request_key).encode('utf-8')) + br'\s*:\s*$')
+    self._signature = None
+    self._columns = None
+    # Unconsumed text, and the position where scanning resumes in it.
+    self._data = b''
+    self._pos = 0
+    self._depth = 0
+    self._in_string = False
+    self._closed = False
+    # Text of the body outside of the instances array, which is replaced by
+    # null, and the position where the current piece of it starts.
+    self._rest = []
+    self._rest_start = 0
+    self._in_instances = False
+    self._found_instances = False
+    # Start of the current instance, or of the text before the next one.
+    self._element_start = None
+    self._gap_start = 0
+
+  def feed(self, chunk):
+    """Parses the next chunk of the body.
+
+    Raises:
+      ValueError: when the body is not a valid predict request.
+    """
+    with recorded(self.phases, 'decode'):
+      self._data += chunk
+      self._scan()
+      self._discard()
+
+  def finish(self):
+    """Returns the PredictRequest and the dict of the other keys of the body.
+
+    The model spec of the request only has its signature name.
+
+    Raises:
+      ValueError: when the body is not a valid predict request.
+    """
+    if not self._closed or self._data[self._pos:].strip():
+      raise ValueError('Request body is not a complete json object.')
+    self._rest.append(self._data[self._rest_start:self._pos])
+    with recorded(self.phases, 'decode'):
+      request_data = self.codec.loads(b''.join(self._rest))
+    if not self._found_instances or not self.num_rows:
+      raise ValueError('Request json object have to use the key %s with a '
+                       'non empty list of instances' % self._request_key)
+    signature_name, signature = self._signature
+    body_signature_name = request_data.get('signature_name')
+    if self.signature_name is None and body_signature_name not in (None, signature_name):
+      _, body_signature = self._select_signature(body_signature_name)
+      if body_signature.inputs != signature.inputs:
+        raise ValueError('The signature_name key has to come before the instances.')
+      signature_name = body_signature_name
+
+    with recorded(self.phases, 'encode'):
+      request = predict_pb2.PredictRequest()
+      request.model_spec.signature_name = signature_name
+      for column in self._columns:
+        request.inputs[column.name].CopyFrom(column.tensor_proto())
+    return request, request_data
+
+  def _select_signature(self, signature_name):
+    try:
+      return get_signature(self.signature_map, signature_name)
+    except KeyError as e:
+      raise ValueError(e.args[0])
+
+  def _scan(self):
+    data = self._data
+    pos = self._pos
+    end = len(data)
+    while pos < end:
+      if self._in_string:
+        match = _STRING_END.search(data, pos)
+        if match is None:
+          pos = end
+        elif data[match.start():match.end()] == b'\\':
+          if match.end() == end:
+            # The escaped character is in the next chunk.
+            pos = match.start()
+            break
+          pos = match.end() + 1
+        else:
+          self._in_string = False
+          pos = match.end()
+        continue
+
+      match = _STRUCTURE.search(data, pos)
+      if match is None:
+        pos = end
+        break
+      i = match.start()
+      token = data[i:i + 1]
+      pos = i + 1
+      if self._closed:
+        raise ValueError('Request body has data after its json object.')
+      if token == b'"':
+        self._in_string = True
+      elif token in b'{[':
+        self._depth += 1
+        if self._in_instances and self._depth == 3:
+          self._start_instance(i)
+        elif token == b'[' and self._depth == 2 and not self._in_instances:
+          self._maybe_start_instances(i)
+      else:
+        self._depth -= 1
+        if self._depth < 0:
+          raise ValueError('Request body is not a valid json object.')
+        if self._in_instances and self._depth == 2:
+          self._add_instance(data[self._element_start:pos])
+          self._element_start = None
+          self._gap_start = pos
+        elif self._in_instances and self._depth == 1:
+          if data[self._gap_start:i].strip():
+            raise ValueError('Instances have to be json objects or arrays.')
+          self._in_instances = False
+          self._rest_start = pos
+        elif self._depth == 0:
+          self._closed = True
+    self._pos = pos
+
+  def _maybe_start_instances(self, i):
+    prefix = self._data[self._rest_start:i]
+    if self._found_instances or not self._key.search(b''.join(self._rest) + prefix):
+      return
+    self._rest.append(prefix + b'null')
+    self._in_instances = True
+    self._found_instances = True
+    self._gap_start = i + 1
+
+  def _start_instance(self, i):
+    separator = self._data[self._gap_start:i].strip()
+    if separator != (b',' if self.num_rows else b''):
+      raise ValueError('Instances have to be json objects or arrays.')
+    self._element_start = i
+    if self._columns is None:
+      self._start_columns()
+
+  def _start_columns(self):
+    signature_name = self.signature_name
+    if signature_name is None:
+      # The text before the instances ends with their key and null, closing
+      # it gives the top level keys which come before them.
+      signature_name = self.codec.loads(b''.join(self._rest) + b'}').get('signature_name')
+    self._signature = self._select_signature(signature_name)
+    plan = get_input_plan(self.signature_map, self._signature[0])
+    self._columns = [_Column(column, self.rows_per_chunk) for column in plan.columns]
+
+  def _add_instance(self, text):
+    instance = self.codec.loads(text)
+    if has_b64(text):
+      with recorded(self.phases, 'b64_decode'):
+        instance = decode_b64_if_needed(instance)
+    if self._next_logged == self.num_rows:
+      self.logged_instances.append(instance)
+      self._next_logged += np.random.geometric(self._log_prob)
+    with recorded(self.phases, 'encode'):
+      for column in self._columns:
+        try:
+          value = instance[column.name]
+        except (KeyError, TypeError):
+          raise ValueError("Every instance must have a value for input %s." % column.name)
+        column.append(value)
+    self.num_rows += 1
+
+  def _discard(self):
+    """Drops the text which has been scanned and is not needed anymore."""
+    if not self._in_instances:
+      self._rest.append(self._data[self._rest_start:self._pos])
+      self._rest_start = keep = self._pos
+    elif self._element_start is not None:
+      keep = self._element_start
+    else:
+      keep = self._gap_start
+    if keep:
+      self._data = self._data[keep:]
+      self._pos -= keep
+      self._rest_start = max(self._rest_start - keep, 0)
+      self._gap_start = max(self._gap_start - keep, 0)
+      if self._element_start is not None:
+        self._element_start -= keep
@@ -0,0 +1,118 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import json
+
+import pytest
+from tensorflow.core.framework import types_pb2
+from tensorflow.core.protobuf import meta_graph_pb2
+
+from json_codec import get_codec
+from server_test import doubling_signature_map
+from server import parse_predict_request
+from streaming import PredictBodyParser
+from tensor_codec import tensor_proto_to_ndarray
+
+
+def signature_map():
+    signatures = doubling_signature_map()
+    images = meta_graph_pb2.SignatureDef()
+    images.inputs['image'].dtype = types_pb2.DT_STRING
+    images.inputs['x'].dtype = types_pb2.DT_FLOAT
+    signatures['images'] = images
+    return signatures
+
+def parse(body, chunk_size, signature_name=None, **kwargs):
+    parser = PredictBodyParser(signature_map(), signature_name, 'instances', get_codec(),
+                               rows_per_chunk=2, **kwargs)
+    for i in range(0, len(body), chunk_size):
+        parser.feed(body[i:i + chunk_size])
+    request, request_data = parser.finish()
+    return parser, request, request_data
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 5, 1 << 20])
+def test_parse(chunk_size):
+    body = json.dumps({'format': 'columns',
+                       'instances': [{'x': 1.0, 'note': '"]}\\'}, {'x': 2.0}, {'x': 3}],
+                       'other': [1, {'a': '['}]})
+    parser, request, request_data = parse(body, chunk_size)
+    assert tensor_proto_to_ndarray(request.inputs['x']).tolist() == [1.0, 2.0, 3.0]
+    assert request.model_spec.signature_name == 'serving_default'
+    assert request_data == {'format': 'columns', 'instances': None, 'other': [1, {'a': '['}]}
+    assert parser.num_rows == 3
+    assert set(parser.phases) == {'decode', 'encode'}
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 1 << 20])
+def test_signature_name_before_instances(chunk_size):
+    body = ('{"signature_name": "images", "instances": [{"x": 1.0, "image": {"b64": "%s"}}, '
+            '{"x": 2.0, "image": "a"}]}' % base64.b64encode(b'\xff\x00').decode('ascii'))
+    parser, request, request_data = parse(body, chunk_size)
+    assert request.model_spec.signature_name == 'images'
+    assert request.inputs['image'].string_val == [b'\xff\x00', b'a']
+
+@pytest.mark.parametrize('body', [
+    b'{"instances": [{"x": 1.0}]}',
+    b'{"signature_name": "images", "instances": [{"x": 1.0, "image": "a"}]}',
+    b'{"meta": {"signature_name": "nope"}, "instances": [{"x": 1.0}]}',
+    b'{"meta": ["signature_name", "nope"], "signature_name": "images", '
+    b'"instances": [{"x": 1.0, "image": "a"}]}',
+])
+def test_parse_like_complete_bodies(body):
+    _, request, _ = parse(body, 3)
+    expected = parse_predict_request(body, 'application/json', {}, 'm', None, signature_map(),
+                                     'instances', get_codec())[0]
+    assert request.model_spec.signature_name == expected.model_spec.signature_name
+    assert request.inputs == expected.inputs
+
+def test_signature_name_after_instances():
+    body = b'{"instances": [{"x": 1.0}], "signature_name": "images"}'
+    with pytest.raises(ValueError) as e:
+        parse(body, 4)
+    assert 'before the instances' in str(e.value)
+
+def test_signature_name_argument():
+    body = b'{"instances": [{"x": 1.0, "image": "a"}]}'
+    parser, request, request_data = parse(body, 4, signature_name='images')
+    assert request.model_spec.signature_name == 'images'
+
+def test_log_instances():
+    body = json.dumps({'instances': [{'x': float(i)} for i in range(5)]})
+    parser, _, _ = parse(body, 3, log_prob=1.0)
+    assert parser.logged_instances == [{'x': float(i)} for i in range(5)]
+    parser, _, _ = parse(body, 3)
+    assert parser.logged_instances == []
+
+@pytest.mark.parametrize('body', [
+    b'{"instances": [{"x": 1.0}]',
+    b'{"instances": [{"x": 1.0}]}}',
+    b'{"instances": [{"x": 1.0}]} {}',
+    b'{"instances": []}',
+    b'{"instances": {"x": 1.0}}',
+    b'{"inputs": [{"x": 1.0}]}',
+    b'{"instances": [1.0, 2.0]}',
+    b'{"instances": [{"x": 1.0} {"x": 2.0}]}',
+    b'{"instances": [{"y": 1.0}]}',
+    b'{"instances": [{"x": 1.0}, {"x": 2.0}, {"x": [3.0]}]}',
+    b'{"instances": [{"x": tru}]}',
+])
+def test_invalid(body):
+    with pytest.raises(ValueError):
+        parse(body, 3)
+
+def test_first_instance_is_checked_before_the_body_is_read():
+    parser = PredictBodyParser(signature_map(), None, 'instances', get_codec())
+    with pytest.raises(ValueError) as e:
+        parser.feed(b'{"instances": [{"x": "a"}, ')
+    assert 'Input x of instance 0 must be numbers' in str(e.value)
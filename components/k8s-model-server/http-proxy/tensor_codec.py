@@ -0,0 +1,249 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fast conversion between request instances, NumPy arrays and TensorProtos.
+
+`tf.make_tensor_proto` validates nested python lists element by element before
+converting them, which dominates the cost of large numeric batches. Here every
+signature input is stacked once, by its plan in `input_plans`, into a
+contiguous NumPy array of the dtype declared by the signature, and its buffer
+is copied into `tensor_content`.
+Outputs are read back the same way, straight from `tensor_content`.
+
+Only the protos of TensorFlow are used, so that the proxy does not need to
+import TensorFlow itself. NumPy has no bfloat16, so those values are handled
+as float32 and rounded to their upper 16 bits on the wire, and quantized
+types are handled as the integers they are stored as.
+"""
+
+from tensorflow.core.framework import tensor_pb2
+from tensorflow.core.framework import types_pb2
+import numpy as np
+
+
+# Types which can not be represented through `tensor_content`.
+_NON_CONTENT_TYPES = frozenset([
+    types_pb2.DT_STRING,
+    types_pb2.DT_RESOURCE,
+    types_pb2.DT_VARIANT,
+])
+
+_NUMPY_DTYPES = {
+    types_pb2.DT_FLOAT: np.float32,
+    types_pb2.DT_DOUBLE: np.float64,
+    types_pb2.DT_INT32: np.int32,
+    types_pb2.DT_UINT8: np.uint8,
+    types_pb2.DT_INT16: np.int16,
+    types_pb2.DT_INT8: np.int8,
+    types_pb2.DT_STRING: np.object_,
+    types_pb2.DT_COMPLEX64: np.complex64,
+    types_pb2.DT_INT64: np.int64,
+    types_pb2.DT_BOOL: np.bool_,
+    types_pb2.DT_UINT16: np.uint16,
+    types_pb2.DT_COMPLEX128: np.complex128,
+    types_pb2.DT_HALF: np.float16,
+    types_pb2.DT_UINT32: np.uint32,
+    types_pb2.DT_UINT64: np.uint64,
+    types_pb2.DT_BFLOAT16: np.float32,
+    types_pb2.DT_QINT8: np.int8,
+    types_pb2.DT_QUINT8: np.uint8,
+    types_pb2.DT_QINT16: np.int16,
+    types_pb2.DT_QUINT16: np.uint16,
+    types_pb2.DT_QINT32: np.int32,
+}
+
+# Fields of the values of tensors without `tensor_content`.
+_VALUE_FIELDS = {
+    types_pb2.DT_FLOAT: 'float_val',
+    types_pb2.DT_DOUBLE: 'double_val',
+    types_pb2.DT_INT32: 'int_val',
+    types_pb2.DT_UINT8: 'int_val',
+    types_pb2.DT_INT16: 'int_val',
+    types_pb2.DT_INT8: 'int_val',
+    types_pb2.DT_UINT16: 'int_val',
+    types_pb2.DT_STRING: 'string_val',
+    types_pb2.DT_COMPLEX64: 'scomplex_val',
+    types_pb2.DT_COMPLEX128: 'dcomplex_val',
+    types_pb2.DT_INT64: 'int64_val',
+    types_pb2.DT_BOOL: 'bool_val',
+    types_pb2.DT_HALF: 'half_val',
+    types_pb2.DT_UINT32: 'uint32_val',
+    types_pb2.DT_UINT64: 'uint64_val',
+    types_pb2.DT_BFLOAT16: 'half_val',
+    types_pb2.DT_QINT8: 'int_val',
+    types_pb2.DT_QUINT8: 'int_val',
+    types_pb2.DT_QINT16: 'int_val',
+    types_pb2.DT_QUINT16: 'int_val',
+    types_pb2.DT_QINT32: 'int_val',
+}
+
+
+def _as_bytes(value):
+  if isinstance(value, bytes):
+    return value
+  return value.encode('utf-8')
+
+
+def _float32_to_bfloat16_bits(array):
+  """Rounds float32 values to the nearest bfloat16, ties to even."""
+  bits = np.ascontiguousarray(array, dtype=np.float32).view(np.uint32).astype(np.uint64)
+  bits = (bits + 0x7FFF + ((bits >> 16) & 1)) >> 16
+  return bits.astype(np.uint16)
+
+
+def _bfloat16_bits_to_float32(bits):
+  return (np.asarray(bits, dtype=np.uint16).astype(np.uint32) << 16).view(np.float32)
+
+
+def numpy_dtype(dtype):
+  """Returns the NumPy dtype for a `types_pb2.DataType` enum value.
+
+  Raises:
+    ValueError: when the DataType has no NumPy equivalent, like resources.
+  """
+  try:
+    return np.dtype(_NUMPY_DTYPES[dtype])
+  except KeyError:
+    try:
+      name = types_pb2.DataType.Name(dtype)
+    except ValueError:
+      name = str(dtype)
+    raise ValueError("Unsupported tensor dtype: %s" % name)
+
+
+def column_dtype(tensor_info):
+  """Returns the NumPy dtype of the values of a signature input."""
+  if tensor_info.dtype in _NON_CONTENT_TYPES:
+    return np.dtype(object)
+  return numpy_dtype(tensor_info.dtype)
+
+
+def check_shape(array, tensor_info, name):
+  """Checks the inner dimensions of `array` against the signature.
+
+  Args:
+    array: The batch of values of one input, batch dimension first.
+    tensor_info: The `TensorInfo` of the input from the signature.
+    name: The name of the input, used in the error message.
+
+  Raises:
+    ValueError: when the shape of `array` is not compatible with the shape
+    declared by the signature.
+  """
+  shape = tensor_info.tensor_shape
+  if shape.unknown_rank or not shape.dim:
+    return
+  expected = [d.size for d in shape.dim]
+  actual = array.shape
+  if len(expected) != len(actual) or any(
+      e >= 0 and e != a for e, a in zip(expected[1:], actual[1:])):
+    raise ValueError("Input %s has shape %s which is not compatible with %s."
+                     % (name, list(actual), expected))
+
+
+def ndarray_to_tensor_proto(array, dtype):
+  """Converts a NumPy array into a TensorProto of the given DataType."""
+  tensor = tensor_pb2.TensorProto(dtype=dtype)
+  for size in array.shape:
+    tensor.tensor_shape.dim.add().size = size
+  if dtype in _NON_CONTENT_TYPES:
+    tensor.string_val.extend([_as_bytes(v) for v in array.ravel().tolist()])
+  elif dtype == types_pb2.DT_BFLOAT16:
+    tensor.tensor_content = _float32_to_bfloat16_bits(array).tobytes()
+  else:
+    array = np.ascontiguousarray(array, dtype=numpy_dtype(dtype))
+    tensor.tensor_content = array.tobytes()
+  return tensor
+
+
+def tensor_proto_to_ndarray(tensor):
+  """Converts a TensorProto into a NumPy array, like `tf.make_ndarray`.
+
+  Tensors stored in `tensor_content` are viewed in place, without copying.
+  Tensors with fewer values than elements are padded with their last value.
+
+  Raises:
+    ValueError: when the dtype is not supported or the values do not match
+    the shape.
+  """
+  shape = [d.size for d in tensor.tensor_shape.dim]
+  dtype = numpy_dtype(tensor.dtype)
+  if tensor.dtype == types_pb2.DT_BFLOAT16 and tensor.tensor_content:
+    bits = np.frombuffer(tensor.tensor_content, dtype=np.uint16)
+    return _bfloat16_bits_to_float32(bits).reshape(shape)
+  if tensor.tensor_content:
+    return np.frombuffer(tensor.tensor_content, dtype=dtype).reshape(shape)
+
+  values = getattr(tensor, _VALUE_FIELDS[tensor.dtype])
+  if tensor.dtype == types_pb2.DT_BFLOAT16:
+    # Like halves, bfloat16 values are stored as the integers of their bits.
+    array = _bfloat16_bits_to_float32(values)
+  elif tensor.dtype == types_pb2.DT_HALF:
+    # Halves are stored as the integers of their bits.
+    array = np.array(values, dtype=np.uint16).view(np.float16)
+  elif tensor.dtype in (types_pb2.DT_COMPLEX64, types_pb2.DT_COMPLEX128):
+    # Complex numbers are stored as pairs of real and imaginary parts.
+    array = np.array(values, dtype=dtype.char.lower()).view(dtype)
+  elif tensor.dtype == types_pb2.DT_STRING:
+    array = np.empty(len(values), dtype=object)
+    array[:] = list(values)
+  else:
+    array = np.array(values, dtype=dtype)
+
+  size = int(np.prod(shape))
+  if array.size == size:
+    return array.reshape(shape)
+  if array.size == 0:
+    return np.full(shape, b'' if dtype == object else 0, dtype=dtype)
+  if array.size < size:
+    return np.concatenate([array, np.repeat(array[-1:], size - array.size)]).reshape(shape)
+  raise ValueError("Tensor has %d values for shape %s." % (array.size, shape))
+
+
+def encode_arrays(request, arrays, inputs):
+  """Fills the inputs of a PredictRequest from one array per input.
+
+  Args:
+    request: The PredictRequest to fill.
+    arrays: A dict from input name to array, batch dimension first.
+    inputs: The `inputs` map of the signature used.
+
+  Raises:
+    ValueError: when an input is missing or does not match its dtype and
+    shape.
+  """
+  for name, tensor_info in inputs.items():
+    if name not in arrays:
+      raise ValueError("Missing array for input %s." % name)
+    array = arrays[name]
+    if tensor_info.dtype not in _NON_CONTENT_TYPES:
+      array = array.astype(numpy_dtype(tensor_info.dtype), copy=False)
+    check_shape(array, tensor_info, name)
+    request.inputs[name].CopyFrom(ndarray_to_tensor_proto(array, tensor_info.dtype))
+
+
+def decode_outputs(response, names=None):
+  """Converts the outputs of a PredictResponse into NumPy arrays.
+
+  Args:
+    response: The PredictResponse.
+    names: The names of the outputs to convert, all of them when empty.
+
+  Returns:
+    A list of (output name, array) pairs, sorted by output name.
+  """
+  keys = response.outputs.keys()
+  if names:
+    keys = [key for key in keys if key in names]
+  return [(key, tensor_proto_to_ndarray(response.outputs[key])) for key in sorted(keys)]
@@ -0,0 +1,86 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+import tensorflow as tf
+from tensorflow.core.framework import tensor_pb2
+from tensorflow.core.framework import types_pb2
+from tensorflow_serving.apis import predict_pb2
+
+from tensor_codec import decode_outputs, ndarray_to_tensor_proto, numpy_dtype, tensor_proto_to_ndarray
+
+
+@pytest.mark.parametrize('dtype, values', [
+    (types_pb2.DT_FLOAT, [[1.5, -2.0], [3.0, 4.0]]),
+    (types_pb2.DT_DOUBLE, [0.1, 0.2]),
+    (types_pb2.DT_INT32, [[1, -2, 3]]),
+    (types_pb2.DT_UINT8, [1, 255]),
+    (types_pb2.DT_INT8, [-1, 1]),
+    (types_pb2.DT_INT64, [1 << 40, -3]),
+    (types_pb2.DT_UINT16, [65535, 0]),
+    (types_pb2.DT_BOOL, [[True], [False]]),
+    (types_pb2.DT_HALF, [0.5, -1.25]),
+    (types_pb2.DT_COMPLEX64, [1 + 2j, -3j]),
+    (types_pb2.DT_COMPLEX128, [[1 + 2j], [3 - 4j]]),
+    (types_pb2.DT_STRING, [[b'a', b'bc'], [b'', b'd']]),
+])
+def test_tensor_proto_to_ndarray_matches_make_ndarray(dtype, values):
+    tensor = tf.make_tensor_proto(values, dtype)
+    expected = tf.make_ndarray(tensor)
+    array = tensor_proto_to_ndarray(tensor)
+    assert array.dtype == expected.dtype
+    np.testing.assert_array_equal(array, expected)
+    # Arrays without tensor_content are converted back into typed values.
+    np.testing.assert_array_equal(tf.make_ndarray(ndarray_to_tensor_proto(array, dtype)), expected)
+
+
+def test_scalar_values_fill_the_shape():
+    tensor = tf.make_tensor_proto(7.0, types_pb2.DT_FLOAT, shape=[2, 3])
+    np.testing.assert_array_equal(tensor_proto_to_ndarray(tensor), np.full([2, 3], 7.0))
+
+
+def test_unsupported_dtype():
+    with pytest.raises(ValueError) as e:
+        numpy_dtype(types_pb2.DT_VARIANT)
+    assert 'DT_VARIANT' in str(e.value)
+
+
+def test_bfloat16_round_trip():
+    values = np.array([[1.0, -2.5], [0.15625, 3.1415926]], dtype=np.float32)
+    tensor = ndarray_to_tensor_proto(values, types_pb2.DT_BFLOAT16)
+    assert len(tensor.tensor_content) == 2 * values.size
+    expected = np.array([[1.0, -2.5], [0.15625, 3.140625]], dtype=np.float32)
+    np.testing.assert_array_equal(tensor_proto_to_ndarray(tensor), expected)
+    # Values lists, as written by make_tensor_proto, hold the bits in half_val.
+    tensor = tf.make_tensor_proto(values, types_pb2.DT_BFLOAT16)
+    np.testing.assert_array_equal(tensor_proto_to_ndarray(tensor), expected)
+
+
+def test_quantized_dtypes_use_their_integers():
+    tensor = ndarray_to_tensor_proto(np.array([1, -3]), types_pb2.DT_QINT8)
+    assert tensor.tensor_content == np.array([1, -3], dtype=np.int8).tobytes()
+    np.testing.assert_array_equal(tensor_proto_to_ndarray(tensor), [1, -3])
+    tensor = tensor_pb2.TensorProto(dtype=types_pb2.DT_QUINT8, int_val=[200, 7])
+    tensor.tensor_shape.dim.add().size = 2
+    assert tensor_proto_to_ndarray(tensor).tolist() == [200, 7]
+
+
+def test_decode_selected_outputs():
+    response = predict_pb2.PredictResponse()
+    for name, value in [('b', 2.0), ('a', 1.0), ('c', 3.0)]:
+        response.outputs[name].CopyFrom(ndarray_to_tensor_proto(np.array([value]), types_pb2.DT_DOUBLE))
+    assert [name for name, _ in decode_outputs(response)] == ['a', 'b', 'c']
+    assert [(name, array.tolist()) for name, array in decode_outputs(response, ['c', 'a'])] == [
+        ('a', [1.0]), ('c', [3.0])]
@@ -0,0 +1,63 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Imports of the TensorFlow protos without importing TensorFlow.
+
+The protos of `tensorflow.core` ship in the `tensorflow` package, so that
+importing any of them, directly or through `tensorflow_serving.apis`, runs
+`tensorflow/__init__.py` and loads all of TensorFlow, which takes a large
+part of the startup time and of the memory of the proxy. The proxy only
+needs the protos: `skip_tensorflow_init` registers an empty `tensorflow`
+package, whose submodules are still found in the installed one.
+
+TensorFlow itself can not be imported in the same process afterwards, so
+this is only done when running the proxy, not when importing its modules.
+"""
+
+import sys
+import types
+
+
+def _tensorflow_path():
+  try:
+    from importlib.util import find_spec
+  except ImportError:
+    import imp
+    try:
+      return imp.find_module('tensorflow')[1]
+    except ImportError:
+      return None
+  spec = find_spec('tensorflow')
+  if spec is None or not spec.submodule_search_locations:
+    return None
+  return list(spec.submodule_search_locations)[0]
+
+
+def skip_tensorflow_init():
+  """Lets the TensorFlow protos be imported without importing TensorFlow.
+
+  Returns:
+    Whether the empty package was registered, which is not the case when
+    TensorFlow is already imported or is not installed.
+  """
+  if 'tensorflow' in sys.modules:
+    return False
+  path = _tensorflow_path()
+  if path is None:
+    return False
+  package = types.ModuleType('tensorflow')
+  package.__path__ = [path]
+  package.__package__ = 'tensorflow'
+  sys.modules['tensorflow'] = package
+  return True
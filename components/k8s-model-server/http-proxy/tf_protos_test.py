@@ -0,0 +1,35 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import subprocess
+import sys
+
+import tf_protos
+
+
+def test_proxy_modules_do_not_import_tensorflow():
+    # Runs in another process, as TensorFlow is imported by the tests.
+    script = ('import sys, tf_protos\n'
+              'assert tf_protos.skip_tensorflow_init()\n'
+              'import server\n'
+              'print(sorted(m for m in sys.modules if m.startswith("tensorflow.python")))\n')
+    output = subprocess.check_output([sys.executable, '-c', script],
+                                     cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert output.strip() == b'[]'
+
+def test_tensorflow_already_imported():
+    import tensorflow
+    assert not tf_protos.skip_tensorflow_init()
+    assert sys.modules['tensorflow'] is tensorflow
@@ -0,0 +1,64 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bridges gRPC futures into futures that can be yielded by tornado."""
+
+import grpc
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+
+#### START code took from https://github.com/grpc/grpc/wiki/Integration-with-tornado-(python)
+
+def _fwrap(f, gf):
+  try:
+    f.set_result(gf.result())
+  except Exception as e:
+    f.set_exception(e)
+
+
+def fwrap(gf, ioloop=None):
+  '''
+  Wraps a GRPC result in a future that can be yielded by tornado
+      
+    Usage::
+      
+      @coroutine
+      def my_fn(param):
+        result = yield fwrap(stub.function_name.future(param, timeout))
+  '''
+  f = gen.Future()
+
+  if ioloop is None:
+    ioloop = IOLoop.current()
+
+  gf.add_done_callback(lambda _: ioloop.add_callback(_fwrap, f, gf))
+  return f
+
+#### END code took from https://github.com/grpc/grpc/wiki/Integration-with-tornado-(python)
+
+
+def rpc_status_code(error):
+  """Returns the grpc.StatusCode of a failed RPC, or None for other errors.
+
+  Works for both the errors of the GA API (grpc.RpcError) and the ones of the
+  beta API (face.AbortionError).
+  """
+  code = getattr(error, 'code', None)
+  if callable(code):
+    try:
+      code = code()
+    except Exception:
+      return None
+  return code if isinstance(code, grpc.StatusCode) else None
@@ -0,0 +1,175 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Warm-up of the proxy before it reports ready.
+
+The signatures of the configured models are fetched into the signature
+cache, every gRPC channel is connected by a GetModelMetadata call, and a
+synthetic predict request of one instance of zeros can be sent to every
+model, so that the first requests served do not pay for the metadata fetch,
+the channel connections or the lazy initializations of the model server and
+of the proxy.
+
+The signatures of a model are fetched again until they are available, as
+the model server may still be loading it. The proxy reports ready once every
+model is warm, or after a timeout, so that a misconfigured model does not
+keep it unready forever.
+"""
+
+from datetime import timedelta
+import logging
+import time
+
+import numpy as np
+from tensorflow.core.framework import types_pb2
+from tensorflow_serving.apis import get_model_metadata_pb2
+from tensorflow_serving.apis import predict_pb2
+from tornado import gen
+
+from signature_cache import get_signature
+from tensor_codec import column_dtype, decode_outputs, ndarray_to_tensor_proto
+from tornado_grpc import fwrap
+
+
+def parse_models(value):
+  """Parses models written as `model` or `model:version`, comma separated.
+
+  Returns:
+    A list of (model name, version name or None) pairs.
+
+  Raises:
+    ValueError: when a version is not a number.
+  """
+  models = []
+  for model in value.split(','):
+    model_name, _, version_name = model.strip().partition(':')
+    if not model_name:
+      continue
+    if version_name and not version_name.isdigit():
+      raise ValueError('Invalid warm-up model %s, expected model or model:version.' % model)
+    models.append((model_name, version_name or None))
+  return models
+
+
+def synthetic_request(signature_map, model_name, version_name=None):
+  """Builds a PredictRequest of one instance of zeros for the default signature."""
+  signature_name, signature = get_signature(signature_map)
+  request = predict_pb2.PredictRequest()
+  request.model_spec.name = model_name
+  request.model_spec.signature_name = signature_name
+  if version_name is not None:
+    request.model_spec.version.value = int(version_name)
+  for name, tensor_info in signature.inputs.items():
+    shape = tensor_info.tensor_shape
+    sizes = [1] if shape.unknown_rank else [max(d.size, 1) for d in shape.dim]
+    if tensor_info.dtype == types_pb2.DT_STRING:
+      array = np.full(sizes, b'', dtype=object)
+    else:
+      array = np.zeros(sizes, dtype=column_dtype(tensor_info))
+    request.inputs[name].CopyFrom(ndarray_to_tensor_proto(array, tensor_info.dtype))
+  return request
+
+
+class Warmer(object):
+  """Warms the signature cache, the channels and the models before serving.
+
+  Args:
+    stub: The BackendPool, or PredictionService stub, of the model server.
+    signature_cache: The SignatureCache of the proxy.
+    models: A list of (model name, version name or None) pairs to warm.
+    synthetic_requests: Whether to send a synthetic predict request to every model.
+    rpc_timeout: Seconds for the warm-up calls to time out.
+    retry_interval: Seconds between two fetches of unavailable signatures.
+    timeout: Seconds after which the proxy is ready even if models are not warm,
+             0 to wait until they are.
+
+    Usage::
+
+      warmer = Warmer(stub, signature_cache, [('mnist', None)])
+      IOLoop.current().spawn_callback(warmer.run)
+      ...
+      if warmer.ready:
+        ...
+  """
+
+  def __init__(self, stub, signature_cache, models, synthetic_requests=False, rpc_timeout=10.0,
+               retry_interval=1.0, timeout=300.0):
+    self.stub = stub
+    self.signature_cache = signature_cache
+    self.models = models
+    self.synthetic_requests = synthetic_requests
+    self.rpc_timeout = rpc_timeout
+    self.retry_interval = retry_interval
+    self.timeout = timeout
+    self.ready = not models
+    self.warm_models = []
+
+  @gen.coroutine
+  def run(self):
+    """Warms every model and channel, then sets `ready`."""
+    if not self.models:
+      return
+    start = time.time()
+    try:
+      if self.timeout > 0:
+        yield gen.with_timeout(timedelta(seconds=self.timeout), self._warm_all(),
+                               quiet_exceptions=(Exception,))
+      else:
+        yield self._warm_all()
+      logging.info("Warmed up %d models in %.1fs", len(self.models), time.time() - start)
+    except gen.TimeoutError:
+      cold = [model for model, _ in self.models if model not in self.warm_models]
+      logging.warn("Models %s are not warm after %.0fs, serving anyway", ', '.join(cold),
+                   self.timeout)
+    except Exception as e:
+      # A warm-up which can not complete must not keep the proxy unready.
+      logging.exception("Warm-up failed, serving anyway: %s", e)
+    self.ready = True
+
+  @gen.coroutine
+  def _warm_all(self):
+    yield [self._warm_model(model_name, version_name)
+           for model_name, version_name in self.models]
+    yield self._warm_channels(self.models[0])
+
+  @gen.coroutine
+  def _warm_model(self, model_name, version_name):
+    while True:
+      signature_map = yield self.signature_cache.get(model_name, version_name)
+      if signature_map is not None:
+        break
+      yield gen.sleep(self.retry_interval)
+    if self.synthetic_requests:
+      try:
+        request = synthetic_request(signature_map, model_name, version_name)
+        response = yield fwrap(self.stub.Predict.future(request, self.rpc_timeout))
+        decode_outputs(response)
+      except Exception as e:
+        logging.warn("Synthetic warm-up request to model %s failed: %s", model_name, e)
+    self.warm_models.append(model_name)
+
+  @gen.coroutine
+  def _warm_channels(self, model):
+    """Connects every channel to every backend with a GetModelMetadata call."""
+    request = get_model_metadata_pb2.GetModelMetadataRequest()
+    request.model_spec.name = model[0]
+    request.metadata_field.append("signature_def")
+    stubs = [stub for backend in getattr(self.stub, 'backends', []) for stub in backend.stubs]
+    calls = [fwrap(stub.GetModelMetadata.future(request, self.rpc_timeout))
+             for stub in stubs or [self.stub]]
+    for call in calls:
+      try:
+        yield call
+      except Exception as e:
+        logging.warn("Warm-up call to the model server failed: %s", e)
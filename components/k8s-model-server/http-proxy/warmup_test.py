@@ -0,0 +1,130 @@
+# Copyright 2018 The Kubeflow Authors All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import Future
+
+import pytest
+from tensorflow.core.framework import types_pb2
+from tensorflow_serving.apis import get_model_metadata_pb2
+from tornado import gen
+
+from server_test import doubling_signature_map, DoublingStub
+from tensor_codec import tensor_proto_to_ndarray
+from warmup import parse_models, synthetic_request, Warmer
+
+
+class FlakySignatureCache(object):
+    """Signature cache failing the first `failures` lookups."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.lookups = []
+
+    @gen.coroutine
+    def get(self, model_name, version=None):
+        self.lookups.append((model_name, version))
+        if len(self.lookups) <= self.failures:
+            raise gen.Return(None)
+        raise gen.Return(doubling_signature_map())
+
+
+class MetadataStub(DoublingStub):
+    """DoublingStub also answering GetModelMetadata calls."""
+
+    def __init__(self):
+        super(MetadataStub, self).__init__()
+        self.GetModelMetadata = MetadataMethod()
+
+
+class MetadataMethod(object):
+
+    def __init__(self):
+        self.calls = 0
+
+    def future(self, request, timeout):
+        self.calls += 1
+        f = Future()
+        f.set_result(get_model_metadata_pb2.GetModelMetadataResponse())
+        return f
+
+
+class FakeBackend(object):
+
+    def __init__(self, stubs):
+        self.stubs = stubs
+
+
+def test_parse_models():
+    assert parse_models('') == []
+    assert parse_models('a, b:2') == [('a', None), ('b', '2')]
+    with pytest.raises(ValueError):
+        parse_models('a:latest')
+
+def test_synthetic_request():
+    signature_map = doubling_signature_map()
+    signature_map['serving_default'].inputs['x'].tensor_shape.dim.add(size=-1)
+    signature_map['serving_default'].inputs['x'].tensor_shape.dim.add(size=3)
+    signature_map['serving_default'].inputs['s'].dtype = types_pb2.DT_STRING
+    request = synthetic_request(signature_map, 'double', '2')
+    assert request.model_spec.version.value == 2
+    assert request.model_spec.signature_name == 'serving_default'
+    assert tensor_proto_to_ndarray(request.inputs['x']).tolist() == [[0.0, 0.0, 0.0]]
+    assert request.inputs['s'].string_val == [b'']
+
+@pytest.mark.gen_test
+def test_warmer_retries_until_signatures_are_available():
+    stub = MetadataStub()
+    signature_cache = FlakySignatureCache(failures=2)
+    warmer = Warmer(stub, signature_cache, [('double', None)], synthetic_requests=True,
+                    retry_interval=0.001)
+    assert not warmer.ready
+    yield warmer.run()
+    assert warmer.ready
+    assert len(signature_cache.lookups) == 3
+    assert len(stub.requests) == 1
+    assert stub.GetModelMetadata.calls == 1
+
+@pytest.mark.gen_test
+def test_warmer_connects_every_channel():
+    stubs = [MetadataStub() for _ in range(4)]
+    pool = MetadataStub()
+    pool.backends = [FakeBackend(stubs[:2]), FakeBackend(stubs[2:])]
+    warmer = Warmer(pool, FlakySignatureCache(failures=0), [('double', None)])
+    yield warmer.run()
+    assert [stub.GetModelMetadata.calls for stub in stubs] == [1, 1, 1, 1]
+    assert len(pool.requests) == 0
+
+@pytest.mark.gen_test
+def test_warmer_timeout():
+    warmer = Warmer(MetadataStub(), FlakySignatureCache(failures=1000), [('double', None)],
+                    retry_interval=0.001, timeout=0.05)
+    yield warmer.run()
+    assert warmer.ready
+    assert warmer.warm_models == []
+
+def test_no_models_is_ready():
+    assert Warmer(MetadataStub(), FlakySignatureCache(failures=0), []).ready
+
+class FailingSignatureCache(object):
+
+    @gen.coroutine
+    def get(self, model_name, version=None):
+        raise ValueError('unsupported signature')
+
+@pytest.mark.gen_test
+def test_warmer_errors_do_not_keep_it_unready():
+    warmer = Warmer(MetadataStub(), FailingSignatureCache(), [('double', None)], timeout=1)
+    yield warmer.run()
+    assert warmer.ready
+    assert warmer.warm_models == []